@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+DB層の同時実行ベンチマーク（同期Session vs AsyncSession）
+
+月報の一覧取得と作成を同時に流し、エンドポイントごとのp50/p95/p99レイテンシを比較する。
+DBに触れない ping も混ぜ、DB処理がイベントループを止めているかどうかを確認する。
+- before: 従来の同期 get_db を async def ハンドラから呼ぶ構成（イベントループをブロック）
+- after : get_async_db（aiosqlite）を使う現行の reports_no_auth ルーター
+
+注意: before 構成は同時実行数がコネクションプール上限（5 + overflow 10）を超えると、
+プール待ちでイベントループ自体が止まり、接続を返却する後処理も進めなくなって停止する。
+そのため既定の同時実行数はプール上限未満にしている。
+
+使い方:
+    cd backend
+    python benchmarks/bench_db_concurrency.py --requests 400 --concurrency 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ベンチマーク専用の一時DBを使う（database のインポート前に設定する必要がある）
+_tmp_dir = tempfile.mkdtemp(prefix="bench_db_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/bench.db"
+
+import httpx
+from fastapi import FastAPI, APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from database import get_db, create_tables, async_engine, MonthlyReport
+from schemas import MonthlyReportCreate, MonthlyReportSummary
+from routers import reports_no_auth
+
+REPORT_BODY = "今月は営業と案件対応を並行して進めた。" * 100
+
+
+def build_sync_app() -> FastAPI:
+    """変更前の構成（async def + 同期Session）を再現したアプリ"""
+    router = APIRouter()
+
+    @router.get("/")
+    async def list_reports(page: int = 1, size: int = 10, db: Session = Depends(get_db)):
+        query = db.query(MonthlyReport).filter(MonthlyReport.user_id == reports_no_auth.DEMO_USER_ID)
+        total = query.count()
+        reports = query.order_by(MonthlyReport.created_at.desc()).offset((page - 1) * size).limit(size).all()
+        return {
+            "items": [MonthlyReportSummary.model_validate(r) for r in reports],
+            "total": total
+        }
+
+    @router.post("/", status_code=201)
+    async def create_report(report_data: MonthlyReportCreate, db: Session = Depends(get_db)):
+        new_report = MonthlyReport(user_id=reports_no_auth.DEMO_USER_ID, **report_data.model_dump())
+        db.add(new_report)
+        db.commit()
+        db.refresh(new_report)
+        return {"id": new_report.id}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/reports")
+    app.add_api_route("/ping", ping)
+    return app
+
+
+def build_async_app() -> FastAPI:
+    """変更後の構成（現行ルーター）"""
+    app = FastAPI()
+    app.include_router(reports_no_auth.router, prefix="/api/reports")
+    app.add_api_route("/ping", ping)
+    return app
+
+
+async def ping():
+    """DBに触れないエンドポイント（イベントループの詰まりを測る）"""
+    return {"status": "ok"}
+
+
+def percentile(values, pct):
+    """最近傍法でパーセンタイルを求める"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_load(app: FastAPI, total_requests: int, concurrency: int, write_ratio: float):
+    """一覧取得・作成・pingを混ぜて同時実行し、種類ごとのレイテンシ(ms)を返す"""
+    latencies = {"list": [], "create": [], "ping": []}
+    semaphore = asyncio.Semaphore(concurrency)
+    payload = {"report_month": "2025-06", "good_points": REPORT_BODY}
+    write_every = max(1, int(round(1 / write_ratio))) if write_ratio > 0 else 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            if write_every and i % write_every == 0:
+                kind = "create"
+            elif i % 4 == 1:
+                kind = "ping"
+            else:
+                kind = "list"
+            if kind == "ping":
+                # ping は同時実行数の制限を受けない別クライアントとして扱う
+                await asyncio.sleep(0.001 * i)
+                start = time.perf_counter()
+                response = await client.get("/ping")
+                elapsed = (time.perf_counter() - start) * 1000
+            else:
+                async with semaphore:
+                    start = time.perf_counter()
+                    if kind == "create":
+                        response = await client.post("/api/reports/", json=payload)
+                    else:
+                        response = await client.get("/api/reports/", params={"page": 2, "size": 10})
+                    elapsed = (time.perf_counter() - start) * 1000
+            response.raise_for_status()
+            latencies[kind].append(elapsed)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        wall = time.perf_counter() - started
+
+    return latencies, wall
+
+
+def print_report(label: str, latencies, wall: float):
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n[{label}] {total}件 / {wall:.2f}秒 ({total / wall:.1f} req/s)")
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        print(
+            f"  {kind:<6} n={len(values):<4} "
+            f"p50={percentile(values, 50):7.2f}ms "
+            f"p95={percentile(values, 95):7.2f}ms "
+            f"p99={percentile(values, 99):7.2f}ms "
+            f"mean={statistics.mean(values):7.2f}ms"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="同期/非同期DB層のレイテンシ比較")
+    parser.add_argument("--requests", type=int, default=400, help="モードごとの総リクエスト数")
+    parser.add_argument("--concurrency", type=int, default=12, help="同時実行数")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="作成リクエストの割合")
+    parser.add_argument("--seed-rows", type=int, default=500, help="事前投入する月報数")
+    args = parser.parse_args()
+
+    create_tables()
+    seed_app = build_async_app()
+    transport = httpx.ASGITransport(app=seed_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(args.seed_rows):
+            await client.post("/api/reports/", json={"report_month": "2025-05", "good_points": REPORT_BODY})
+
+    for label, app in (("before: sync Session", build_sync_app()), ("after: AsyncSession", build_async_app())):
+        latencies, wall = await run_load(app, args.requests, args.concurrency, args.write_ratio)
+        print_report(label, latencies, wall)
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+バックエンドのホットパスのマイクロベンチマーク（ベースライン比較つき）
+
+純粋なPython処理のCPUコストを計測し、benchmarks/baselines/hot_paths.json の値と比べて
+しきい値を超えて遅くなったケースがあれば終了コード1を返す。
+
+計測対象:
+- extract_number_from_text（サンプル文字列一式）
+- get_report_month（月初・月中・年初の日付一式）
+- generate_fallback_report（回答一式からのフォールバック月報の生成）
+- ai_assistant.parse_ai_response / format_report_data
+- MonthlyReportResponse.model_validate（ORMの行1,000件）
+- 月報一覧のサマリー変換とJSONシリアライズ（1,000件）
+
+マシンの速さの違いを均すため、固定の純Python処理（calibration）の時間との比で比較する。
+calibration はケースの合間にも計測し、各ケースと同じく最小値を使う（一時的な揺らぎで補正がぶれないように）。
+100µs未満のケースはタイマーや割り込みの影響を受けやすいため、しきい値を広げて判定する（--small-threshold）。
+ベースラインは計測するマシンで --update-baseline を付けて作り直すのが確実。
+
+使い方:
+    cd backend
+    python benchmarks/bench_hot_paths.py                     # ベースラインと比較
+    python benchmarks/bench_hot_paths.py --update-baseline   # ベースラインを更新
+    python benchmarks/bench_hot_paths.py --only fallback --threshold 0.5
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder
+
+from database import MonthlyReport
+from schemas import MonthlyReportResponse
+from utils.number_extraction import extract_number_from_text
+from utils.date_utils import get_report_month
+from routers.ai_assistant import parse_ai_response, format_report_data
+from routers.conversation_no_auth_detailed import generate_fallback_report
+from routers.reports_no_auth import _to_summary, DEMO_USER_ID
+from bench_number_extraction import SAMPLES
+from bench_report_rendering import ANSWERS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "hot_paths.json")
+
+ROWS = 1000
+
+# これより短いケースは --small-threshold で判定する（µs）
+SMALL_CASE_US = 100.0
+
+DATES = [datetime(2025, 1, 3), datetime(2025, 1, 15), datetime(2025, 6, 14), datetime(2025, 6, 30), datetime(2025, 12, 1)]
+
+AI_RESPONSE = """今月の振り返りを踏まえた提案です。
+
+1. 見積もりの前提条件を箇条書きにしてから提示する
+2. 営業メールのテンプレートを業種別に3種類用意する
+- 午前中の2時間を集中作業の時間として確保する
+• 週1回、稼働時間と売上の見込みを確認する
+3. 学習時間を毎週金曜の午後にまとめる
+補足: 無理のない範囲で進めてください。
+"""
+
+REPORT_DATA = {
+    "report_month": "2025-06",
+    "total_work_hours": 170.5,
+    "coding_hours": 120.0,
+    "meeting_hours": 20.5,
+    "sales_hours": 30.0,
+    "sales_emails_sent": 45,
+    "sales_replies": 6,
+    "sales_meetings": 2,
+    "received_amount": 420000.0,
+    "good_points": "継続依頼をいただけた",
+    "challenges": "見積もりが甘かった",
+    "next_month_goals": "稼働を150時間にする",
+}
+
+
+def build_orm_rows(count: int):
+    """DBに保存しないORMの月報（全列を設定済み）"""
+    base = datetime(2024, 1, 1)
+    return [
+        MonthlyReport(
+            id=i + 1,
+            user_id=DEMO_USER_ID,
+            report_month=f"{2024 + i // 12 % 2}-{i % 12 + 1:02d}",
+            current_phase="独立2年目",
+            family_status="共働き・子ども1人",
+            total_work_hours=170.0,
+            coding_hours=120.0,
+            meeting_hours=20.0,
+            sales_hours=30.0,
+            sales_emails_sent=45,
+            sales_replies=6,
+            sales_meetings=2,
+            contracts_signed=1,
+            received_amount=420000.0,
+            delivered_amount=420000.0,
+            good_points="## 💼 今月の業務内容\n- LP制作案件を納品した。\n" * 40,
+            challenges="見積もりが甘かった",
+            improvements="チェックリストを使う",
+            next_month_goals="稼働を150時間にする",
+            created_at=base + timedelta(hours=i),
+            updated_at=base + timedelta(hours=i)
+        )
+        for i in range(count)
+    ]
+
+
+def build_summary_rows(count: int):
+    """一覧取得（SUMMARY_COLUMNS）の結果行に相当するオブジェクト"""
+    base = datetime(2024, 1, 1)
+    return [
+        SimpleNamespace(
+            id=i + 1,
+            user_id=DEMO_USER_ID,
+            report_month=f"{2024 + i // 12 % 2}-{i % 12 + 1:02d}",
+            total_work_hours=170.0,
+            received_amount=420000.0,
+            created_at=base + timedelta(hours=i),
+            updated_at=base + timedelta(hours=i)
+        )
+        for i in range(count)
+    ]
+
+
+def serialize_summaries(rows) -> bytes:
+    """一覧エンドポイントと同じ変換（サマリーモデル → jsonable_encoder → JSONResponse 相当のJSON）"""
+    content = jsonable_encoder([_to_summary(row) for row in rows])
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def calibration():
+    """マシンの速さの目安にする固定の純Python処理"""
+    total = 0
+    for i in range(20000):
+        total += len(str(i)) * (i % 7)
+    return total
+
+
+def run_coroutine(coro):
+    """
+    待機の発生しないコルーチンをイベントループなしで最後まで実行する
+
+    run_until_complete のループ1周分（数十µs）の処理とその揺らぎを計測に含めないため
+    """
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("コルーチンが待機しました（イベントループで実行してください）")
+
+
+def build_cases():
+    """(名前, 1回分の処理, 1回あたりの件数)"""
+    orm_rows = build_orm_rows(ROWS)
+    summary_rows = build_summary_rows(ROWS)
+
+    def fallback():
+        return run_coroutine(generate_fallback_report(ANSWERS))
+
+    return [
+        ("extract_number_from_text", lambda: [extract_number_from_text(text) for text in SAMPLES], len(SAMPLES)),
+        ("get_report_month", lambda: [get_report_month(date) for date in DATES], len(DATES)),
+        ("generate_fallback_report", fallback, 1),
+        ("parse_ai_response", lambda: parse_ai_response(AI_RESPONSE), 1),
+        ("format_report_data", lambda: format_report_data(REPORT_DATA), 1),
+        ("model_validate_1k_rows", lambda: [MonthlyReportResponse.model_validate(row) for row in orm_rows], ROWS),
+        ("summary_serialization_1k", lambda: serialize_summaries(summary_rows), ROWS),
+    ]
+
+
+def measure(func, min_seconds: float, repeat: int) -> float:
+    """1回あたりの時間(µs)。回数を自動で決め、repeat回計測した最小値を使う"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds / repeat:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1_000_000
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return None
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ホットパスのマイクロベンチマーク")
+    parser.add_argument("--threshold", type=float, default=0.3, help="許容する悪化の割合（0.3 = 30%%遅くなるまで許容）")
+    parser.add_argument("--small-threshold", type=float, default=0.5, help=f"{SMALL_CASE_US:.0f}µs未満のケースで許容する悪化の割合")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="ケースごとの計測時間の目安（秒）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数（最小値を使う）")
+    parser.add_argument("--only", default=None, help="名前にこの文字列を含むケースのみ計測")
+    parser.add_argument("--update-baseline", action="store_true", help="計測結果でベースラインを更新")
+    parser.add_argument("--no-normalize", action="store_true", help="calibration で正規化せず絶対時間で比較")
+    parser.add_argument("--recheck", type=int, default=2, help="悪化と判定したケースを計測し直す回数（一時的な揺らぎを除く）")
+    args = parser.parse_args()
+
+    baseline = load_baseline()
+    baseline_cases = (baseline or {}).get("cases", {})
+
+    calibration_runs = []
+
+    def measure_calibration() -> float:
+        """calibration を計測し、これまでの計測の最小値を返す"""
+        calibration_runs.append(measure(calibration, args.min_seconds / 2, args.repeat))
+        return min(calibration_runs)
+
+    results = {}
+    functions = {}
+    print(f"[計測] Python {platform.python_version()} / {platform.machine()}")
+    calibration()  # ウォームアップ
+    for name, func, items in build_cases():
+        if args.only and args.only not in name:
+            continue
+        measure_calibration()
+        func()  # ウォームアップ
+        per_call = measure(func, args.min_seconds, args.repeat)
+        results[name] = {"us_per_call": round(per_call, 3), "items_per_call": items}
+        functions[name] = func
+        print(f"  {name:<28} {per_call:12.2f}µs/回  ({per_call / items:9.3f}µs/件)")
+    calibration_us = measure_calibration()
+    results["calibration"] = {"us_per_call": round(calibration_us, 3), "items_per_call": 1}
+    print(f"  {'calibration':<28} {calibration_us:12.2f}µs/回  ({len(calibration_runs)}回の計測の最小値)")
+
+    if args.update_baseline:
+        cases = dict(baseline_cases)
+        cases.update(results)
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cases": cases
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\nベースラインを更新しました: {BASELINE_PATH}")
+        return
+
+    if not baseline_cases:
+        print("\nベースラインがありません（--update-baseline で作成してください）")
+        return
+
+    # calibration の比でマシンの速さの違いを補正する
+    normalize = not args.no_normalize and "calibration" in baseline_cases
+
+    def machine_scale() -> float:
+        if not normalize:
+            return 1.0
+        return min(calibration_runs) / baseline_cases["calibration"]["us_per_call"]
+
+    print(
+        f"\n[ベースラインとの比較] しきい値 +{args.threshold:.0%}"
+        f"（{SMALL_CASE_US:.0f}µs未満は +{args.small_threshold:.0%}）  マシン補正 x{machine_scale():.2f}"
+    )
+
+    regressions = []
+    for name, result in results.items():
+        if name == "calibration" or name not in baseline_cases:
+            continue
+        baseline_us = baseline_cases[name]["us_per_call"]
+        threshold = args.threshold if baseline_us >= SMALL_CASE_US else max(args.threshold, args.small_threshold)
+        expected = baseline_us * machine_scale()
+        change = result["us_per_call"] / expected - 1
+        for _ in range(args.recheck):
+            if change <= threshold:
+                break
+            # ケースと calibration を計測し直して最小値を採る（他のプロセスの影響などによる一時的な揺らぎを除く）
+            result["us_per_call"] = round(min(result["us_per_call"], measure(functions[name], args.min_seconds, args.repeat)), 3)
+            measure_calibration()
+            expected = baseline_us * machine_scale()
+            change = result["us_per_call"] / expected - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"  [{'悪化' if regressed else 'OK'}] {name:<28} {expected:12.2f} → {result['us_per_call']:12.2f}µs ({change:+.1%})")
+
+    if regressions:
+        print(f"\n性能が悪化しています: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nすべてしきい値内です")
+
+
+if __name__ == "__main__":
+    main()
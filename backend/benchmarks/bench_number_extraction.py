@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+日本語数値抽出のベンチマーク
+
+変更前の extract_number_from_text（呼び出しごとに正規表現を組み立て、単位ごとに再走査する実装）と
+utils.number_extraction の共通実装について
+- サンプル文字列での抽出結果が一致するか
+- 1回あたりの抽出時間
+- 対話1件分の回答（稼働時間・収入・営業件数）をまとめて抽出する時間
+を比較する。
+
+使い方:
+    cd backend
+    python benchmarks/bench_number_extraction.py --iterations 20000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.number_extraction import extract_number_from_text, extract_answer_numbers
+
+SAMPLES = [
+    "160時間ぐらいすね",
+    "およそ200万円です",
+    "今月は１８０時間くらい",
+    "3.5万円の案件が2件",
+    "5千円",
+    "時給は千五百円くらい",
+    "数字はわかりません",
+    "30万円と12万円と合計42万円です",
+    "メール40件、返信3件、面談1件",
+    "",
+]
+
+ANSWERS = {
+    "work_hours": {"answer": "だいたい170時間くらいです"},
+    "monthly_income": {"answer": "A社から30万円、B社から12万円、合計42万円です"},
+    "sales_activities": {"answer": "営業メールを45件送って、返信が6件、面談が2件でした"},
+}
+
+
+def legacy_extract_number_from_text(text, default=0):
+    """変更前の実装（比較用にそのまま残したもの）"""
+    if not text or not isinstance(text, str):
+        return default
+
+    text = text.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
+
+    patterns = [
+        (r'(\d+(?:\.\d+)?)\s*万', 10000),
+        (r'(\d+(?:\.\d+)?)\s*千', 1000),
+        (r'(\d+(?:\.\d+)?)\s*百', 100),
+    ]
+    for pattern, multiplier in patterns:
+        match = re.search(pattern, text)
+        if match:
+            result = float(match.group(1)) * multiplier
+            return int(result) if result == int(result) else result
+
+    match = re.search(r'(\d+(?:\.\d+)?)', text)
+    if match:
+        number_str = match.group(1)
+        return float(number_str) if '.' in number_str else int(number_str)
+
+    return default
+
+
+def legacy_extract_answer_numbers(answers):
+    """変更前の generate_report 内の抽出処理"""
+    work_hours_text = answers.get("work_hours", {}).get("answer", "")
+    total_hours = legacy_extract_number_from_text(work_hours_text, default=160.0)
+
+    income_text = answers.get("monthly_income", {}).get("answer", "")
+    received_amount = 0.0
+    if "合計" in income_text:
+        total_match = re.search(r'合計\s*(\d+(?:\.\d+)?)\s*万円', income_text)
+        if total_match:
+            received_amount = float(total_match.group(1)) * 10000
+    else:
+        first_match = re.search(r'(\d+(?:\.\d+)?)\s*万円', income_text)
+        if first_match:
+            received_amount = float(first_match.group(1)) * 10000
+
+    sales_text = answers.get("sales_activities", {}).get("answer", "")
+    sales_nums = re.findall(r'\d+', sales_text)
+    return {
+        "total_work_hours": total_hours,
+        "received_amount": received_amount,
+        "sales_emails_sent": int(sales_nums[0]) if len(sales_nums) > 0 else 40,
+        "sales_replies": int(sales_nums[1]) if len(sales_nums) > 1 else 0,
+        "sales_meetings": int(sales_nums[2]) if len(sales_nums) > 2 else 0,
+    }
+
+
+def check_outputs():
+    """抽出結果が変更前と一致するか確認"""
+    mismatches = 0
+    for text in SAMPLES:
+        before = legacy_extract_number_from_text(text)
+        after = extract_number_from_text(text)
+        mark = "OK" if before == after else "差異"
+        if before != after:
+            mismatches += 1
+        print(f"  [{mark}] {text!r:<36} before={before!r:<10} after={after!r}")
+
+    before = legacy_extract_answer_numbers(ANSWERS)
+    after = extract_answer_numbers(ANSWERS)
+    if before != after:
+        mismatches += 1
+    print(f"  [{'OK' if before == after else '差異'}] 回答一式 {after}")
+    return mismatches
+
+
+def timeit(func, iterations: int) -> float:
+    """1回あたりの平均時間(µs)"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日本語数値抽出のベンチマーク")
+    parser.add_argument("--iterations", type=int, default=20000, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    print("[抽出結果の比較]")
+    mismatches = check_outputs()
+
+    print(f"\n[計測: {args.iterations:,}回]")
+    cases = [
+        ("単発 (サンプル全件)",
+         lambda: [legacy_extract_number_from_text(t) for t in SAMPLES],
+         lambda: [extract_number_from_text(t) for t in SAMPLES]),
+        ("回答一式",
+         lambda: legacy_extract_answer_numbers(ANSWERS),
+         lambda: extract_answer_numbers(ANSWERS)),
+    ]
+    for label, before, after in cases:
+        before_us = timeit(before, args.iterations)
+        after_us = timeit(after, args.iterations)
+        print(f"  {label:<20} before={before_us:8.2f}µs  after={after_us:8.2f}µs  ({before_us / after_us:.2f}x)")
+
+    if mismatches:
+        print(f"\n注意: {mismatches}件の差異があります（カンマ区切りの数値など、意図した変更か確認してください）")
+
+
+if __name__ == "__main__":
+    main()
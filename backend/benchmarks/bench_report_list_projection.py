@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+月報一覧の列プロジェクション計測
+
+10,000件の月報（good_points にAI生成相当の約2,500文字）を投入し、1ページ分の取得について
+- 全列を読み込むエンティティ取得（変更前の db.query(MonthlyReport) 相当）
+- 一覧用の列だけを読み込むプロジェクション取得（現行の SUMMARY_COLUMNS）
+の読み込みバイト数・クエリ時間・シリアライズ時間を比較する。
+
+使い方:
+    cd backend
+    python benchmarks/bench_report_list_projection.py --rows 10000 --size 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ベンチマーク専用の一時DBを使う（database のインポート前に設定する必要がある）
+_tmp_dir = tempfile.mkdtemp(prefix="bench_projection_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/bench.db"
+
+from sqlalchemy import select, insert
+from sqlalchemy.orm import undefer_group
+
+from database import (
+    engine, async_engine, AsyncSessionLocal, create_tables, MonthlyReport, REPORT_TEXT_GROUP
+)
+from routers.reports_no_auth import SUMMARY_COLUMNS, DEMO_USER_ID, _to_summary
+
+AI_REPORT = ("## 💼 今月の業務内容・取り組み・学び\n- LP制作案件を納品し、営業活動も継続した。\n" * 50)[:2500]
+
+
+def seed(rows: int):
+    """計測用の月報をまとめて投入"""
+    create_tables()
+    base = datetime(2024, 1, 1)
+    values = [
+        {
+            "user_id": DEMO_USER_ID,
+            "report_month": f"{2024 + i // 12000}-{(i // 1000) % 12 + 1:02d}",
+            "total_work_hours": 160.0,
+            "received_amount": 300000.0,
+            "good_points": AI_REPORT,
+            "challenges": "営業の時間配分が課題。",
+            "improvements": "",
+            "next_month_goals": "営業100件送信。",
+            "created_at": base + timedelta(minutes=i),
+            "updated_at": base + timedelta(minutes=i),
+        }
+        for i in range(rows)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(MonthlyReport), values)
+
+
+def row_bytes(values) -> int:
+    """取得した値のおおよそのバイト数（文字列はUTF-8長、それ以外は8バイト）"""
+    total = 0
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, str):
+            total += len(value.encode("utf-8"))
+        else:
+            total += 8
+    return total
+
+
+async def measure(label: str, statement, to_values, size: int, offset: int, iterations: int):
+    query_seconds = 0.0
+    serialize_seconds = 0.0
+    bytes_read = 0
+
+    for _ in range(iterations):
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            result = await db.execute(
+                statement.where(MonthlyReport.user_id == DEMO_USER_ID)
+                .order_by(MonthlyReport.created_at.desc()).offset(offset).limit(size)
+            )
+            rows = result.all()
+            query_seconds += time.perf_counter() - start
+
+            bytes_read = sum(row_bytes(to_values(row)) for row in rows)
+
+            start = time.perf_counter()
+            summaries = [_to_summary(row[0] if len(row) == 1 else row) for row in rows]
+            json.dumps([summary.model_dump(mode="json") for summary in summaries], ensure_ascii=False)
+            serialize_seconds += time.perf_counter() - start
+
+    print(
+        f"  {label:<12} bytes/page={bytes_read:>9,}  "
+        f"query={query_seconds / iterations * 1000:7.3f}ms  "
+        f"serialize={serialize_seconds / iterations * 1000:7.3f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="月報一覧の列プロジェクション計測")
+    parser.add_argument("--rows", type=int, default=10000, help="投入する月報数")
+    parser.add_argument("--size", type=int, default=10, help="1ページの件数")
+    parser.add_argument("--iterations", type=int, default=200, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    seed(args.rows)
+    column_keys = [attr.key for attr in MonthlyReport.__mapper__.column_attrs]
+
+    for offset in (0, args.rows // 2):
+        print(f"\n[{args.rows:,}件中 offset={offset:,} size={args.size}]")
+        await measure(
+            "full entity",
+            select(MonthlyReport).options(undefer_group(REPORT_TEXT_GROUP)),
+            lambda row: [getattr(row[0], key) for key in column_keys],
+            args.size, offset, args.iterations
+        )
+        await measure(
+            "projection",
+            select(*SUMMARY_COLUMNS),
+            lambda row: list(row),
+            args.size, offset, args.iterations
+        )
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
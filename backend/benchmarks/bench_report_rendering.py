@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+月報テンプレート描画のベンチマーク
+
+utils.report_renderer のコンパイル済みテンプレートについて、1コア（1スレッド）あたりの
+- フォールバック月報の描画（テンプレートのみ）
+- generate_fallback_report（数値抽出を含むフォールバック月報の生成）
+- 従来版のフォールバック月報の描画
+- AI生成プロンプトの作成（トークン予算の計算を含む）
+の件数/秒を計測し、フォールバック月報が目標件数/秒を下回れば終了コード1を返す。
+
+使い方:
+    cd backend
+    python benchmarks/bench_report_rendering.py --iterations 20000 --target 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.report_renderer import (
+    report_renderer, answer_texts, FALLBACK_REPORT_TEMPLATE, TRADITIONAL_REPORT_TEMPLATE
+)
+from routers.conversation_no_auth_detailed import generate_fallback_report, build_report_prompt
+
+ANSWERS = {
+    "ideal_lifestyle": {"answer": "家族との時間を大切にしながら、週4日の稼働で安定した収入を得たい"},
+    "core_values": {"answer": "無理をしないこと、約束を守ること"},
+    "ideal_daily_life": {"answer": "午前中に集中して作業し、午後は学習と家族の時間にする"},
+    "monthly_goals": {"answer": "新規案件を1件獲得し、稼働時間を160時間以内に抑える"},
+    "goal_achievement": {"answer": "新規案件は獲得できたが、稼働時間は少し超えた"},
+    "monthly_activities": {"answer": "既存顧客のサイト改修とLP制作、ブログ記事の執筆"},
+    "project_details": {"answer": "LP制作で初めてA/Bテストの設計から担当した"},
+    "sales_activities": {"answer": "営業メールを45件送って、返信が6件、面談が2件でした"},
+    "learning_highlights": {"answer": "TypeScriptの型設計を学び直した"},
+    "work_hours": {"answer": "だいたい170時間くらいです"},
+    "monthly_income": {"answer": "A社から30万円、B社から12万円、合計42万円です"},
+    "life_changes": {"answer": "子どもの夏休みで日中の作業時間が減った"},
+    "life_balance": {"answer": "夜の作業が増えたので来月は見直したい"},
+    "roles_responsibilities": {"answer": "家事の分担を見直した"},
+    "challenges": {"answer": "見積もりが甘く、修正対応に時間がかかった"},
+    "discoveries": {"answer": "要件確認のチェックリストを作ると手戻りが減る"},
+    "growth_points": {"answer": "提案から納品まで一人で回せるようになった"},
+    "happy_moments": {"answer": "お客様から継続依頼をいただけた"},
+    "next_month_goals": {"answer": "見積もりテンプレートを整備し、稼働を150時間にする"},
+    "things_to_stop": {"answer": "深夜の作業"},
+}
+
+NUMBERS = {"total_hours": 170, "received_amount": 420000.0, "sales_emails": 45}
+
+
+def throughput(func, iterations: int) -> float:
+    """1秒あたりの件数"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - start)
+
+
+def async_throughput(func, iterations: int) -> float:
+    """コルーチン関数を1つのイベントループ上で繰り返したときの1秒あたりの件数"""
+    async def run():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await func()
+        return iterations / (time.perf_counter() - start)
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="月報テンプレート描画のベンチマーク")
+    parser.add_argument("--iterations", type=int, default=20000, help="計測の繰り返し回数")
+    parser.add_argument("--target", type=float, default=10000, help="フォールバック月報の目標件数/秒（1コア）")
+    args = parser.parse_args()
+
+    cases = [
+        ("フォールバック（描画のみ）", lambda: throughput(
+            lambda: report_renderer.render(
+                FALLBACK_REPORT_TEMPLATE, year_month="2025年6月", answer=answer_texts(ANSWERS), **NUMBERS
+            ), args.iterations)),
+        ("フォールバック（生成）", lambda: async_throughput(
+            lambda: generate_fallback_report(ANSWERS), args.iterations)),
+        ("従来版フォールバック", lambda: throughput(
+            lambda: report_renderer.render(
+                TRADITIONAL_REPORT_TEMPLATE, year_month="2025年06月", answer=answer_texts(ANSWERS), **NUMBERS
+            ), args.iterations)),
+        ("AI生成プロンプト", lambda: throughput(
+            lambda: build_report_prompt(ANSWERS, "2025年6月"), max(1, args.iterations // 10))),
+    ]
+
+    print(f"[計測: {args.iterations:,}回, 目標 {args.target:,.0f}件/秒]")
+    results = {}
+    for label, measure in cases:
+        results[label] = measure()
+        print(f"  {label:<24} {results[label]:12,.0f}件/秒  ({1_000_000 / results[label]:8.2f}µs/件)")
+
+    fallback_rate = results["フォールバック（生成）"]
+    if fallback_rate < args.target:
+        print(f"\n目標未達: フォールバック月報の生成が {fallback_rate:,.0f}件/秒 です（目標 {args.target:,.0f}件/秒）")
+        sys.exit(1)
+    print("\n目標を達成しています")
+
+
+if __name__ == "__main__":
+    main()
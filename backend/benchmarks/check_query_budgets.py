@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+エンドポイントごとのSQLクエリ数のチェック
+
+一時的なDBに対して主なエンドポイントを順に呼び出し、リクエストごとのSQL文の数
+（X-Query-Count）と、@query_budget で宣言した上限を一覧にする。
+QUERY_COUNTER_MODE=strict で動かすため、上限を超えたリクエストは失敗し、終了コード1を返す。
+同じSQL文の繰り返し（N+1など）はサーバー側の警告として表示する（--fail-on-repeat で失敗扱い）。
+
+使い方:
+    cd backend
+    python benchmarks/check_query_budgets.py
+    python benchmarks/check_query_budgets.py --fail-on-repeat
+    SESSION_STORE_BACKEND=sqlite python benchmarks/check_query_budgets.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# アプリの読み込み前に設定する（一時的なDB・strict モード・AI生成なし）
+_work_dir = tempfile.mkdtemp(prefix="query-budgets-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_work_dir}/check.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["QUERY_COUNTER_MODE"] = "strict"
+os.environ["OPENAI_API_KEY"] = ""
+os.environ.setdefault("SESSION_STORE_BACKEND", "memory")
+
+from fastapi.testclient import TestClient
+
+import main
+from utils.metrics import route_template
+from utils.query_counter import query_counter
+
+REPORT = {"report_month": "2025-06", "total_work_hours": 160, "good_points": "LP制作を納品した"}
+ANSWER = "合計30万円、160時間くらい。営業メールを20件送って返信が3件、面談が1件でした"
+
+
+def endpoint_budget(method: str, route: str):
+    for app_route in main.app.routes:
+        if getattr(app_route, "path", None) == route and method in getattr(app_route, "methods", ()):
+            return getattr(app_route.endpoint, "query_budget", None)
+    return None
+
+
+def run_checks(client: TestClient):
+    results = []
+
+    def call(method: str, path: str, **kwargs):
+        warnings_before = query_counter.repeated_warnings
+        response = client.request(method, path, **kwargs)
+        scope = {"type": "http", "method": method, "path": path.split("?")[0], "root_path": "", "app": main.app}
+        route = route_template(scope)
+        results.append({
+            "request": f"{method} {path}",
+            "route": route,
+            "status": response.status_code,
+            "queries": int(response.headers.get("x-query-count", "0")),
+            "budget": endpoint_budget(method, route),
+            "repeated": query_counter.repeated_warnings - warnings_before,
+            "detail": response.text[:200] if response.status_code >= 500 else ""
+        })
+        return response
+
+    for _ in range(3):
+        call("POST", "/api/reports/", json=REPORT)
+    report_id = call("POST", "/api/reports/", json=REPORT).json()["id"]
+    call("GET", "/api/reports/")
+    call("GET", "/api/reports/?page=2&size=2")
+    call("GET", "/api/reports/?cursor=&size=2")
+    call("GET", "/api/reports/?cursor=&size=2&include_total=true")
+    call("GET", f"/api/reports/{report_id}")
+    call("PUT", f"/api/reports/{report_id}", json={"challenges": "見積もりの精度"})
+    call("GET", f"/api/reports/{report_id}/pdf")
+    call("DELETE", f"/api/reports/{report_id}")
+
+    for path in ("/api/conversation/generate-report", "/api/conversation/generate-report/stream"):
+        session = call("POST", "/api/conversation/start", json={"report_month": "2025-06"}).json()
+        session_id = session["session_id"]
+        while not session.get("is_complete"):
+            session = call("POST", "/api/conversation/answer", json={
+                "session_id": session_id, "answer": ANSWER, "session_data": {}
+            }).json()
+        call("GET", f"/api/conversation/session/{session_id}")
+        call("POST", path, json={"session_id": session_id})
+    call("POST", "/api/test/generate-test-report")
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="エンドポイントごとのSQLクエリ数のチェック")
+    parser.add_argument("--fail-on-repeat", action="store_true", help="同じSQL文の繰り返しも失敗として扱う")
+    args = parser.parse_args()
+
+    with TestClient(main.app, raise_server_exceptions=False) as client:
+        results = run_checks(client)
+
+    # 同じルートは最大のクエリ数で表示する
+    # （ストリーミングのレスポンスはヘッダー送信後のクエリが X-Query-Count に入らないため、集計値も使う）
+    by_route = {}
+    for result in results:
+        key = result["request"].split(" ")[0] + " " + result["route"]
+        result["queries"] = max(result["queries"], query_counter.max_by_route.get(key, 0))
+        if key not in by_route or result["detail"]:
+            by_route[key] = {**result, "repeated": max(result["repeated"], by_route.get(key, {}).get("repeated", 0))}
+
+    failures = []
+    print(f"\n{'エンドポイント':<52} {'クエリ数':>8} {'上限':>6}  繰り返し")
+    for key, result in sorted(by_route.items(), key=lambda item: item[0].split(" ")[1]):
+        budget = "-" if result["budget"] is None else str(result["budget"])
+        over = result["budget"] is not None and (result["queries"] > result["budget"] or "クエリ数が上限" in result["detail"])
+        failed = over or result["status"] >= 500 or (args.fail_on_repeat and result["repeated"])
+        if failed:
+            failures.append(key)
+        mark = "NG" if failed else "OK"
+        print(f"[{mark}] {key:<50} {result['queries']:>8} {budget:>6}  {result['repeated'] or ''}")
+        if result["detail"]:
+            print(f"      {result['detail']}")
+
+    if failures:
+        print(f"\nクエリ数のチェックに失敗しました: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nすべて上限内です")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+対話型月報生成のEnd-to-End負荷試験
+
+仮想ユーザーごとに、フロントエンド（ConversationalReport.tsx）と同じ順で
+    POST /api/conversation/start → POST /api/conversation/answer（全質問） →
+    POST /api/conversation/generate-report → GET /api/reports/
+を実行する。ユーザーは指定した到着率（一定間隔またはポアソン到着）で開始し、並行して進む。
+エンドポイントごとのスループットと p50/p95/p99 を表示し、結果をJSONに書き出す。
+--compare に前回のJSONを渡すと、エンドポイントごとの差分も表示する。
+
+接続先:
+- 既定: 同じプロセス内でアプリを起動する（一時DB。httpx.ASGITransport 経由）
+- --base-url: 起動済みのサーバー（例: http://localhost:8000）
+- --stub: OpenAIスタブサーバー（benchmarks/openai_stub.py）を起動し、アプリをそこに向ける
+  （同じプロセス内で起動する場合のみ。LLM応答キャッシュは無効にする）
+
+OpenAIのレート制限（OPENAI_RPM_PER_KEY など）も負荷試験の対象になる。
+制限の影響を除きたい場合は環境変数で上限を上げてから実行する。
+
+使い方:
+    cd backend
+    python benchmarks/loadtest_conversation.py --users 50 --rate 5 --stub --latency lognormal:1.0,0.4 --output results.json
+    python benchmarks/loadtest_conversation.py --stages 20@1,60@5 --arrival poisson --stub --compare results.json
+    python benchmarks/loadtest_conversation.py --base-url http://localhost:8000 --users 10 --rate 1 --api-key sk-...
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from openai_stub import run_stub_server, add_stub_arguments, config_from_args
+
+ENDPOINTS = ["start", "answer", "generate-report", "list-reports"]
+
+# 質問の順に使う回答（質問数より少なければ最後の回答を繰り返す）
+ANSWERS = [
+    "家族との時間を大切にしながら、週4日の稼働で安定した収入を得たい",
+    "無理をしないこと、約束を守ること",
+    "午前中に集中して作業し、午後は学習と家族の時間にする",
+    "新規案件を1件獲得し、稼働時間を160時間以内に抑える",
+    "新規案件は獲得できたが、稼働時間は少し超えた",
+    "既存顧客のサイト改修とLP制作、ブログ記事の執筆",
+    "LP制作で初めてA/Bテストの設計から担当した",
+    "営業メールを45件送って、返信が6件、面談が2件でした",
+    "TypeScriptの型設計を学び直した",
+    "だいたい170時間くらいです",
+    "A社から30万円、B社から12万円、合計42万円です",
+    "子どもの夏休みで日中の作業時間が減った",
+    "夜の作業が増えたので来月は見直したい",
+    "家事の分担を見直した",
+    "見積もりが甘く、修正対応に時間がかかった",
+    "要件確認のチェックリストを作ると手戻りが減る",
+    "提案から納品まで一人で回せるようになった",
+    "お客様から継続依頼をいただけた",
+    "見積もりテンプレートを整備し、稼働を150時間にする",
+    "深夜の作業",
+]
+
+
+def percentile(values, pct):
+    """最近傍法でパーセンタイルを求める"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def parse_stages(spec: str) -> List[Tuple[int, float]]:
+    """"20@1,60@5"（20人を毎秒1人、続けて60人を毎秒5人）を [(人数, 到着率), ...] にする"""
+    stages = []
+    for part in spec.split(","):
+        users, _, rate = part.strip().partition("@")
+        stages.append((int(users), float(rate)))
+    return stages
+
+
+def arrival_offsets(stages: List[Tuple[int, float]], arrival: str, rng: random.Random) -> List[float]:
+    """各ユーザーの開始時刻（秒）"""
+    offsets = []
+    now = 0.0
+    for users, rate in stages:
+        for _ in range(users):
+            offsets.append(now)
+            if rate <= 0:
+                continue
+            now += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+    return offsets
+
+
+class Recorder:
+    """エンドポイントごとのレイテンシとステータスを集計する"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.statuses: Dict[str, Dict[str, int]] = {name: {} for name in ENDPOINTS}
+        self.journeys: List[float] = []
+        self.failed_journeys = 0
+
+    async def call(self, name: str, request) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await request
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            response = None
+            status = type(e).__name__
+        self.latencies[name].append((time.perf_counter() - start) * 1000)
+        self.statuses[name][status] = self.statuses[name].get(status, 0) + 1
+        return response
+
+    def summary(self, wall: float) -> Dict[str, Any]:
+        endpoints = {}
+        for name in ENDPOINTS:
+            values = self.latencies[name]
+            errors = sum(count for status, count in self.statuses[name].items() if not status.startswith("2"))
+            endpoints[name] = {
+                "count": len(values),
+                "errors": errors,
+                "throughput_rps": round(len(values) / wall, 2) if wall else 0.0,
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+                "mean_ms": round(statistics.mean(values), 2) if values else 0.0,
+                "max_ms": round(max(values), 2) if values else 0.0,
+                "statuses": self.statuses[name]
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "wall_seconds": round(wall, 3),
+            "requests": total,
+            "throughput_rps": round(total / wall, 2) if wall else 0.0,
+            "journeys": {
+                "completed": len(self.journeys),
+                "failed": self.failed_journeys,
+                "p50_ms": round(percentile(self.journeys, 50), 2),
+                "p95_ms": round(percentile(self.journeys, 95), 2),
+                "p99_ms": round(percentile(self.journeys, 99), 2)
+            },
+            "endpoints": endpoints
+        }
+
+
+async def virtual_user(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    user_index: int,
+    report_month: str,
+    headers: Dict[str, str]
+) -> None:
+    """
+    1人分の対話〜月報生成〜一覧取得
+
+    同一プロンプトの呼び出しはまとめられる（キャッシュ・同時実行の共有）ため、回答にユーザー番号を含めて毎回異なるプロンプトにする
+    """
+    started = time.perf_counter()
+    response = await recorder.call("start", client.post("/api/conversation/start", json={"report_month": report_month}))
+    if response is None or response.status_code != 200:
+        recorder.failed_journeys += 1
+        return
+    session = response.json()
+
+    index = 0
+    while not session.get("is_complete"):
+        answer = f"{ANSWERS[min(index, len(ANSWERS) - 1)]}（ユーザー{user_index}）"
+        response = await recorder.call("answer", client.post("/api/conversation/answer", json={
+            "session_id": session["session_id"],
+            "answer": answer,
+            "session_data": session["session_data"]
+        }))
+        if response is None or response.status_code != 200:
+            recorder.failed_journeys += 1
+            return
+        session = response.json()
+        index += 1
+
+    response = await recorder.call("generate-report", client.post(
+        "/api/conversation/generate-report", json=session["session_data"], headers=headers
+    ))
+    if response is None or response.status_code != 200:
+        recorder.failed_journeys += 1
+        return
+
+    response = await recorder.call("list-reports", client.get("/api/reports/"))
+    if response is None or response.status_code != 200:
+        recorder.failed_journeys += 1
+        return
+    recorder.journeys.append((time.perf_counter() - started) * 1000)
+
+
+async def run_load(client: httpx.AsyncClient, offsets: List[float], report_month: str, headers: Dict[str, str]) -> Dict[str, Any]:
+    recorder = Recorder()
+    started = time.perf_counter()
+
+    async def delayed(user_index: int, offset: float):
+        await asyncio.sleep(max(0.0, offset - (time.perf_counter() - started)))
+        await virtual_user(client, recorder, user_index, report_month, headers)
+
+    await asyncio.gather(*(delayed(index, offset) for index, offset in enumerate(offsets)))
+    return recorder.summary(time.perf_counter() - started)
+
+
+def print_summary(result: Dict[str, Any]) -> None:
+    journeys = result["journeys"]
+    print(
+        f"\n[結果] {result['requests']}件 / {result['wall_seconds']:.2f}秒 ({result['throughput_rps']:.1f} req/s)"
+        f"  完了 {journeys['completed']}人 / 失敗 {journeys['failed']}人"
+    )
+    print(f"  {'journey':<16} p50={journeys['p50_ms']:9.2f}ms p95={journeys['p95_ms']:9.2f}ms p99={journeys['p99_ms']:9.2f}ms")
+    for name, stats in result["endpoints"].items():
+        print(
+            f"  {name:<16} n={stats['count']:<5} err={stats['errors']:<4} {stats['throughput_rps']:7.1f} req/s "
+            f"p50={stats['p50_ms']:9.2f}ms p95={stats['p95_ms']:9.2f}ms p99={stats['p99_ms']:9.2f}ms"
+        )
+
+
+def print_comparison(baseline: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """前回の結果との差分（正の値は遅くなった）"""
+    print("\n[前回との比較]")
+    for name, stats in result["endpoints"].items():
+        before = baseline.get("result", baseline).get("endpoints", {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            deltas.append(f"{key[:-3]} {before[key]:.1f}→{stats[key]:.1f}ms ({change:+.1f}%)")
+        print(f"  {name:<16} " + "  ".join(deltas))
+
+
+async def run_in_process(offsets: List[float], report_month: str, headers: Dict[str, str]) -> Dict[str, Any]:
+    """同じプロセス内でアプリを起動して負荷をかける（環境変数を設定してからインポートする）"""
+    from main import app
+    from database import create_tables, async_engine
+
+    create_tables()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            return await run_load(client, offsets, report_month, headers)
+    finally:
+        from utils.openai_client import openai_clients
+        await openai_clients.close_all()
+        await async_engine.dispose()
+
+
+async def run_remote(base_url: str, offsets: List[float], report_month: str, headers: Dict[str, str]) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        return await run_load(client, offsets, report_month, headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="対話型月報生成のEnd-to-End負荷試験")
+    parser.add_argument("--base-url", default=None, help="起動済みサーバーのURL（省略時は同じプロセス内で起動）")
+    parser.add_argument("--users", type=int, default=20, help="仮想ユーザー数（--stages 指定時は無視）")
+    parser.add_argument("--rate", type=float, default=2.0, help="1秒あたりに開始するユーザー数（--stages 指定時は無視）")
+    parser.add_argument("--stages", default=None, help="段階的な到着率（例: 20@1,60@5）")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant", help="到着間隔の分布")
+    parser.add_argument("--report-month", default=datetime.now().strftime("%Y-%m"))
+    parser.add_argument("--api-key", default=None, help="X-OpenAI-API-Key ヘッダーに付けるキー")
+    parser.add_argument("--stub", action="store_true", help="OpenAIスタブサーバーを起動してアプリを向ける")
+    parser.add_argument("--output", default=None, help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", default=None, help="比較する前回の結果JSON")
+    parser.add_argument("--arrival-seed", type=int, default=0, help="ポアソン到着の乱数シード")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    if args.stub and args.base_url:
+        parser.error("--stub は同じプロセス内で起動する場合のみ使えます（--base-url のサーバーは OPENAI_BASE_URL で向けてください）")
+
+    stages = parse_stages(args.stages) if args.stages else [(args.users, args.rate)]
+    offsets = arrival_offsets(stages, args.arrival, random.Random(args.arrival_seed))
+    headers = {"X-OpenAI-API-Key": args.api_key} if args.api_key else {}
+    print(f"[負荷試験] {len(offsets)}人 stages={stages} arrival={args.arrival} target={args.base_url or 'in-process'}")
+
+    with ExitStack() as stack:
+        stub_config = None
+        stub_stats = None
+        if args.stub:
+            stub_config = config_from_args(args)
+            os.environ["OPENAI_BASE_URL"] = stack.enter_context(run_stub_server(stub_config))
+            os.environ.setdefault("OPENAI_API_KEY", "stub")
+            os.environ["LLM_CACHE_ENABLED"] = "false"
+            print(f"  OpenAIスタブ: {os.environ['OPENAI_BASE_URL']} {stub_config.describe()}")
+
+        if args.base_url:
+            result = asyncio.run(run_remote(args.base_url, offsets, args.report_month, headers))
+        else:
+            # 負荷試験専用の一時DBを使う（database のインポート前に設定する必要がある）
+            os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='loadtest_')}/loadtest.db"
+            result = asyncio.run(run_in_process(offsets, args.report_month, headers))
+        if args.stub:
+            # スタブが受けた呼び出し数・注入したエラー数（フォールバックした月報の目安）
+            stub_stats = httpx.get(os.environ["OPENAI_BASE_URL"].rsplit("/v1", 1)[0] + "/stub/stats").json()
+
+    print_summary(result)
+    if stub_stats:
+        print(
+            f"  OpenAIスタブ: 呼び出し {stub_stats['requests']}件 / エラー注入 {stub_stats['errors_injected']}件 "
+            f"/ ストリーム切断 {stub_stats['streams_aborted']}件"
+        )
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), result)
+    if args.output:
+        record = {
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            "config": {
+                "target": args.base_url or "in-process",
+                "stages": stages,
+                "arrival": args.arrival,
+                "report_month": args.report_month,
+                "stub": stub_config.describe() if stub_config else None
+            },
+            "stub_stats": stub_stats,
+            "result": result
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を書き出しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+OpenAI互換のスタブサーバー（負荷試験・レイテンシ試験用）
+
+実際のAPIを呼ばずに月報生成を負荷試験するための、Chat Completions 互換の偽サーバー。
+- POST /v1/chat/completions（stream=true ではトークンごとのSSE、stream_options.include_usage にも対応）
+- 応答までの待ち時間・ストリーミングのトークン間隔を分布で指定
+- 指定した割合でエラー応答（429/500/503など）やストリームの途中切断を起こす
+- 応答本文はメッセージとシードから決まる（同じ入力には同じ応答）
+- GET /stub/stats で受けたリクエスト数などを返す
+
+バックエンドからは OPENAI_BASE_URL で向け先を切り替える（APIキーは任意の文字列でよい）。
+同じプロンプトの再生成はLLM応答キャッシュから返るため、負荷試験では LLM_CACHE_ENABLED=false にする。
+
+使い方（サブプロセスとして起動）:
+    cd backend
+    python benchmarks/openai_stub.py --port 8100 --latency lognormal:0.8,0.5 --token-delay fixed:0.01 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=stub LLM_CACHE_ENABLED=false python main.py
+
+使い方（同じプロセス内で起動）:
+    with run_stub_server(StubConfig(latency=parse_distribution("fixed:0.2"))) as base_url:
+        os.environ["OPENAI_BASE_URL"] = base_url
+
+待ち時間の分布（秒）:
+    fixed:V  uniform:LOW,HIGH  normal:MEAN,STDDEV  lognormal:MEDIAN,SIGMA  exponential:MEAN
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from utils.token_budget import estimate_tokens, estimate_messages_tokens
+
+# 応答本文に使う文（シードから決まる順で並べる）
+SENTENCES = [
+    "今月は既存案件の保守と新規のLP制作を並行して進めました。",
+    "稼働時間は目標の範囲内に収まり、家族との時間も確保できました。",
+    "営業メールの返信率が先月より上がり、面談につながる件数が増えました。",
+    "見積もりの精度に課題があり、修正対応に想定以上の時間がかかりました。",
+    "要件確認のチェックリストを作ったことで手戻りが減りました。",
+    "TypeScriptの型設計を学び直し、保守しやすいコードを書けるようになりました。",
+    "お客様から継続依頼をいただけたことが一番の成果です。",
+    "来月は見積もりテンプレートを整備し、稼働を150時間に抑えます。",
+    "深夜の作業をやめ、午前中に集中して作業する時間を作ります。",
+    "生活リズムを整えたことで、作業の集中力が上がりました。",
+]
+
+SECTION_HEADINGS = [
+    "## 🏠 今月の状況・家庭のこと",
+    "## 🎯 目指しているゴール・理想の生活",
+    "## 📊 今月の目標と実績",
+    "## 💼 今月の業務内容・取り組み・学び",
+    "## 💡 課題・改善点・気づき",
+    "## 🌟 今月の成果・成長ポイント",
+    "## 🚀 来月の目標・取り組み予定",
+]
+
+_TITLE_PATTERN = re.compile(r"# 月報：(\d{4}年\d{1,2}月)")
+
+# ストリーミングで1チャンクに入れる文字数
+_CHARS_PER_CHUNK = 2
+
+
+class Distribution:
+    """待ち時間の分布（秒）"""
+
+    def __init__(self, kind: str, params: List[float]):
+        self.kind = kind
+        self.params = params
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            # MEDIAN と対数の標準偏差で指定する
+            value = p[0] * rng.lognormvariate(0.0, p[1])
+        elif self.kind == "exponential":
+            value = rng.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+        else:
+            raise ValueError(f"未対応の分布です: {self.kind}")
+        return max(0.0, value)
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{','.join(str(v) for v in self.params)}"
+
+
+_DISTRIBUTION_ARITY = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+
+
+def parse_distribution(spec: str) -> Distribution:
+    """"lognormal:0.8,0.5" のような指定を分布にする"""
+    kind, _, values = spec.partition(":")
+    kind = kind.strip().lower()
+    if kind not in _DISTRIBUTION_ARITY:
+        raise ValueError(f"未対応の分布です: {spec}（{', '.join(_DISTRIBUTION_ARITY)}）")
+    params = [float(v) for v in values.split(",") if v.strip()]
+    if len(params) != _DISTRIBUTION_ARITY[kind]:
+        raise ValueError(f"{kind} には {_DISTRIBUTION_ARITY[kind]} 個の値が必要です: {spec}")
+    return Distribution(kind, params)
+
+
+class StubConfig:
+    """スタブサーバーの設定"""
+
+    def __init__(
+        self,
+        latency: Optional[Distribution] = None,
+        token_delay: Optional[Distribution] = None,
+        error_rate: float = 0.0,
+        error_statuses: Optional[List[int]] = None,
+        retry_after: Optional[float] = None,
+        stream_abort_rate: float = 0.0,
+        completion_tokens: int = 600,
+        seed: int = 0
+    ):
+        # 応答（ストリーミングでは最初のチャンク）までの待ち時間
+        self.latency = latency or Distribution("fixed", [0.0])
+        # ストリーミングのチャンク間の待ち時間
+        self.token_delay = token_delay or Distribution("fixed", [0.0])
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [429, 500, 503]
+        self.retry_after = retry_after
+        self.stream_abort_rate = stream_abort_rate
+        self.completion_tokens = completion_tokens
+        self.seed = seed
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "latency": repr(self.latency),
+            "token_delay": repr(self.token_delay),
+            "error_rate": self.error_rate,
+            "error_statuses": self.error_statuses,
+            "retry_after": self.retry_after,
+            "stream_abort_rate": self.stream_abort_rate,
+            "completion_tokens": self.completion_tokens,
+            "seed": self.seed
+        }
+
+
+def generate_content(messages: List[Dict[str, Any]], max_tokens: int, seed: int) -> str:
+    """メッセージとシードから決まる月報風の応答本文"""
+    digest = hashlib.sha256(
+        json.dumps([messages, seed], ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).digest()
+    rng = random.Random(digest)
+    prompt = "\n".join(str(m.get("content") or "") for m in messages)
+    title = _TITLE_PATTERN.search(prompt)
+    lines = [f"# 月報：{title.group(1)}" if title else "# 月報", ""]
+    budget = max_tokens - estimate_tokens(lines[0])
+    for heading in SECTION_HEADINGS:
+        section = [heading, ""] + [f"- {rng.choice(SENTENCES)}" for _ in range(rng.randint(2, 4))] + [""]
+        cost = estimate_tokens("\n".join(section))
+        if cost > budget:
+            break
+        lines.extend(section)
+        budget -= cost
+    return "\n".join(lines).rstrip() + "\n"
+
+
+def error_body(status_code: int) -> Dict[str, Any]:
+    kinds = {
+        429: ("rate_limit_exceeded", "Rate limit reached (stub)"),
+        500: ("server_error", "The server had an error while processing your request (stub)"),
+        503: ("server_error", "The engine is currently overloaded (stub)"),
+    }
+    code, message = kinds.get(status_code, ("stub_error", f"Injected error {status_code} (stub)"))
+    return {"error": {"message": message, "type": code, "param": None, "code": code}}
+
+
+def create_stub_app(config: StubConfig) -> FastAPI:
+    """スタブサーバーのASGIアプリを作成"""
+    app = FastAPI(title="OpenAI stub")
+    rng = random.Random(config.seed)
+    counters = {
+        "requests": 0,
+        "streamed": 0,
+        "errors_injected": 0,
+        "streams_aborted": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0
+    }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        messages = body.get("messages") or []
+        model = body.get("model", "gpt-4")
+        stream = bool(body.get("stream"))
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        max_tokens = min(int(body.get("max_tokens") or config.completion_tokens), config.completion_tokens)
+
+        await asyncio.sleep(config.latency.sample(rng))
+
+        if rng.random() < config.error_rate:
+            counters["errors_injected"] += 1
+            status_code = rng.choice(config.error_statuses)
+            headers = {}
+            if status_code == 429 and config.retry_after is not None:
+                headers["retry-after"] = str(config.retry_after)
+            return JSONResponse(error_body(status_code), status_code=status_code, headers=headers)
+
+        content = generate_content(messages, max_tokens, config.seed)
+        usage = {
+            "prompt_tokens": estimate_messages_tokens(messages),
+            "completion_tokens": estimate_tokens(content)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        counters["prompt_tokens"] += usage["prompt_tokens"]
+        counters["completion_tokens"] += usage["completion_tokens"]
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not stream:
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+
+        counters["streamed"] += 1
+        abort_at = None
+        if rng.random() < config.stream_abort_rate:
+            abort_at = rng.randint(1, max(1, len(content) // _CHARS_PER_CHUNK - 1))
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def event_stream():
+            yield chunk({"role": "assistant", "content": ""})
+            for index, start in enumerate(range(0, len(content), _CHARS_PER_CHUNK)):
+                if abort_at is not None and index == abort_at:
+                    counters["streams_aborted"] += 1
+                    # 接続を途中で切る（クライアント側では読み取りエラーになる）
+                    raise ConnectionResetError("stub: stream aborted")
+                yield chunk({"content": content[start:start + _CHARS_PER_CHUNK]})
+                delay = config.token_delay.sample(rng)
+                if delay:
+                    await asyncio.sleep(delay)
+            yield chunk({}, "stop")
+            if include_usage:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage
+                }
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "gpt-4", "object": "model", "owned_by": "stub"}]}
+
+    @app.get("/stub/stats")
+    async def stub_stats():
+        return {"config": config.describe(), **counters}
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def run_stub_server(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> Iterator[str]:
+    """
+    スタブサーバーを別スレッドで起動し、OPENAI_BASE_URL に設定する base_url を返す
+
+    port=0 なら空いているポートを使う
+    """
+    import uvicorn
+
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(create_stub_app(config), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("スタブサーバーを起動できませんでした")
+        time.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency=parse_distribution(args.latency),
+        token_delay=parse_distribution(args.token_delay),
+        error_rate=args.error_rate,
+        error_statuses=[int(v) for v in args.error_statuses.split(",") if v.strip()],
+        retry_after=args.retry_after,
+        stream_abort_rate=args.stream_abort_rate,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed
+    )
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """スタブの設定を受け取る引数（負荷試験のスクリプトからも使う）"""
+    parser.add_argument("--latency", default="fixed:0", help="応答（最初のチャンク）までの待ち時間の分布")
+    parser.add_argument("--token-delay", default="fixed:0", help="ストリーミングのチャンク間の待ち時間の分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラー応答を返す割合（0〜1）")
+    parser.add_argument("--error-statuses", default="429,500,503", help="返すエラーのステータスコード（カンマ区切り）")
+    parser.add_argument("--retry-after", type=float, default=None, help="429応答に付ける Retry-After（秒）")
+    parser.add_argument("--stream-abort-rate", type=float, default=0.0, help="ストリームを途中で切断する割合（0〜1）")
+    parser.add_argument("--completion-tokens", type=int, default=600, help="生成する応答の最大トークン数")
+    parser.add_argument("--seed", type=int, default=0, help="応答本文・待ち時間・エラーの乱数シード")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI互換のスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = config_from_args(args)
+    print(f"OpenAIスタブ: http://{args.host}:{args.port}/v1 {config.describe()}")
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+トレースの受け口（OTLP/HTTPコレクターの代わり）と集計
+
+serve:   OTLP/HTTP（JSON）の POST /v1/traces を受け、utils.tracing の jsonl と同じ形式でファイルに追記する
+summary: jsonl のスパンをリクエスト（トレース）ごとにまとめ、どの処理に時間がかかったかを表示する
+
+使い方:
+    cd backend
+    python benchmarks/trace_collector.py serve --port 4318 --output traces/collected.jsonl
+    TRACING_EXPORTER=otlp TRACING_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces python main.py
+
+    # コレクターを使わずにファイルへ直接書き出す場合
+    TRACING_EXPORTER=jsonl TRACING_JSONL_PATH=traces/spans.jsonl python main.py
+
+    python benchmarks/trace_collector.py summary traces/spans.jsonl --route /api/conversation/generate-report
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List
+
+ROOT_SPAN = "http.request"
+
+
+def _attribute_value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("stringValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+def spans_from_otlp(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """OTLP/JSON のリクエスト本文を jsonl の1行分の形式に変換"""
+    records = []
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                attributes = {item["key"]: _attribute_value(item["value"]) for item in span.get("attributes", [])}
+                start, end = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+                status = span.get("status", {})
+                records.append({
+                    "name": span["name"],
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "request_id": attributes.pop("request.id", None),
+                    "start_time_ns": start,
+                    "end_time_ns": end,
+                    "duration_ms": round((end - start) / 1_000_000, 3),
+                    "status": "error" if status.get("code") == 2 else "ok",
+                    "error": status.get("message"),
+                    "attributes": attributes
+                })
+    return records
+
+
+def create_collector_app(output: str):
+    from fastapi import FastAPI, Request
+
+    app = FastAPI(title="Trace collector")
+    received = {"requests": 0, "spans": 0}
+
+    @app.post("/v1/traces")
+    async def receive_traces(request: Request):
+        records = spans_from_otlp(await request.json())
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        received["requests"] += 1
+        received["spans"] += len(records)
+        return {"partialSuccess": {}}
+
+    @app.get("/stats")
+    async def stats():
+        return received
+
+    return app
+
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def self_times(spans: List[Dict[str, Any]]) -> Dict[str, float]:
+    """スパン名ごとの自身の時間（子スパンの時間を除く, ms）"""
+    children_ms: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        if span["parent_id"]:
+            children_ms[span["parent_id"]] += span["duration_ms"]
+    totals: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        totals[span["name"]] += max(0.0, span["duration_ms"] - children_ms[span["span_id"]])
+    return totals
+
+
+def summarize(spans: List[Dict[str, Any]], route: str = None, top: int = 5) -> None:
+    traces: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+
+    requests = []
+    for trace_spans in traces.values():
+        root = next((span for span in trace_spans if span["parent_id"] is None), None)
+        if root is None:
+            continue
+        root_route = root["attributes"].get("http.route", root["name"])
+        if route and root_route != route:
+            continue
+        requests.append((root, root_route, trace_spans))
+
+    if not requests:
+        print("対象のトレースがありません")
+        return
+
+    # ルート（またはジョブ）ごとの内訳
+    by_route: Dict[str, List] = defaultdict(list)
+    for request in requests:
+        by_route[request[1]].append(request)
+    for route_name, items in sorted(by_route.items()):
+        total_ms = sum(root["duration_ms"] for root, _, _ in items)
+        breakdown: Dict[str, float] = defaultdict(float)
+        for _, _, trace_spans in items:
+            for name, ms in self_times(trace_spans).items():
+                breakdown[name] += ms
+        print(f"\n[{route_name}] {len(items)}件  平均 {total_ms / len(items):.1f}ms")
+        for name, ms in sorted(breakdown.items(), key=lambda item: -item[1]):
+            share = ms / total_ms if total_ms else 0
+            print(f"  {name:<28} 平均 {ms / len(items):9.2f}ms  {share:6.1%}")
+
+    # 遅いリクエストの詳細
+    print(f"\n[遅いリクエスト 上位{top}件]")
+    for root, route_name, trace_spans in sorted(requests, key=lambda item: -item[0]["duration_ms"])[:top]:
+        print(f"  {root['duration_ms']:9.1f}ms  {route_name}  request_id={root.get('request_id')}")
+        for name, ms in sorted(self_times(trace_spans).items(), key=lambda item: -item[1])[:4]:
+            print(f"      {name:<26} {ms:9.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="トレースの受け口と集計")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="OTLP/HTTP（JSON）の受け口を起動")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=4318)
+    serve.add_argument("--output", default="traces/collected.jsonl", help="受けたスパンを追記するファイル")
+
+    summary = subparsers.add_parser("summary", help="jsonl のスパンを集計")
+    summary.add_argument("path")
+    summary.add_argument("--route", default=None, help="このルートのリクエストのみ集計（例: /api/reports/）")
+    summary.add_argument("--top", type=int, default=5, help="表示する遅いリクエストの件数")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        import uvicorn
+
+        print(f"トレースの受け口: http://{args.host}:{args.port}/v1/traces → {args.output}")
+        uvicorn.run(create_collector_app(args.output), host=args.host, port=args.port, log_level="warning")
+        return
+
+    if not os.path.exists(args.path):
+        print(f"ファイルがありません: {args.path}")
+        sys.exit(1)
+    summarize(load_spans(args.path), args.route, args.top)
+
+
+if __name__ == "__main__":
+    main()
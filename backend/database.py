@@ -2,8 +2,9 @@
 データベース設定とモデル定義
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, Boolean, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, event, inspect, Index, Column, Integer, String, DateTime, Float, Text, Boolean, ForeignKey
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, deferred
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -11,6 +12,9 @@ from dotenv import load_dotenv
 # 環境変数を読み込み
 load_dotenv()
 
+# 環境変数の読み込み後にインポートする（スロークエリログの設定を .env から読むため）
+from utils.slow_query_log import log_slow_queries
+
 # データベースURL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./monthly_reports.db")
 
@@ -23,12 +27,77 @@ if DATABASE_URL.startswith("sqlite"):
 else:
     engine = create_engine(DATABASE_URL)
 
+
+# 非同期エンジン（APIリクエスト処理用）
+def _to_async_url(url: str) -> str:
+    """同期用のDATABASE_URLを非同期ドライバ用のURLに変換"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _to_async_url(DATABASE_URL))
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+
+# SQLiteのパフォーマンス設定（環境変数で上書き可能）
+# - journal_mode=WAL: 読み取りと書き込みが互いをブロックしない
+# - synchronous=NORMAL: WALと組み合わせてコミットごとのfsyncを省略
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # 負の値はKiB単位（64MB）
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # ミリ秒
+}
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """接続ごとにSQLiteのPRAGMAを適用"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+# スロークエリログ（しきい値を超えたSQL文をパラメーター・ルート・クエリプランとともに記録）
+log_slow_queries(engine)
+log_slow_queries(async_engine)
+
+def get_sqlite_pragma_report() -> dict:
+    """実際に適用されているPRAGMAの値を取得（起動時のレポート用）"""
+    if not DATABASE_URL.startswith("sqlite"):
+        return {}
+    report = {}
+    with engine.connect() as connection:
+        for name in SQLITE_PRAGMAS:
+            report[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return report
+
 # セッションファクトリの作成
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False: コミット後の属性アクセスで遅延ロード（同期I/O）を発生させない
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # ベースクラス
 Base = declarative_base()
 
+# 月報の大きなテキスト列の遅延ロードグループ（詳細取得時は undefer_group で読み込む）
+REPORT_TEXT_GROUP = "report_text"
+
 # ユーザーモデル
 class User(Base):
     __tablename__ = "users"
@@ -73,11 +142,11 @@ class MonthlyReport(Base):
     received_amount = Column(Float, default=0.0)
     delivered_amount = Column(Float, default=0.0)
 
-    # 定性データ
-    good_points = Column(Text)
-    challenges = Column(Text)
-    improvements = Column(Text)
-    next_month_goals = Column(Text)
+    # 定性データ（good_pointsにはAI生成の全文が入るため、一覧取得では読み込まない）
+    good_points = deferred(Column(Text), group=REPORT_TEXT_GROUP)
+    challenges = deferred(Column(Text), group=REPORT_TEXT_GROUP)
+    improvements = deferred(Column(Text), group=REPORT_TEXT_GROUP)
+    next_month_goals = deferred(Column(Text), group=REPORT_TEXT_GROUP)
 
     # タイムスタンプ
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -87,8 +156,12 @@ class MonthlyReport(Base):
     user = relationship("User", back_populates="monthly_reports")
     work_time_details = relationship("WorkTimeDetail", back_populates="report", cascade="all, delete-orphan")
 
-    # ユニーク制約（ユーザーごとに月報は1つ）
-    __table_args__ = ({"sqlite_autoincrement": True},)
+    # 一覧（user_id + created_at順）と統計（user_id + report_month順）用の複合インデックス
+    __table_args__ = (
+        Index("ix_monthly_reports_user_created", "user_id", "created_at"),
+        Index("ix_monthly_reports_user_month", "user_id", "report_month"),
+        {"sqlite_autoincrement": True},
+    )
 
 # 作業時間詳細モデル
 class WorkTimeDetail(Base):
@@ -107,6 +180,10 @@ class WorkTimeDetail(Base):
     # リレーション
     report = relationship("MonthlyReport", back_populates="work_time_details")
 
+    __table_args__ = (
+        Index("ix_work_time_details_report_date", "report_id", "work_date"),
+    )
+
 # プロジェクトモデル
 class Project(Base):
     __tablename__ = "projects"
@@ -138,16 +215,105 @@ class ReportTemplate(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
+# 対話セッションモデル（SESSION_STORE_BACKEND=sqlite の場合に使用）
+class ConversationSessionRecord(Base):
+    __tablename__ = "conversation_sessions"
+
+    session_id = Column(String(100), primary_key=True)
+    data = Column(Text, nullable=False)  # JSON文字列として保存
+    expires_at = Column(Float, nullable=False, index=True)  # UNIXタイムスタンプ
+    updated_at = Column(Float, nullable=False, index=True)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_response_cache"
+
+    cache_key = Column(String(64), primary_key=True)  # 正規化したプロンプト・モデル・テンプレート版のSHA-256
+    model = Column(String(50), nullable=False)
+    template_version = Column(String(50), nullable=False)
+    response = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)  # UNIXタイムスタンプ
+    last_accessed = Column(Float, nullable=False, index=True)
+    hits = Column(Integer, default=0)
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(String(36), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    payload = Column(Text, nullable=False)  # JSON文字列として保存
+    result = Column(Text)  # JSON文字列として保存
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # 実行中のジョブの所有者（ワーカープロセス）と、所有者が最後に生存を記録した時刻（リース）
+    owner = Column(String(100))
+    heartbeat_at = Column(DateTime)
+    # 登録したプロセスだけが持つ秘密情報（APIキー）が必要なジョブか
+    has_secrets = Column(Boolean, default=False)
+    # 保存した月報（再実行時に同じ月報を二重に保存しないため、月報の保存と同じトランザクションで記録する）
+    report_id = Column(Integer)
+
+    # ワーカーが古い順に queued のジョブを取り出すための複合インデックス
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created", "status", "created_at"),
+    )
+
 # データベーステーブルの作成
 def create_tables():
     """データベーステーブルを作成"""
     Base.metadata.create_all(bind=engine)
+    ensure_columns()
+    ensure_indexes()
+
+def ensure_columns():
+    """
+    既存のテーブルに不足している列を追加
+
+    create_all() は既存テーブルに列を追加しないため、後から追加した列（NULL可）は
+    ここで ALTER TABLE で追加する
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}')
+
+def ensure_indexes():
+    """
+    既存のデータベースに不足しているインデックスを作成
+
+    create_all() は既存テーブルをスキップするため、後から追加したインデックスは
+    ここで個別に作成する（存在する場合は何もしない）
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 # データベースセッションの依存性注入
 def get_db():
-    """データベースセッションを取得"""
+    """データベースセッションを取得（スクリプト・旧ルーター用の同期版）"""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def refresh_report(db: AsyncSession, report: MonthlyReport):
+    """月報を再読み込み（refresh()では読み込まれない遅延ロード列も含める）"""
+    await db.refresh(report, attribute_names=[attr.key for attr in inspect(MonthlyReport).column_attrs])
+
+async def get_async_db():
+    """非同期データベースセッションを取得（イベントループをブロックしない）"""
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -4,27 +4,56 @@
 
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import HTTPBearer
 from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
 
-from database import create_tables
-from routers import auth, reports, users, ai_assistant, conversation, reports_no_auth, conversation_no_auth, test_data_no_auth
+from database import create_tables, engine, async_engine, get_sqlite_pragma_report
+from routers import auth, reports, users, ai_assistant, conversation, reports_no_auth, conversation_no_auth, test_data_no_auth, jobs, profiles
 import routers.conversation_no_auth_detailed as conversation_no_auth_detailed
 import routers.test_data_no_auth_detailed as test_data_no_auth_detailed
+from utils.session_store import session_store, run_session_sweeper
+from utils.openai_client import openai_clients
+from utils.llm_cache import llm_cache
+from utils.rate_limiter import rate_limiter
+from utils.resilience import openai_breaker, openai_retry_policy
+from utils.job_queue import job_queue
+from utils.token_budget import token_usage
+from utils.report_renderer import report_renderer
+from utils.metrics import metrics_registry, MetricsMiddleware, instrument_engine, route_template, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.tracing import tracer, TracingMiddleware, trace_engine, REQUEST_ID_HEADER
+from utils.query_counter import query_counter, QueryCounterMiddleware, count_queries
+from utils.profiling import request_profiler, ProfilingMiddleware
+from utils.slow_query_log import slow_query_log
+from utils.query_events import query_events
+from utils.logger import get_logger, log_writer
 
 # 環境変数を読み込み
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # データベースの初期化
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # アプリケーション開始時
     create_tables()
+    pragmas = get_sqlite_pragma_report()
+    if pragmas:
+        logger.info("SQLite設定", extra={"pragmas": pragmas})
+    sweeper = asyncio.create_task(run_session_sweeper(session_store))
+    await job_queue.start()
     yield
     # アプリケーション終了時（必要に応じてクリーンアップ処理）
+    sweeper.cancel()
+    await job_queue.stop()
+    await openai_clients.close_all()
+    await async_engine.dispose()
+    tracer.shutdown()
+    log_writer.flush()
 
 # FastAPIアプリケーションの作成
 app = FastAPI(
@@ -45,6 +74,25 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# リクエスト数・レイテンシ・DBクエリ時間の計測（/metrics で公開。DBの計測は utils.query_events の共通フックで行う）
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine)
+
+# リクエストIDの付与とトレース（TRACING_EXPORTER で出力先を指定）
+app.add_middleware(TracingMiddleware)
+trace_engine(engine)
+trace_engine(async_engine)
+
+# リクエストごとのSQLクエリ数の計測とN+1の検出（開発・テスト用。QUERY_COUNTER_MODE で有効化）
+if query_counter.enabled:
+    app.add_middleware(QueryCounterMiddleware)
+    count_queries(engine)
+    count_queries(async_engine)
+
+# X-Profile ヘッダーによるリクエスト単位のプロファイリング（PROFILE_TOKEN を設定した場合のみ）
+app.add_middleware(ProfilingMiddleware)
+
 # セキュリティ
 security = HTTPBearer()
 
@@ -55,6 +103,8 @@ app.include_router(reports_no_auth.router, prefix="/api/reports", tags=["月報
 app.include_router(ai_assistant.router, prefix="/api/ai", tags=["AI支援"])
 app.include_router(conversation_no_auth_detailed.router, prefix="/api/conversation", tags=["対話型月報生成（認証無効版）"])
 app.include_router(test_data_no_auth_detailed.router, prefix="/api/test", tags=["テストデータ（認証無効版）"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["バックグラウンドジョブ"])
+app.include_router(profiles.router, prefix="/api/profiles", tags=["プロファイリング"])
 
 # エラーハンドラー
 @app.exception_handler(HTTPException)
@@ -72,17 +122,24 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """一般的な例外のカスタムハンドラー"""
-    print(f"未処理のエラー: {type(exc).__name__}: {exc}")
-    import traceback
-    traceback.print_exc()
-    
+    # このハンドラーはミドルウェアの外側で動くため、リクエストIDは request.state から取る
+    request_id = getattr(request.state, "request_id", None)
+    logger.error(
+        f"未処理のエラー: {type(exc).__name__}: {exc}",
+        exc_info=exc,
+        extra={"request_id": request_id, "route": f"{request.method} {route_template(request.scope)}"}
+    )
+
+    headers = {
+        "Access-Control-Allow-Origin": "http://localhost:3456",
+        "Access-Control-Allow-Credentials": "true"
+    }
+    if request_id:
+        headers[REQUEST_ID_HEADER] = request_id
     return JSONResponse(
         status_code=500,
         content={"detail": f"内部サーバーエラー: {str(exc)}"},
-        headers={
-            "Access-Control-Allow-Origin": "http://localhost:3456",
-            "Access-Control-Allow-Credentials": "true"
-        }
+        headers=headers
     )
 
 @app.get("/")
@@ -101,7 +158,41 @@ async def health_check():
     """
     ヘルスチェックエンドポイント
     """
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "session_store": session_store.stats(),
+        "openai_clients": openai_clients.stats(),
+        "llm_cache": llm_cache.stats(),
+        "openai_limiter": rate_limiter.stats(),
+        "openai_breaker": openai_breaker.stats(),
+        "openai_retries": openai_retry_policy.stats(),
+        "token_usage": token_usage.stats(),
+        "report_templates": report_renderer.stats(),
+        "tracing": tracer.stats(),
+        "query_counter": query_counter.stats(),
+        "query_events": query_events.stats(),
+        "profiling": request_profiler.stats(),
+        "slow_queries": slow_query_log.stats(),
+        "logging": log_writer.stats(),
+        "job_queue": job_queue.stats()
+    }
+
+@app.get("/health/slow-queries", dependencies=[Depends(profiles.require_profile_token)])
+async def slow_queries(limit: int = 20, order_by: str = "total_ms"):
+    """
+    スロークエリの集計（正規化したSQL文ごと。order_by: total_ms / max_ms / count）
+    SQL文・クエリプラン・ルートを含むため、プロファイルと同じトークン（X-Profile-Token）が必要
+    """
+    if order_by not in ("total_ms", "max_ms", "count", "avg_ms"):
+        raise HTTPException(status_code=400, detail="order_by は total_ms / max_ms / count / avg_ms のいずれかです")
+    return {**slow_query_log.stats(), "statements": slow_query_log.entries(limit, order_by)}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus形式のメトリクス
+    """
+    return Response(content=await metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
@@ -3,27 +3,28 @@ AI支援機能のAPIエンドポイント
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-import os
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
 from typing import List
+import importlib.util
 
-from database import get_db, User, MonthlyReport
+from database import get_async_db, User, MonthlyReport, REPORT_TEXT_GROUP
 from schemas import AIAnalysisRequest, AIAnalysisResponse, AISuggestionRequest
 from auth import get_current_active_user
+from utils.openai_client import resolve_api_key, chat_completion
+from utils.metrics import record_ai_generation
 
 router = APIRouter()
 
-def get_openai_client():
-    """OpenAIクライアントを取得"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return None
+# 分析プロンプトの版（プロンプトを変更したら上げる。LLM応答キャッシュのキーに含まれる）
+ANALYSIS_PROMPT_VERSION = "analysis-v1"
 
-    try:
-        import openai
-        return openai.OpenAI(api_key=api_key)
-    except ImportError:
-        return None
+def openai_available() -> bool:
+    """OpenAI APIキーとライブラリが利用可能か"""
+    if not resolve_api_key():
+        return False
+    return importlib.util.find_spec("openai") is not None
 
 @router.post("/analyze", response_model=AIAnalysisResponse)
 async def analyze_report_data(
@@ -33,9 +34,9 @@ async def analyze_report_data(
     """
     月報データをAIで分析し、提案を生成
     """
-    client = get_openai_client()
-    if not client:
+    if not openai_available():
         # OpenAI APIが利用できない場合はデモデータを返す
+        record_ai_generation("analysis", succeeded=False, reason="no_api_key")
         return generate_demo_analysis(analysis_request.analysis_type)
 
     try:
@@ -54,17 +55,19 @@ async def analyze_report_data(
             )
 
         # OpenAI APIを呼び出し
-        response = client.chat.completions.create(
+        ai_response = await chat_completion(
+            resolve_api_key(),
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "あなたはフリーランスのコンサルタントです。月報データを分析し、建設的で実用的なアドバイスを提供してください。"},
                 {"role": "user", "content": prompt}
             ],
+            template_version=ANALYSIS_PROMPT_VERSION,
             max_tokens=1000,
             temperature=0.7
         )
 
-        ai_response = response.choices[0].message.content
+        record_ai_generation("analysis", succeeded=True)
 
         # レスポンスを構造化
         suggestions = parse_ai_response(ai_response)
@@ -77,22 +80,25 @@ async def analyze_report_data(
 
     except Exception as e:
         # エラーの場合もデモデータを返す
+        record_ai_generation("analysis", succeeded=False, reason="error")
         return generate_demo_analysis(analysis_request.analysis_type)
 
 @router.post("/suggest-improvements/{report_id}")
 async def suggest_improvements(
     report_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     指定した月報に対する改善提案を生成
     """
     # 月報を取得
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == current_user.id
+        ).options(undefer_group(REPORT_TEXT_GROUP))
+    )
 
     if not report:
         raise HTTPException(
@@ -3,77 +3,25 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
-import re
-from typing import Dict, Any, Optional, Union
-
-from database import get_db, User
+from typing import Optional
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.number_extraction import extract_number_from_text, sum_man_yen_amounts, INTEGER_PATTERN
+from utils.openai_client import acquire_client, resolve_api_key
+from utils.resilience import openai_breaker, openai_retry_policy, call_with_resilience
+from utils.metrics import record_ai_generation
+from utils.report_renderer import report_renderer, answer_texts, TRADITIONAL_REPORT_TEMPLATE
+
+from database import get_async_db, User
 from schemas import ConversationSession, ConversationResponse, QuestionResponse
 from auth import get_current_active_user
+from utils.logger import get_logger
 
 router = APIRouter()
-
-def extract_number_from_text(text: str, default: Union[int, float] = 0) -> Union[int, float]:
-    """
-    日本語テキストから数値を抽出する
-    例: "160時間ぐらいすね" -> 160
-    例: "およそ200万円です" -> 2000000
-    """
-    if not text or not isinstance(text, str):
-        return default
-    
-    # 「万」「千」などの単位を先に処理
-    # 例: "200万" -> 2000000
-    unit_patterns = [
-        (r'([0-9０-９]+(?:\.[0-9０-９]+)?)\s*万', 10000),
-        (r'([0-9０-９]+(?:\.[0-9０-９]+)?)\s*千', 1000),
-        (r'([0-9０-９]+(?:\.[0-9０-９]+)?)\s*百', 100),
-    ]
-    
-    for pattern, multiplier in unit_patterns:
-        match = re.search(pattern, text)
-        if match:
-            number_str = match.group(1)
-            # 全角を半角に変換
-            trans_table = str.maketrans('０１２３４５６７８９', '0123456789')
-            number_str = number_str.translate(trans_table)
-            try:
-                base_number = float(number_str)
-                result = base_number * multiplier
-                return int(result) if result == int(result) else result
-            except ValueError:
-                continue
-    
-    # 通常の数値パターンを検索（全角・半角対応）
-    # カンマ付き数値、小数点付き数値も対応
-    patterns = [
-        r'[0-9０-９]+(?:[,，][0-9０-９]+)*(?:\.[0-9０-９]+)?',  # 半角・全角数字
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text)
-        if matches:
-            # 最初にマッチした数値を使用
-            number_str = matches[0]
-            
-            # 全角を半角に変換
-            trans_table = str.maketrans('０１２３４５６７８９，', '0123456789,')
-            number_str = number_str.translate(trans_table)
-            
-            # カンマを除去
-            number_str = number_str.replace(',', '')
-            
-            try:
-                # 小数点があればfloat、なければint
-                if '.' in number_str:
-                    return float(number_str)
-                else:
-                    return int(number_str)
-            except ValueError:
-                continue
-    
-    return default
+logger = get_logger(__name__)
 
 # 質問のテンプレート
 QUESTION_FLOW = {
@@ -237,7 +185,7 @@ QUESTION_FLOW = {
 @router.post("/start", response_model=ConversationResponse)
 async def start_conversation(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     対話型月報作成セッションを開始
@@ -269,7 +217,7 @@ async def start_conversation(
 async def process_answer(
     answer_data: QuestionResponse,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     ユーザーの回答を処理し、次の質問を返す
@@ -343,27 +291,30 @@ async def process_answer(
 async def generate_report_from_conversation(
     session_data: ConversationSession,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     x_openai_api_key: Optional[str] = Header(None)
 ):
     """
     対話の回答からAI生成月報を作成
     """
     try:
-        import openai
         from database import MonthlyReport
         from datetime import datetime
-        import os
         
-        print(f"月報生成開始 - ユーザーID: {current_user.id}")
-        print(f"セッションデータ: {session_data}")
+        # セッションの内容（回答の本文）はログに残さず、件数だけを記録する
+        logger.info("月報生成開始", extra={
+            "user_id": current_user.id,
+            "completed_categories": len(session_data.completed_categories),
+            "answers": len(session_data.answers)
+        })
         
         answers = session_data.answers
     
         # OpenAI APIキーの設定（ヘッダー優先、次に環境変数）
-        openai.api_key = x_openai_api_key or os.getenv("OPENAI_API_KEY")
-        if not openai.api_key:
-            print("OpenAI APIキーが設定されていません - 従来の方式で生成")
+        api_key = resolve_api_key(x_openai_api_key)
+        if not api_key:
+            logger.info("OpenAI APIキーが設定されていません - 従来の方式で生成")
+            record_ai_generation("report_legacy", succeeded=False, reason="no_api_key")
             # APIキーがない場合は従来の方式で生成
             return await generate_traditional_report(session_data, current_user, db)
     
@@ -491,18 +442,28 @@ async def generate_report_from_conversation(
 """
 
         try:
-            # OpenAI APIを呼び出し
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "あなたは優秀な月報作成アシスタントです。与えられた情報をもとに、2000-3000文字の読みやすく質の高い月報を作成してください。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=4000,
-                temperature=0.7
-            )
+            # OpenAI APIを呼び出し（APIキーごとに共有する非同期クライアント）
+            messages = [
+                {"role": "system", "content": "あなたは優秀な月報作成アシスタントです。与えられた情報をもとに、2000-3000文字の読みやすく質の高い月報を作成してください。"},
+                {"role": "user", "content": prompt}
+            ]
+            async def call_openai(acquired):
+                client, permit = acquired
+                response = await client.chat.completions.create(
+                    model="gpt-4",
+                    messages=messages,
+                    max_tokens=4000,
+                    temperature=0.7
+                )
+                permit.record_usage(response.usage.total_tokens if response.usage else None)
+                return response.choices[0].message.content
             
-            ai_generated_report = response.choices[0].message.content
+            # 期限・再試行・サーキットブレーカーを適用して呼び出す（レート制限の実行枠の待ちは期限に含めない）
+            ai_generated_report = await call_with_resilience(
+                call_openai, openai_retry_policy, openai_breaker,
+                acquire=lambda: acquire_client(api_key, messages, 4000)
+            )
+            record_ai_generation("report_legacy", succeeded=True)
             
             # AIが生成した月報をデータベースに保存
             # 数値データは回答から抽出
@@ -510,14 +471,12 @@ async def generate_report_from_conversation(
             total_hours = extract_number_from_text(work_hours_text, default=160.0)
             
             income_text = answers.get("monthly_income", {}).get("answer", "")
-            received_amount = 0.0
-            for match in re.findall(r'(\d+(?:\.\d+)?)\s*万円', income_text):
-                received_amount += float(match) * 10000
+            received_amount = sum_man_yen_amounts(income_text)
             if received_amount == 0:
                 received_amount = extract_number_from_text(income_text, default=350000.0)
             
             sales_text = answers.get("sales_activities", {}).get("answer", "")
-            sales_nums = re.findall(r'\d+', sales_text)
+            sales_nums = INTEGER_PATTERN.findall(sales_text)
             sales_emails = int(sales_nums[0]) if len(sales_nums) > 0 else 40
             
             # 稼働時間の内訳（個別に指定されていない場合は0）
@@ -552,8 +511,8 @@ async def generate_report_from_conversation(
             # 月報を作成
             new_report = MonthlyReport(**report_data)
             db.add(new_report)
-            db.commit()
-            db.refresh(new_report)
+            await db.commit()
+            await db.refresh(new_report)
             
             return {
                 "message": "AI月報が正常に生成されました",
@@ -563,20 +522,18 @@ async def generate_report_from_conversation(
             }
         
         except Exception as ai_error:
-            print(f"OpenAI API エラー: {ai_error}")
+            logger.warning(f"OpenAI API エラー: {ai_error}", exc_info=ai_error)
+            record_ai_generation("report_legacy", succeeded=False, reason="error")
             # OpenAI APIでエラーが発生した場合は従来の方式にフォールバック
             return await generate_traditional_report(session_data, current_user, db)
         
     except Exception as e:
-        import traceback
-        print(f"AI生成エラー: {e}")
-        print(f"エラー詳細: {traceback.format_exc()}")
+        logger.exception(f"AI生成エラー: {e}")
         # AI生成に失敗した場合は従来の方式で生成
         try:
             return await generate_traditional_report(session_data, current_user, db)
         except Exception as e2:
-            print(f"従来の月報生成もエラー: {e2}")
-            print(f"エラー詳細: {traceback.format_exc()}")
+            logger.exception(f"従来の月報生成もエラー: {e2}")
             raise HTTPException(status_code=500, detail=f"月報生成に失敗しました: {str(e2)}")
 
 
@@ -594,16 +551,14 @@ async def generate_traditional_report(session_data: ConversationSession, current
     total_hours = extract_number_from_text(work_hours_text, default=160.0)
     
     income_text = answers.get("monthly_income", {}).get("answer", "")
-    received_amount = 0.0
-    # "35万円"のような表現を検索
-    for match in re.findall(r'(\d+(?:\.\d+)?)\s*万円', income_text):
-        received_amount += float(match) * 10000
+    # "35万円"のような表現の合計
+    received_amount = sum_man_yen_amounts(income_text)
     if received_amount == 0:
         received_amount = extract_number_from_text(income_text, default=350000.0)
     
     sales_text = answers.get("sales_activities", {}).get("answer", "")
     # 営業メール数を抽出（最初の数字）
-    sales_nums = re.findall(r'(\d+)', sales_text)
+    sales_nums = INTEGER_PATTERN.findall(sales_text)
     sales_emails = int(sales_nums[0]) if len(sales_nums) > 0 else 40
     
     # 新しい形式でのフォールバック月報を生成
@@ -611,63 +566,14 @@ async def generate_traditional_report(session_data: ConversationSession, current
     year_month = current_date.strftime("%Y年%m月")
     
     # 新しい形式の月報を手動で作成
-    ai_generated_report = f"""# {year_month} 月報
-
-お疲れ様です。{year_month}の月報をお送りします。
-
-## 📊 今月の実績概要
-
-| 項目 | 実績 | 備考 |
-|------|------|------|
-| 稼働時間 | {total_hours}時間 | 案件作業中心の活動 |
-| 収入 | {received_amount/10000:.0f}万円 | 目標に向けた着実な進歩 |
-| 営業活動 | {sales_emails}件 | 新規開拓への取り組み |
-
-## 🎯 目標達成状況
-
-**今月の目標:** {answers.get('monthly_goals', {}).get('answer', '目標設定なし')}
-
-**達成状況:** {answers.get('goal_achievement', {}).get('answer', '詳細な振り返りを実施中')}
-
-## 💼 業務内容・取り組み
-
-### 主な案件・プロジェクト
-{answers.get('monthly_activities', {}).get('answer', '継続的な業務改善に取り組んでいます')}
-
-### 営業・マーケティング活動
-{answers.get('sales_activities', {}).get('answer', '営業活動を継続的に実施')}
-
-### 学習・スキルアップ
-{answers.get('learning_highlights', {}).get('answer', '新しい技術や手法の学習を継続')}
-
-## 🏠 生活・家庭の状況
-
-{answers.get('life_changes', {}).get('answer', '家庭と仕事のバランスを大切に過ごしています')}
-
-生活バランス: {answers.get('life_balance', {}).get('answer', '適切なワークライフバランスを心がけています')}
-
-## 💡 今月の気づき・学び
-
-### 良かったこと・成長ポイント
-- {answers.get('growth_points', {}).get('answer', '継続的な成長を実感')}
-- {answers.get('happy_moments', {}).get('answer', '充実した時間を過ごすことができました')}
-
-### 課題・改善点
-- {answers.get('challenges', {}).get('answer', '今月の課題を整理中')}
-- {answers.get('discoveries', {}).get('answer', '新たな発見と改善策を模索中')}
-
-## 🚀 来月の目標・計画
-
-### 重点取り組み項目
-- {answers.get('next_month_goals', {}).get('answer', '来月の目標を具体的に設定予定')}
-
-### やめること・減らすこと
-- {answers.get('things_to_stop', {}).get('answer', '効率化のための見直しを継続')}
-
----
-
-以上、{year_month}の活動報告でした。来月もよろしくお願いいたします！
-"""
+    ai_generated_report = report_renderer.render(
+        TRADITIONAL_REPORT_TEMPLATE,
+        year_month=year_month,
+        answer=answer_texts(answers),
+        total_hours=total_hours,
+        received_amount=received_amount,
+        sales_emails=sales_emails
+    )
     
     # 稼働時間の内訳（個別に指定されていない場合は0）
     coding_hours = 0.0
@@ -703,8 +609,8 @@ async def generate_traditional_report(session_data: ConversationSession, current
     # 月報を作成
     new_report = MonthlyReport(**report_data)
     db.add(new_report)
-    db.commit()
-    db.refresh(new_report)
+    await db.commit()
+    await db.refresh(new_report)
     
     return {
         "message": "月報が正常に生成されました",
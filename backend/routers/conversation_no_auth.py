@@ -2,13 +2,16 @@
 対話型月報生成 - 認証無効版
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
 import json
 import os
-from datetime import datetime
+import sys
+import uuid
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.session_store import session_store
 
-from database import get_db, MonthlyReport
+from database import get_async_db, MonthlyReport
 from schemas import MonthlyReportCreate
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
@@ -32,9 +35,6 @@ router = APIRouter()
 # 固定ユーザーID（認証無効化のため）
 DEMO_USER_ID = 3
 
-# セッションストレージ（簡易実装）
-conversation_sessions = {}
-
 # 対話質問のテンプレート
 CONVERSATION_QUESTIONS = [
     {
@@ -105,12 +105,12 @@ CONVERSATION_QUESTIONS = [
 @router.post("/start")
 async def start_conversation(
     request: ConversationRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     対話セッションを開始（認証無効版）
     """
-    session_id = f"session_{datetime.now().timestamp()}"
+    session_id = f"session_{uuid.uuid4().hex}"
     
     session_data = {
         "session_id": session_id,
@@ -122,7 +122,7 @@ async def start_conversation(
         "is_complete": False
     }
     
-    conversation_sessions[session_id] = session_data
+    await session_store.set(session_id, session_data)
     
     first_question = CONVERSATION_QUESTIONS[0]
     
@@ -142,18 +142,18 @@ async def start_conversation(
 async def submit_answer(
     session_id: str,
     answer: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     回答を送信して次の質問を取得（認証無効版）
     """
-    if session_id not in conversation_sessions:
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="セッションが見つかりません"
         )
     
-    session = conversation_sessions[session_id]
     current_index = session["current_question_index"]
     current_question = session["questions"][current_index]
     
@@ -177,6 +177,7 @@ async def submit_answer(
     # 全質問完了チェック
     if session["current_question_index"] >= len(session["questions"]):
         session["is_complete"] = True
+        await session_store.set(session_id, session)
         return ConversationResponse(
             session_id=session_id,
             question=None,
@@ -188,6 +189,8 @@ async def submit_answer(
             is_complete=True
         )
     
+    await session_store.set(session_id, session)
+    
     # 次の質問を返す
     next_question = session["questions"][session["current_question_index"]]
     
@@ -206,18 +209,18 @@ async def submit_answer(
 @router.post("/generate-report")
 async def generate_report(
     session_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     対話内容から月報を生成（認証無効版）
     """
-    if session_id not in conversation_sessions:
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="セッションが見つかりません"
         )
     
-    session = conversation_sessions[session_id]
     
     if not session["is_complete"]:
         raise HTTPException(
@@ -237,11 +240,11 @@ async def generate_report(
     )
     
     db.add(new_report)
-    db.commit()
-    db.refresh(new_report)
+    await db.commit()
+    await db.refresh(new_report)
     
     # セッション削除
-    del conversation_sessions[session_id]
+    await session_store.delete(session_id)
     
     return {
         "message": "月報が作成されました",
@@ -254,13 +257,13 @@ async def get_session_info(session_id: str):
     """
     セッション情報を取得（認証無効版）
     """
-    if session_id not in conversation_sessions:
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="セッションが見つかりません"
         )
     
-    session = conversation_sessions[session_id]
     
     return {
         "session_id": session_id,
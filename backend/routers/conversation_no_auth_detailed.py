@@ -3,21 +3,38 @@
 元のconversation.pyの機能を認証無効版として実装
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
-from typing import Dict, Any, Optional
+from fastapi.responses import StreamingResponse, JSONResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
 import os
-from datetime import datetime
 import re
 import sys
-import os
+import time
+import uuid
+from functools import lru_cache
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.date_utils import get_report_month
-
-from database import get_db, MonthlyReport
-from schemas import MonthlyReportCreate
+from utils.session_store import session_store
+from utils.number_extraction import extract_answer_numbers
+from utils.openai_client import acquire_client, resolve_api_key, chat_completion
+from utils.llm_cache import llm_cache, make_cache_key
+from utils.job_queue import job_queue
+from utils.resilience import openai_breaker
+from utils.metrics import record_ai_generation
+from utils.query_counter import query_budget
+from utils.tracing import tracer, current_request_id, set_request_id, reset_request_id, request_id_headers
+from utils.report_renderer import (
+    report_renderer, answer_texts, FALLBACK_REPORT_TEMPLATE, REPORT_PROMPT_TEMPLATE
+)
+from utils.token_budget import (
+    estimate_messages_tokens, budget_answers, answers_token_budget, answer_token_limit, token_usage
+)
+from utils.logger import get_logger
+
+from database import get_async_db, AsyncSessionLocal, MonthlyReport, GenerationJob
 from pydantic import BaseModel
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, NamedTuple, Tuple
 
 class ConversationRequest(BaseModel):
     report_month: str
@@ -40,64 +57,11 @@ class QuestionResponse(BaseModel):
     session_data: Dict[str, Any]
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # 固定ユーザーID（認証無効化のため）
 DEMO_USER_ID = 3
 
-# セッションストレージ（簡易実装）
-conversation_sessions = {}
-
-def extract_number_from_text(text: str, default: Union[int, float] = 0) -> Union[int, float]:
-    """
-    日本語テキストから数値を抽出する
-    """
-    if not text or not isinstance(text, str):
-        return default
-    
-    # 「万」「千」などの単位を先に処理
-    unit_patterns = [
-        (r'([0-9０-９]+(?:\.[0-9０-９]+)?)\s*万', 10000),
-        (r'([0-9０-９]+(?:\.[0-9０-９]+)?)\s*千', 1000),
-        (r'([0-9０-９]+(?:\.[0-9０-９]+)?)\s*百', 100),
-    ]
-    
-    for pattern, multiplier in unit_patterns:
-        match = re.search(pattern, text)
-        if match:
-            number_str = match.group(1)
-            # 全角を半角に変換
-            trans_table = str.maketrans('０１２３４５６７８９', '0123456789')
-            number_str = number_str.translate(trans_table)
-            try:
-                base_number = float(number_str)
-                result = base_number * multiplier
-                return int(result) if result == int(result) else result
-            except ValueError:
-                continue
-    
-    # 通常の数値パターンを検索
-    patterns = [
-        r'[0-9０-９]+(?:[,，][0-9０-９]+)*(?:\.[0-9０-９]+)?',
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text)
-        if matches:
-            number_str = matches[0]
-            trans_table = str.maketrans('０１２３４５６７８９，', '0123456789,')
-            number_str = number_str.translate(trans_table)
-            number_str = number_str.replace(',', '')
-            
-            try:
-                if '.' in number_str:
-                    return float(number_str)
-                else:
-                    return int(number_str)
-            except ValueError:
-                continue
-    
-    return default
-
 # 詳細な質問フロー（元のconversation.pyから）
 QUESTION_FLOW = {
     "vision_values": {
@@ -263,341 +227,285 @@ QUESTION_FLOW = {
     }
 }
 
+class CompiledQuestion(NamedTuple):
+    """通し番号付きの質問（QUESTION_FLOWをフラット化したもの）"""
+    position: int  # 全体での0始まりの通し番号
+    category: str
+    index: int  # カテゴリ内での0始まりの番号
+    question: Dict[str, Any]
+
+def compile_question_flow(flow: Dict[str, Any]):
+    """
+    QUESTION_FLOWをorder順のフラットな質問表に変換
+
+    Returns:
+        (質問表, 質問ID→通し番号, カテゴリ→先頭の通し番号)
+    """
+    table = []
+    id_to_position = {}
+    category_start = {}
+    for category in sorted(flow, key=lambda name: flow[name]["order"]):
+        category_start[category] = len(table)
+        for index, question in enumerate(flow[category]["questions"]):
+            id_to_position[question["id"]] = len(table)
+            table.append(CompiledQuestion(len(table), category, index, question))
+    return tuple(table), id_to_position, category_start
+
+# 起動時に一度だけ構築する質問ナビゲーション用インデックス
+QUESTION_TABLE, QUESTION_POSITION, CATEGORY_START = compile_question_flow(QUESTION_FLOW)
+TOTAL_QUESTIONS = len(QUESTION_TABLE)
+
+def get_question_at(position: int) -> Optional[CompiledQuestion]:
+    """通し番号の質問を取得（範囲外はNone）"""
+    if 0 <= position < TOTAL_QUESTIONS:
+        return QUESTION_TABLE[position]
+    return None
+
+def get_session_position(session: Dict[str, Any]) -> int:
+    """セッションの現在の質問の通し番号"""
+    return CATEGORY_START[session["current_category"]] + session["current_question_index"]
+
+def get_next_question(position: int) -> Optional[CompiledQuestion]:
+    """次の質問（最後の質問の場合はNone）"""
+    return get_question_at(position + 1)
+
+def get_previous_question(position: int) -> Optional[CompiledQuestion]:
+    """前の質問（最初の質問の場合はNone）"""
+    return get_question_at(position - 1)
+
 @router.post("/start")
+@query_budget(3)
 async def start_conversation(
     request: ConversationRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     対話セッションを開始（認証無効版）
     """
-    session_id = f"session_{datetime.now().timestamp()}"
+    session_id = f"session_{uuid.uuid4().hex}"
     
     # 最初の質問を取得
-    first_category = min(QUESTION_FLOW.keys(), key=lambda x: QUESTION_FLOW[x]["order"])
-    first_question = QUESTION_FLOW[first_category]["questions"][0]
+    first = QUESTION_TABLE[0]
+    first_question = first.question
     
     session_data = {
         "session_id": session_id,
         "user_id": DEMO_USER_ID,
         "report_month": request.report_month,
-        "current_category": first_category,
-        "current_question_index": 0,
+        "current_category": first.category,
+        "current_question_index": first.index,
         "answers": {},
         "completed_categories": []
     }
     
-    conversation_sessions[session_id] = session_data
+    await session_store.set(session_id, session_data)
     
     return ConversationResponse(
         session_id=session_id,
         question=first_question["question"],
         question_type=first_question["type"],
-        category=first_category,
+        category=first.category,
         progress=1,
-        total_questions=sum(len(cat["questions"]) for cat in QUESTION_FLOW.values()),
+        total_questions=TOTAL_QUESTIONS,
         session_data=session_data,
         example=first_question.get("example", None),
         is_complete=False
     )
 
 @router.post("/answer")
+@query_budget(3)
 async def submit_answer(
     answer_data: QuestionResponse,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     回答を送信して次の質問を取得（認証無効版）
     """
     session_id = answer_data.session_id
+    session = await session_store.get(session_id)
     
-    if session_id not in conversation_sessions:
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="セッションが見つかりません"
         )
     
-    session = conversation_sessions[session_id]
-    current_category = session["current_category"]
-    current_question_index = session["current_question_index"]
-    
     # 現在の質問情報を取得
-    current_questions = QUESTION_FLOW[current_category]["questions"]
-    current_question = current_questions[current_question_index]
+    current = QUESTION_TABLE[get_session_position(session)]
     
     # 回答を保存
-    session["answers"][current_question["id"]] = {
+    session["answers"][current.question["id"]] = {
         "answer": answer_data.answer,
         "additional_context": answer_data.additional_context
     }
     
     # 次の質問を決定
-    next_question_index = current_question_index + 1
+    following = get_next_question(current.position)
+    
+    if following is None:
+        # すべての質問が完了
+        session["completed_categories"].append(current.category)
+        session["is_complete"] = True
+        await session_store.set(session_id, session)
+        return ConversationResponse(
+            session_id=session_id,
+            question=None,
+            question_type="completed",
+            category="completed",
+            progress=TOTAL_QUESTIONS,
+            total_questions=TOTAL_QUESTIONS,
+            session_data=session,
+            is_complete=True
+        )
     
-    # 現在のカテゴリに次の質問があるか確認
-    if next_question_index < len(current_questions):
-        next_question = current_questions[next_question_index]
-        session["current_question_index"] = next_question_index
-    else:
+    if following.category != current.category:
         # 現在のカテゴリが完了、次のカテゴリへ
-        session["completed_categories"].append(current_category)
-        
-        # 次のカテゴリを見つける
-        remaining_categories = [
-            cat for cat in QUESTION_FLOW.keys() 
-            if cat not in session["completed_categories"]
-        ]
-        
-        if remaining_categories:
-            next_category = min(remaining_categories, key=lambda x: QUESTION_FLOW[x]["order"])
-            next_question = QUESTION_FLOW[next_category]["questions"][0]
-            session["current_category"] = next_category
-            session["current_question_index"] = 0
-        else:
-            # すべての質問が完了
-            session["is_complete"] = True
-            return ConversationResponse(
-                session_id=session_id,
-                question=None,
-                question_type="completed",
-                category="completed",
-                progress=sum(len(cat["questions"]) for cat in QUESTION_FLOW.values()),
-                total_questions=sum(len(cat["questions"]) for cat in QUESTION_FLOW.values()),
-                session_data=session,
-                is_complete=True
-            )
+        session["completed_categories"].append(current.category)
+    session["current_category"] = following.category
+    session["current_question_index"] = following.index
+    
+    await session_store.set(session_id, session)
     
-    current_progress = len([
-        q for cat in session["completed_categories"] 
-        for q in QUESTION_FLOW[cat]["questions"]
-    ]) + session["current_question_index"] + 1
+    next_question = following.question
     
     return ConversationResponse(
         session_id=session_id,
         question=next_question["question"],
         question_type=next_question["type"],
-        category=session["current_category"],
-        progress=current_progress,
-        total_questions=sum(len(cat["questions"]) for cat in QUESTION_FLOW.values()),
+        category=following.category,
+        progress=following.position + 1,
+        total_questions=TOTAL_QUESTIONS,
         session_data=session,
         example=next_question.get("example", None),
         is_complete=False
     )
 
-@router.post("/generate-report")
-async def generate_report(
-    session_data: Dict[str, Any],
-    db: Session = Depends(get_db),
-    x_openai_api_key: Optional[str] = Header(None)
-):
+# 月報生成プロンプトの版（プロンプトやメッセージを変更したら上げる。LLM応答キャッシュのキーに含まれる）
+REPORT_PROMPT_VERSION = "detailed-report-v2"
+
+# 月報生成の呼び出しパラメータ
+REPORT_MODEL = "gpt-4"
+REPORT_COMPLETION_PARAMS = {"max_tokens": 4000, "temperature": 0.7}
+
+# プロンプトに含める回答（見出し, [(質問ID, ラベル), ...]）
+REPORT_PROMPT_SECTIONS = [
+    ("目指しているゴール・理想の生活", [
+        ("ideal_lifestyle", "理想の暮らし・働き方"),
+        ("core_values", "普段大事にしていること"),
+        ("ideal_daily_life", "理想の未来像"),
+    ]),
+    ("今月の目標と実績", [
+        ("monthly_goals", "今月の目標"),
+        ("goal_achievement", "目標達成状況"),
+    ]),
+    ("今月の業務内容・取り組み・学び", [
+        ("monthly_activities", "今月やったこと"),
+        ("project_details", "案件で印象に残ったこと"),
+        ("sales_activities", "営業活動と反応"),
+        ("learning_highlights", "学びで良かったこと"),
+    ]),
+    ("稼働時間・収入", [
+        ("work_hours", "稼働時間"),
+        ("monthly_income", "収入"),
+    ]),
+    ("今月の状況・家庭のこと", [
+        ("life_changes", "家庭や生活の変化"),
+        ("life_balance", "生活バランス"),
+        ("roles_responsibilities", "役割"),
+    ]),
+    ("課題・改善点・気づき・成果", [
+        ("challenges", "大変だったこと・困ったこと"),
+        ("discoveries", "気づいたこと・改善点"),
+        ("growth_points", "成長したこと"),
+        ("happy_moments", "嬉しかったこと"),
+    ]),
+    ("来月の目標・取り組み予定", [
+        ("next_month_goals", "来月の目標"),
+        ("things_to_stop", "やらないと決めたこと"),
+    ]),
+]
+
+def render_report_prompt(sections: List[Tuple[str, List[Tuple[str, str]]]], year_month: str) -> str:
     """
-    対話内容から月報を生成（認証無効版）
+    整理済みの回答データ（見出し, [(ラベル, 回答), ...]）を月報生成プロンプトのテンプレートに埋め込む
     """
-    # セッションIDからセッションデータを取得
-    if isinstance(session_data, dict) and "session_id" in session_data:
-        session_id = session_data["session_id"]
-        if session_id in conversation_sessions:
-            session = conversation_sessions[session_id]
-        else:
-            session = session_data
-    else:
-        session = session_data
-    
-    answers = session.get("answers", {})
-    
-    # AI生成を試みる
-    try:
-        if x_openai_api_key or os.getenv("OPENAI_API_KEY"):
-            import openai
-            
-            # OpenAI APIキーの設定
-            openai.api_key = x_openai_api_key or os.getenv("OPENAI_API_KEY")
-            
-            # 月報の対象月を決定
-            report_month = get_report_month()
-            year, month = report_month.split('-')
-            year_month = f"{year}年{int(month)}月"
-            
-            # 回答データを整理
-            qa_text = ""
-            
-            # 1. ビジョン・価値観
-            qa_text += "【目指しているゴール・理想の生活】\n"
-            qa_text += f"理想の暮らし・働き方: {answers.get('ideal_lifestyle', {}).get('answer', '')}\n"
-            qa_text += f"普段大事にしていること: {answers.get('core_values', {}).get('answer', '')}\n"
-            qa_text += f"理想の未来像: {answers.get('ideal_daily_life', {}).get('answer', '')}\n\n"
-            
-            # 2. 目標と実績
-            qa_text += "【今月の目標と実績】\n"
-            qa_text += f"今月の目標: {answers.get('monthly_goals', {}).get('answer', '')}\n"
-            qa_text += f"目標達成状況: {answers.get('goal_achievement', {}).get('answer', '')}\n\n"
-            
-            # 3. 業務内容
-            qa_text += "【今月の業務内容・取り組み・学び】\n"
-            qa_text += f"今月やったこと: {answers.get('monthly_activities', {}).get('answer', '')}\n"
-            qa_text += f"案件で印象に残ったこと: {answers.get('project_details', {}).get('answer', '')}\n"
-            qa_text += f"営業活動と反応: {answers.get('sales_activities', {}).get('answer', '')}\n"
-            qa_text += f"学びで良かったこと: {answers.get('learning_highlights', {}).get('answer', '')}\n\n"
-            
-            # 4. 時間・収入
-            qa_text += "【稼働時間・収入】\n"
-            qa_text += f"稼働時間: {answers.get('work_hours', {}).get('answer', '')}\n"
-            qa_text += f"収入: {answers.get('monthly_income', {}).get('answer', '')}\n\n"
-            
-            # 5. 生活バランス
-            qa_text += "【今月の状況・家庭のこと】\n"
-            qa_text += f"家庭や生活の変化: {answers.get('life_changes', {}).get('answer', '')}\n"
-            qa_text += f"生活バランス: {answers.get('life_balance', {}).get('answer', '')}\n"
-            qa_text += f"役割: {answers.get('roles_responsibilities', {}).get('answer', '')}\n\n"
-            
-            # 6. 振り返り
-            qa_text += "【課題・改善点・気づき・成果】\n"
-            qa_text += f"大変だったこと・困ったこと: {answers.get('challenges', {}).get('answer', '')}\n"
-            qa_text += f"気づいたこと・改善点: {answers.get('discoveries', {}).get('answer', '')}\n"
-            qa_text += f"成長したこと: {answers.get('growth_points', {}).get('answer', '')}\n"
-            qa_text += f"嬉しかったこと: {answers.get('happy_moments', {}).get('answer', '')}\n\n"
-            
-            # 7. 来月
-            qa_text += "【来月の目標・取り組み予定】\n"
-            qa_text += f"来月の目標: {answers.get('next_month_goals', {}).get('answer', '')}\n"
-            qa_text += f"やらないと決めたこと: {answers.get('things_to_stop', {}).get('answer', '')}\n"
-            
-            # AI生成プロンプト（新フォーマット用）
-            prompt = f"""
-あなたは優秀な月報作成アシスタントです。以下の質問と回答から、{year_month}の月報を生成してください。
-
-【重要な指示】
-- 対象月は{year_month}です
-- タイトルには必ず「# 月報：{year_month}」を使用
-- 2025年06月や他の年月は絶対に使用しない
-- 現在日時に関係なく、指定された{year_month}の月報として作成
+    return report_renderer.render(REPORT_PROMPT_TEMPLATE, sections=sections, year_month=year_month)
 
-## 回答データ:
-{qa_text}
+@lru_cache(maxsize=32)
+def report_prompt_template_tokens(year_month: str) -> int:
+    """回答を除いたプロンプト（テンプレート + システムメッセージ）のトークン数"""
+    return estimate_messages_tokens(report_messages(render_report_prompt([], year_month)))
 
-## 出力要件:
-- 対象月: {year_month} (厳守)
-- 文字数: 基本は2000-3000文字
-- 形式: Markdown（Notion互換）
-- 語調: 丁寧で親しみやすい
-- 絵文字: 見出しの先頭に1つずつ配置
-- 箇条書き: 積極的に使用して読みやすく
-- 感情・背景: 事実に基づいて適切に追加
-
-## 必須出力フォーマット（この順序と形式を厳守）:
-
-# 月報：{year_month}
-
-お疲れ様です。{year_month}分の月報を提出します。以下に今月の状況、実績、取り組み、気づき、来月の目標をまとめましたので、ご確認ください。
-
----
-
-## 🏠 今月の状況・家庭のこと
-
-[家庭や生活での出来事、変化を箇条書きで記載。感情や影響も含める]
-
----
-
-## 🎯 目指しているゴール・理想の生活
-
-[理想の暮らし・働き方・価値観を箇条書きで記載]
-
----
-
-## 📊 今月の目標と実績
-
-[まず今月の目標と達成状況を文章で記載]
-
-| 項目 | 実績 | 補足 |
-| --- | --- | --- |
-| 稼働時間 | [回答から抽出]時間 | 内訳（案件・営業・学び）を含む |
-| 営業件数 | [回答から抽出]件 | 新規・継続の内訳、反応状況も含む |
-| 受注額 | [回答から抽出]万円 | 案件内容・外注の有無を含む |
-
----
-
-## 💼 今月の業務内容・取り組み・学び
-
-[業務内容、プロジェクト詳細、営業活動、学習内容をすべて箇条書きで記載]
-
----
-
-## 💡 課題・改善点・気づき
-
-[課題や困ったこと、気づきを箇条書きで記載。「だから来月は〜する」という改善アクションも含める]
-
----
-
-## 🌟 今月の成果・成長ポイント
-
-[できたこと、成長したこと、嬉しかったことを箇条書きで記載]
-
----
+def build_report_prompt(answers: Dict[str, Any], year_month: str) -> str:
+    """
+    回答データから月報生成用のプロンプトを作成
 
-## 🚀 来月の目標・取り組み予定
+    空の回答は除き、長すぎる回答はコンテキスト長に収まるよう中略する
+    """
+    budget = answers_token_budget(report_prompt_template_tokens(year_month), REPORT_COMPLETION_PARAMS["max_tokens"])
+    raw_answers = {
+        question_id: answers.get(question_id, {}).get("answer", "")
+        for _, items in REPORT_PROMPT_SECTIONS
+        for question_id, _ in items
+    }
+    budgeted, report = budget_answers(raw_answers, answer_token_limit(), budget)
+    if report["trimmed"]:
+        logger.info("プロンプト予算に合わせて回答を中略しました", extra={
+            "tokens_before": report["tokens_before"],
+            "tokens_after": report["tokens_after"],
+            "budget": report["budget"],
+            "trimmed": report["trimmed"]
+        })
+    
+    # 回答データを整理（回答のない項目・見出しは省く）
+    sections = []
+    for heading, items in REPORT_PROMPT_SECTIONS:
+        lines = [(label, budgeted[question_id]) for question_id, label in items if question_id in budgeted]
+        if lines:
+            sections.append((heading, lines))
+    
+    return render_report_prompt(sections, year_month)
+
+def report_messages(prompt: str) -> List[Dict[str, str]]:
+    """月報生成のためのChat Completionsメッセージ"""
+    return [
+        {"role": "system", "content": "あなたは優秀な月報作成アシスタントです。"},
+        {"role": "user", "content": prompt}
+    ]
 
-[来月の目標、注力すること、新しく試すこと、やめることを箇条書きで記載]
+def fix_report_title(report: str, year_month: str) -> str:
+    """
+    タイトル形式の後処理修正（対象月のタイトルになっていなければ置換）
+    """
+    if not report.startswith(f"# 月報：{year_month}"):
+        # 既存のタイトル行を置換
+        report = re.sub(r'^#.*?\n', f'# 月報：{year_month}\n', report, count=1)
+    return report
 
----
+async def resolve_session(session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    リクエストのセッションIDから保存済みのセッションを取得（なければリクエスト内容をそのまま使う）
+    """
+    if isinstance(session_data, dict) and "session_id" in session_data:
+        stored_session = await session_store.get(session_data["session_id"])
+        return stored_session if stored_session is not None else session_data
+    return session_data
+
+async def save_generated_report(
+    db: AsyncSession,
+    session: Dict[str, Any],
+    report_month: str,
+    numbers: Dict[str, Any],
+    content: str,
+    job_id: Optional[str] = None
+) -> MonthlyReport:
+    """
+    生成した月報を保存し、セッションを削除する
 
-以上となります。来月もどうぞよろしくお願いいたします。
-"""
-            
-            # OpenAI APIを呼び出し（新しいAPI形式）
-            from openai import OpenAI
-            client = OpenAI(api_key=x_openai_api_key or os.getenv("OPENAI_API_KEY"))
-            
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "あなたは優秀な月報作成アシスタントです。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=4000,
-                temperature=0.7
-            )
-            
-            ai_generated_report = response.choices[0].message.content
-        else:
-            # AIキーがない場合はフォールバック
-            ai_generated_report = await generate_fallback_report(answers)
-            
-    except Exception as e:
-        print(f"AI生成エラー: {e}")
-        ai_generated_report = await generate_fallback_report(answers)
-    
-    # タイトル形式の後処理修正
-    if not ai_generated_report.startswith(f"# 月報：{year_month}"):
-        # 既存のタイトル行を置換
-        ai_generated_report = re.sub(r'^#.*?\n', f'# 月報：{year_month}\n', ai_generated_report, count=1)
-    
-    # 数値データの抽出
-    work_hours_text = answers.get("work_hours", {}).get("answer", "")
-    total_hours = extract_number_from_text(work_hours_text, default=160.0)
-    
-    income_text = answers.get("monthly_income", {}).get("answer", "")
-    received_amount = 0.0
-    
-    # 「合計」または最初の金額を取得（合計しない）
-    if "合計" in income_text:
-        total_match = re.search(r'合計\s*(\d+(?:\.\d+)?)\s*万円', income_text)
-        if total_match:
-            received_amount = float(total_match.group(1)) * 10000
-    else:
-        # 合計がない場合は最初の金額のみ使用
-        first_match = re.search(r'(\d+(?:\.\d+)?)\s*万円', income_text)
-        if first_match:
-            received_amount = float(first_match.group(1)) * 10000
-    
-    # 金額が見つからない場合は0円
-    if received_amount == 0:
-        received_amount = 0.0
-    
-    sales_text = answers.get("sales_activities", {}).get("answer", "")
-    sales_nums = re.findall(r'\d+', sales_text)
-    sales_emails = int(sales_nums[0]) if len(sales_nums) > 0 else 40
-    sales_replies = int(sales_nums[1]) if len(sales_nums) > 1 else 0
-    sales_meetings = int(sales_nums[2]) if len(sales_nums) > 2 else 0
+    ジョブから呼ぶ場合は、月報のIDを同じトランザクションでジョブにも記録する
+    （保存後にプロセスが停止してジョブが再実行されても、月報を二重に保存しない）
+    """
+    answers = session.get("answers", {})
     
     # 常に新規月報として作成（重複保存を許可）
     session_id = session.get("session_id", "")
@@ -607,17 +515,17 @@ async def generate_report(
         "report_month": report_month,
         "current_phase": answers.get("ideal_lifestyle", {}).get("answer", ""),
         "family_status": answers.get("life_changes", {}).get("answer", ""),
-        "total_work_hours": total_hours,
+        "total_work_hours": numbers["total_work_hours"],
         "coding_hours": 0.0,
         "meeting_hours": 0.0,
         "sales_hours": 0.0,
-        "sales_emails_sent": sales_emails,
-        "sales_replies": sales_replies,
-        "sales_meetings": sales_meetings,
+        "sales_emails_sent": numbers["sales_emails_sent"],
+        "sales_replies": numbers["sales_replies"],
+        "sales_meetings": numbers["sales_meetings"],
         "contracts_signed": 0,
-        "received_amount": received_amount,
-        "delivered_amount": received_amount,
-        "good_points": ai_generated_report,
+        "received_amount": numbers["received_amount"],
+        "delivered_amount": numbers["received_amount"],
+        "good_points": content,
         "challenges": answers.get("challenges", {}).get("answer", ""),
         "improvements": "",
         "next_month_goals": answers.get("next_month_goals", {}).get("answer", "")
@@ -626,163 +534,296 @@ async def generate_report(
     # 新規月報作成（常に新規として保存）
     new_report = MonthlyReport(**report_data)
     db.add(new_report)
-    db.commit()
-    db.refresh(new_report)
+    if job_id is not None:
+        await db.flush()
+        await db.execute(
+            update(GenerationJob).where(GenerationJob.id == job_id).values(report_id=new_report.id)
+        )
+    with tracer.span("db.commit"):
+        await db.commit()
+    await db.refresh(new_report)
     
     # セッション削除
-    if session_id in conversation_sessions:
-        del conversation_sessions[session_id]
+    if session_id:
+        await session_store.delete(session_id)
     
-    return {
-        "message": "月報が作成されました",
-        "report_id": new_report.id,
-        "report_month": new_report.report_month,
-        "ai_generated_content": ai_generated_report
-    }
+    return new_report
 
-async def generate_fallback_report(answers: Dict[str, Any]) -> str:
+async def generate_and_save_report(
+    db: AsyncSession,
+    session: Dict[str, Any],
+    api_key: Optional[str],
+    job_id: Optional[str] = None
+):
     """
-    フォールバック月報生成（AIキーがない場合）
+    セッションの回答から月報を生成して保存し、(保存した月報, 月報本文) を返す
     """
-    # 15日基準で月報の月を決定
+    answers = session.get("answers", {})
+    
+    # 月報の対象月を決定
     report_month = get_report_month()
     year, month = report_month.split('-')
     year_month = f"{year}年{int(month)}月"
     
-    # 数値データの抽出
-    work_hours_text = answers.get("work_hours", {}).get("answer", "")
-    total_hours = extract_number_from_text(work_hours_text, default=160.0)
+    # 数値データの抽出（AI生成・フォールバック・保存で共用）
+    with tracer.span("report.extract_numbers"):
+        numbers = extract_answer_numbers(answers)
     
-    income_text = answers.get("monthly_income", {}).get("answer", "")
-    received_amount = 0.0
-    
-    # 「合計」または最初の金額を取得（合計しない）
-    if "合計" in income_text:
-        total_match = re.search(r'合計\s*(\d+(?:\.\d+)?)\s*万円', income_text)
-        if total_match:
-            received_amount = float(total_match.group(1)) * 10000
-    else:
-        # 合計がない場合は最初の金額のみ使用
-        first_match = re.search(r'(\d+(?:\.\d+)?)\s*万円', income_text)
-        if first_match:
-            received_amount = float(first_match.group(1)) * 10000
-    
-    # 金額が見つからない場合は0円
-    if received_amount == 0:
-        received_amount = 0.0
+    # AI生成を試みる
+    try:
+        if api_key:
+            with tracer.span("report.build_prompt"):
+                prompt = build_report_prompt(answers, year_month)
+            
+            # OpenAI APIを呼び出し（同じ回答からの再生成はLLM応答キャッシュから返す）
+            ai_generated_report = await chat_completion(
+                api_key,
+                model=REPORT_MODEL,
+                messages=report_messages(prompt),
+                template_version=REPORT_PROMPT_VERSION,
+                **REPORT_COMPLETION_PARAMS
+            )
+            record_ai_generation("report", succeeded=True)
+        else:
+            # AIキーがない場合はフォールバック
+            ai_generated_report = await generate_fallback_report(answers, numbers)
+            record_ai_generation("report", succeeded=False, reason="no_api_key")
+            
+    except Exception as e:
+        logger.warning(f"AI生成エラー: {e}", exc_info=e)
+        ai_generated_report = await generate_fallback_report(answers, numbers)
+        record_ai_generation("report", succeeded=False, reason="error")
     
-    sales_text = answers.get("sales_activities", {}).get("answer", "")
-    sales_nums = re.findall(r'\d+', sales_text)
-    sales_emails = int(sales_nums[0]) if len(sales_nums) > 0 else 40
+    # タイトル形式の後処理修正
+    ai_generated_report = fix_report_title(ai_generated_report, year_month)
     
-    return f"""# 月報：{year_month}
-
-お疲れ様です。{year_month}分の月報を提出します。以下に今月の状況、実績、取り組み、気づき、来月の目標をまとめましたので、ご確認ください。
-
----
+    with tracer.span("report.save"):
+        new_report = await save_generated_report(db, session, report_month, numbers, ai_generated_report, job_id)
+    return new_report, ai_generated_report
 
-## 🏠 今月の状況・家庭のこと
+# バックグラウンドジョブの種類（月報生成）
+REPORT_JOB_KIND = "conversation_report"
 
-- {answers.get('life_changes', {}).get('answer', '家庭と仕事のバランスを大切に過ごしています')}
-- 生活バランス: {answers.get('life_balance', {}).get('answer', '適切なワークライフバランスを心がけています')}
-- 役割: {answers.get('roles_responsibilities', {}).get('answer', '家庭や仕事での責任を果たしています')}
-
----
-
-## 🎯 目指しているゴール・理想の生活
-
-- {answers.get('ideal_lifestyle', {}).get('answer', '理想の生活を目指して日々努力しています')}
-- {answers.get('core_values', {}).get('answer', '大切にしている価値観を意識しています')}
-- {answers.get('ideal_daily_life', {}).get('answer', '理想の未来に向けて着実に進んでいます')}
-
----
-
-## 📊 今月の目標と実績
-
-**今月の目標**: {answers.get('monthly_goals', {}).get('answer', '目標設定なし')}
-
-**達成状況**: {answers.get('goal_achievement', {}).get('answer', '詳細な振り返りを実施中')}
-
-| 項目 | 実績 | 補足 |
-| --- | --- | --- |
-| 稼働時間 | {total_hours}時間 | 案件作業中心の活動 |
-| 営業件数 | {sales_emails}件 | 新規開拓への取り組み |
-| 受注額 | {received_amount/10000:.0f}万円 | 目標に向けた着実な進歩 |
-
----
-
-## 💼 今月の業務内容・取り組み・学び
-
-**主な活動**:
-- {answers.get('monthly_activities', {}).get('answer', '継続的な業務改善に取り組んでいます')}
-
-**案件の詳細**:
-- {answers.get('project_details', {}).get('answer', '各案件で着実な成果を上げています')}
-
-**営業活動**:
-- {answers.get('sales_activities', {}).get('answer', '営業活動を継続的に実施')}
-
-**学習・スキルアップ**:
-- {answers.get('learning_highlights', {}).get('answer', '新しい技術や手法の学習を継続')}
-
----
-
-## 💡 課題・改善点・気づき
-
-**今月の課題**:
-- {answers.get('challenges', {}).get('answer', '今月の課題を整理中')}
-
-**気づき・改善策**:
-- {answers.get('discoveries', {}).get('answer', '新たな発見と改善策を模索中')}
-
----
+async def run_report_job(job_id: str, payload: Dict[str, Any], secrets: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    月報生成ジョブのハンドラー
 
-## 🌟 今月の成果・成長ポイント
+    ヘッダーで受け取ったAPIキーを失ったジョブはジョブキューが失敗にするため、ここには来ない。
+    前回の実行で月報を保存済みの場合（保存後に停止して再実行された場合）は、生成し直さずにその月報を返す
+    """
+    # 登録したリクエストのIDを引き継ぐ（スパンはジョブ単位の別のトレースになる）
+    request_id_token = set_request_id(payload.get("request_id"))
+    try:
+        with tracer.span("job.conversation_report"):
+            async with AsyncSessionLocal() as db:
+                saved_report_id = await db.scalar(select(GenerationJob.report_id).where(GenerationJob.id == job_id))
+                new_report = await db.get(MonthlyReport, saved_report_id) if saved_report_id else None
+                if new_report is None:
+                    new_report, _ = await generate_and_save_report(
+                        db, payload["session"], resolve_api_key(secrets.get("api_key")), job_id
+                    )
+    finally:
+        reset_request_id(request_id_token)
+    return {"report_id": new_report.id, "report_month": new_report.report_month}
+
+job_queue.register(REPORT_JOB_KIND, run_report_job)
 
-- {answers.get('growth_points', {}).get('answer', '継続的な成長を実感')}
-- {answers.get('happy_moments', {}).get('answer', '充実した時間を過ごすことができました')}
+@router.post("/generate-report")
+@query_budget(4)
+async def generate_report(
+    session_data: Dict[str, Any],
+    async_mode: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    x_openai_api_key: Optional[str] = Header(None)
+):
+    """
+    対話内容から月報を生成（認証無効版）
 
----
+    async_mode=true の場合は生成をジョブとして登録して即座に202を返す。
+    結果は GET /api/jobs/{job_id} で確認する
+    """
+    # セッションIDからセッションデータを取得
+    session = await resolve_session(session_data)
+    
+    if async_mode:
+        job_id = await job_queue.enqueue(
+            REPORT_JOB_KIND,
+            {"session": session, "request_id": current_request_id()},
+            secrets={"api_key": x_openai_api_key} if x_openai_api_key else None
+        )
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}
+        )
+    
+    new_report, ai_generated_report = await generate_and_save_report(
+        db, session, resolve_api_key(x_openai_api_key)
+    )
+    
+    return {
+        "message": "月報が作成されました",
+        "report_id": new_report.id,
+        "report_month": new_report.report_month,
+        "ai_generated_content": ai_generated_report
+    }
 
-## 🚀 来月の目標・取り組み予定
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Events の1イベント分の文字列"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-**重点目標**:
-- {answers.get('next_month_goals', {}).get('answer', '来月の目標を具体的に設定予定')}
+@router.post("/generate-report/stream")
+@query_budget(4)
+async def generate_report_stream(
+    session_data: Dict[str, Any],
+    x_openai_api_key: Optional[str] = Header(None)
+):
+    """
+    対話内容から月報を生成し、生成途中のテキストをServer-Sent Eventsで返す（認証無効版）
 
-**やめること・減らすこと**:
-- {answers.get('things_to_stop', {}).get('answer', '効率化のための見直しを継続')}
+    イベント:
+        delta : {"content": 追加されたテキスト}
+        reset : {"reason": ...} AI生成が途中で失敗し、フォールバック月報に切り替える（表示中のテキストを破棄）
+        done  : {"report_id", "report_month", "ai_generated_content"} 保存後の最終イベント。
+                ai_generated_content はタイトル修正などの後処理済みの全文
+    """
+    # セッションIDからセッションデータを取得
+    session = await resolve_session(session_data)
+    
+    answers = session.get("answers", {})
+    
+    # 月報の対象月を決定
+    report_month = get_report_month()
+    year, month = report_month.split('-')
+    year_month = f"{year}年{int(month)}月"
+    
+    api_key = resolve_api_key(x_openai_api_key)
+    
+    async def event_stream():
+        chunks = []
+        fallback_reason = "no_api_key" if not api_key else "empty_response"
+        try:
+            if api_key:
+                with tracer.span("report.build_prompt"):
+                    messages = report_messages(build_report_prompt(answers, year_month))
+                cache_key = make_cache_key(messages, REPORT_MODEL, REPORT_PROMPT_VERSION, **REPORT_COMPLETION_PARAMS)
+                cached = await llm_cache.get(cache_key)
+                if cached is not None:
+                    # キャッシュ済みの応答は一度に送る
+                    chunks.append(cached)
+                    yield sse_event("delta", {"content": cached})
+                else:
+                    # ストリーミングは途中まで送信済みになるため再試行せず、ブレーカーへの記録のみ行う
+                    with openai_breaker.guard():
+                        async with acquire_client(api_key, messages, REPORT_COMPLETION_PARAMS["max_tokens"]) as (client, permit):
+                            with tracer.span("openai.stream", model=REPORT_MODEL) as span:
+                                stream_started = time.perf_counter()
+                                stream = await client.chat.completions.create(
+                                    model=REPORT_MODEL,
+                                    messages=messages,
+                                    stream=True,
+                                    stream_options={"include_usage": True},
+                                    extra_headers=request_id_headers(),
+                                    **REPORT_COMPLETION_PARAMS
+                                )
+                                async for chunk in stream:
+                                    if chunk.usage:
+                                        # 最後のチャンクに使用トークン数が含まれる
+                                        permit.record_usage(chunk.usage.total_tokens)
+                                        token_usage.record(REPORT_PROMPT_VERSION, estimate_messages_tokens(messages), chunk.usage)
+                                    if not chunk.choices:
+                                        continue
+                                    delta = chunk.choices[0].delta.content
+                                    if delta:
+                                        if not chunks:
+                                            span.set_attribute("first_chunk_ms", round((time.perf_counter() - stream_started) * 1000, 3))
+                                        chunks.append(delta)
+                                        yield sse_event("delta", {"content": delta})
+                    await llm_cache.set(cache_key, "".join(chunks), REPORT_MODEL, REPORT_PROMPT_VERSION)
+        except Exception as e:
+            logger.warning(f"AI生成エラー: {e}", exc_info=e)
+            if chunks:
+                yield sse_event("reset", {"reason": "AI生成に失敗したため、標準フォーマットで作成します"})
+            chunks = []
+            fallback_reason = "error"
+        
+        # 数値データの抽出と後処理は生成完了後に一度だけ行う
+        with tracer.span("report.extract_numbers"):
+            numbers = extract_answer_numbers(answers)
+        if chunks:
+            ai_generated_report = "".join(chunks)
+            record_ai_generation("report_stream", succeeded=True)
+        else:
+            # AIキーがない・AI生成に失敗した場合はフォールバック
+            ai_generated_report = await generate_fallback_report(answers, numbers)
+            record_ai_generation("report_stream", succeeded=False, reason=fallback_reason)
+            yield sse_event("delta", {"content": ai_generated_report})
+        
+        ai_generated_report = fix_report_title(ai_generated_report, year_month)
+        
+        # 依存関係のDBセッションはレスポンス送信前に閉じられるため、保存用に別途開く
+        with tracer.span("report.save"):
+            async with AsyncSessionLocal() as db:
+                new_report = await save_generated_report(db, session, report_month, numbers, ai_generated_report)
+        
+        yield sse_event("done", {
+            "report_id": new_report.id,
+            "report_month": new_report.report_month,
+            "ai_generated_content": ai_generated_report
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
----
+async def generate_fallback_report(answers: Dict[str, Any], numbers: Optional[Dict[str, Any]] = None) -> str:
+    """
+    フォールバック月報生成（AIキーがない場合）
 
-以上となります。来月もどうぞよろしくお願いいたします。"""
-    
-    # タイトル形式の後処理修正
-    if not report.startswith(f"# 月報：{year_month}"):
-        # 既存のタイトル行を置換
-        report = re.sub(r'^#.*?\n', f'# 月報：{year_month}\n', report, count=1)
+    numbers: extract_answer_numbers() の結果（呼び出し元で抽出済みなら渡して再抽出を省く）
+    """
+    # 15日基準で月報の月を決定
+    report_month = get_report_month()
+    year, month = report_month.split('-')
+    year_month = f"{year}年{int(month)}月"
     
-    return report
+    # 数値データの抽出
+    if numbers is None:
+        numbers = extract_answer_numbers(answers)
+    total_hours = numbers["total_work_hours"]
+    received_amount = numbers["received_amount"]
+    sales_emails = numbers["sales_emails_sent"]
+    
+    with tracer.span("report.fallback_render", template=FALLBACK_REPORT_TEMPLATE):
+        return report_renderer.render(
+            FALLBACK_REPORT_TEMPLATE,
+            year_month=year_month,
+            answer=answer_texts(answers),
+            total_hours=total_hours,
+            received_amount=received_amount,
+            sales_emails=sales_emails
+        )
 
 @router.get("/session/{session_id}")
+@query_budget(1)
 async def get_session_info(session_id: str):
     """
     セッション情報を取得（認証無効版）
     """
-    if session_id not in conversation_sessions:
+    session = await session_store.get(session_id)
+    if session is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="セッションが見つかりません"
         )
     
-    session = conversation_sessions[session_id]
+    is_complete = session.get("is_complete", False)
     
     return {
         "session_id": session_id,
-        "progress": len([
-            q for cat in session["completed_categories"] 
-            for q in QUESTION_FLOW[cat]["questions"]
-        ]) + session["current_question_index"],
-        "total_questions": sum(len(cat["questions"]) for cat in QUESTION_FLOW.values()),
+        "progress": TOTAL_QUESTIONS if is_complete else get_session_position(session),
+        "total_questions": TOTAL_QUESTIONS,
         "answers": session["answers"],
-        "is_complete": session.get("is_complete", False)
+        "is_complete": is_complete
     }
\ No newline at end of file
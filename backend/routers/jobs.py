@@ -0,0 +1,48 @@
+"""
+バックグラウンドジョブのAPIエンドポイント
+"""
+
+from fastapi import APIRouter, HTTPException, status
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.job_queue import job_queue
+
+from schemas import JobStatusResponse
+
+router = APIRouter()
+
+def _seconds_between(start, end):
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds(), 3)
+
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    """
+    ジョブの状態・所要時間・結果を取得
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="ジョブが見つかりません"
+        )
+
+    result = json.loads(job.result) if job.result else None
+
+    return JobStatusResponse(
+        job_id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts or 0,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        queue_seconds=_seconds_between(job.created_at, job.started_at),
+        run_seconds=_seconds_between(job.started_at, job.finished_at),
+        report_id=job.report_id or (result.get("report_id") if result else None),
+        result=result,
+        error=job.error
+    )
@@ -0,0 +1,54 @@
+"""
+リクエスト単位のプロファイルのAPIエンドポイント
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Header, status
+from fastapi.responses import FileResponse
+from typing import List, Optional
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.profiling import request_profiler
+
+from schemas import ProfileInfo
+
+router = APIRouter()
+
+async def require_profile_token(x_profile_token: Optional[str] = Header(None)):
+    """プロファイルの参照には計測と同じトークン（X-Profile-Token）が必要"""
+    if not request_profiler.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="プロファイリングは無効です"
+        )
+    if not request_profiler.authorized(x_profile_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="プロファイルを参照する権限がありません"
+        )
+
+@router.get("/", response_model=List[ProfileInfo], dependencies=[Depends(require_profile_token)])
+async def list_profiles(limit: int = 20):
+    """
+    保存済みのプロファイルを新しい順に取得
+    """
+    # ディレクトリの走査とメタデータの読み込みでイベントループを止めないようスレッドで行う
+    profiles = await asyncio.to_thread(request_profiler.list_profiles)
+    return [
+        ProfileInfo(**metadata, download_url=f"/api/profiles/{metadata['profile_id']}")
+        for metadata in profiles[:limit]
+    ]
+
+@router.get("/{profile_id}", dependencies=[Depends(require_profile_token)])
+async def download_profile(profile_id: str):
+    """
+    プロファイルのファイルをダウンロード
+    """
+    path = await asyncio.to_thread(request_profiler.profile_path, profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="プロファイルが見つかりません"
+        )
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
@@ -3,11 +3,15 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
 from typing import List
 import io
 
-from database import get_db, User, MonthlyReport, WorkTimeDetail, Project
+from database import (
+    get_async_db, refresh_report, User, MonthlyReport, WorkTimeDetail, Project, REPORT_TEXT_GROUP
+)
 from schemas import (
     MonthlyReportCreate, MonthlyReportUpdate, MonthlyReportResponse,
     MonthlyReportSummary, PDFGenerateRequest
@@ -21,16 +25,18 @@ router = APIRouter()
 async def create_monthly_report(
     report_data: MonthlyReportCreate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     新しい月報を作成
     """
     # 同じ月の月報が既に存在するかチェック
-    existing_report = db.query(MonthlyReport).filter(
-        MonthlyReport.user_id == current_user.id,
-        MonthlyReport.report_month == report_data.report_month
-    ).first()
+    existing_report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.user_id == current_user.id,
+            MonthlyReport.report_month == report_data.report_month
+        )
+    )
 
     if existing_report:
         raise HTTPException(
@@ -45,8 +51,8 @@ async def create_monthly_report(
     )
 
     db.add(new_report)
-    db.commit()
-    db.refresh(new_report)
+    await db.commit()
+    await db.refresh(new_report)
 
     # 作業時間詳細を追加（もし存在する場合）
     if hasattr(report_data, 'work_time_details') and report_data.work_time_details:
@@ -66,40 +72,46 @@ async def create_monthly_report(
             )
             db.add(project_record)
 
-    db.commit()
-    db.refresh(new_report)
+    await db.commit()
+    await refresh_report(db, new_report)
 
     return new_report
 
 @router.get("/", response_model=List[MonthlyReportSummary])
 async def get_user_reports(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
     limit: int = 10
 ):
     """
     ユーザーの月報一覧を取得
     """
-    reports = db.query(MonthlyReport).filter(
-        MonthlyReport.user_id == current_user.id
-    ).order_by(MonthlyReport.created_at.desc()).offset(skip).limit(limit).all()
+    result = await db.scalars(
+        select(MonthlyReport).where(
+            MonthlyReport.user_id == current_user.id
+        ).order_by(MonthlyReport.created_at.desc()).offset(skip).limit(limit).options(
+            undefer_group(REPORT_TEXT_GROUP)
+        )
+    )
 
-    return reports
+    return result.all()
 
 @router.get("/{report_id}", response_model=MonthlyReportResponse)
 async def get_monthly_report(
     report_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     指定した月報の詳細を取得
     """
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == current_user.id
+        ).options(undefer_group(REPORT_TEXT_GROUP))
+    )
 
     if not report:
         raise HTTPException(
@@ -114,15 +126,17 @@ async def update_monthly_report(
     report_id: int,
     update_data: MonthlyReportUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     月報を更新
     """
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == current_user.id
+        ).options(undefer_group(REPORT_TEXT_GROUP))
+    )
 
     if not report:
         raise HTTPException(
@@ -134,8 +148,8 @@ async def update_monthly_report(
     for field, value in update_data.model_dump(exclude_unset=True).items():
         setattr(report, field, value)
 
-    db.commit()
-    db.refresh(report)
+    await db.commit()
+    await refresh_report(db, report)
 
     return report
 
@@ -143,15 +157,17 @@ async def update_monthly_report(
 async def delete_monthly_report(
     report_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     月報を削除
     """
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == current_user.id
+        )
+    )
 
     if not report:
         raise HTTPException(
@@ -160,11 +176,11 @@ async def delete_monthly_report(
         )
 
     # 関連データも削除
-    db.query(WorkTimeDetail).filter(WorkTimeDetail.report_id == report_id).delete()
+    await db.execute(delete(WorkTimeDetail).where(WorkTimeDetail.report_id == report_id))
     # Note: Projects are associated with users, not reports
     # db.query(Project).filter(Project.report_id == report_id).delete()  # This line is commented out as Project doesn't have report_id
-    db.delete(report)
-    db.commit()
+    await db.delete(report)
+    await db.commit()
 
     return {"message": "月報が削除されました"}
 
@@ -172,16 +188,18 @@ async def delete_monthly_report(
 async def get_work_time_details(
     report_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     作業時間詳細を取得
     """
     # 月報の所有者確認
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == current_user.id
+        )
+    )
 
     if not report:
         raise HTTPException(
@@ -189,9 +207,12 @@ async def get_work_time_details(
             detail="月報が見つかりません"
         )
 
-    details = db.query(WorkTimeDetail).filter(
-        WorkTimeDetail.report_id == report_id
-    ).all()
+    result = await db.scalars(
+        select(WorkTimeDetail).where(
+            WorkTimeDetail.report_id == report_id
+        )
+    )
+    details = result.all()
 
     return details
 
@@ -199,16 +220,18 @@ async def get_work_time_details(
 async def get_projects(
     report_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     プロジェクト一覧を取得
     """
     # 月報の所有者確認
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == current_user.id
+        )
+    )
 
     if not report:
         raise HTTPException(
@@ -227,16 +250,18 @@ async def generate_pdf(
     report_id: int,
     pdf_request: PDFGenerateRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     月報のPDFを生成
     """
     # 月報の所有者確認
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == current_user.id
+        ).options(undefer_group(REPORT_TEXT_GROUP))
+    )
 
     if not report:
         raise HTTPException(
@@ -245,9 +270,12 @@ async def generate_pdf(
         )
 
     # 関連データを取得
-    work_details = db.query(WorkTimeDetail).filter(
-        WorkTimeDetail.report_id == report_id
-    ).all()
+    result = await db.scalars(
+        select(WorkTimeDetail).where(
+            WorkTimeDetail.report_id == report_id
+        )
+    )
+    work_details = result.all()
 
     # Note: Projects are associated with users, not reports
     # This query needs to be adjusted based on your actual data model
@@ -3,42 +3,181 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select, func, delete, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
+from typing import List, Optional
+from datetime import datetime
+import base64
 import io
+import json
 
-from database import get_db, User, MonthlyReport, WorkTimeDetail, Project
+from database import (
+    get_async_db, refresh_report, User, MonthlyReport, WorkTimeDetail, Project, REPORT_TEXT_GROUP
+)
 from schemas import (
     MonthlyReportCreate, MonthlyReportUpdate, MonthlyReportResponse,
-    MonthlyReportSummary, PDFGenerateRequest
+    MonthlyReportSummary, PDFGenerateRequest, CursorPaginatedResponse
 )
 from pdf_generator import generate_report_pdf
+from utils.tracing import tracer, TracedRoute
+from utils.query_counter import query_budget
+from utils.logger import get_logger
 
-router = APIRouter()
+# response.serialize スパンで response_model による変換の時間を記録する
+router = APIRouter(route_class=TracedRoute)
+logger = get_logger(__name__)
 
 # 固定ユーザーID（認証無効化のため）
 DEMO_USER_ID = 3
 
+# 一覧表示に必要な列のみ（AI生成の全文などの大きなテキスト列は読み込まない）
+SUMMARY_COLUMNS = (
+    MonthlyReport.id,
+    MonthlyReport.user_id,
+    MonthlyReport.report_month,
+    MonthlyReport.total_work_hours,
+    MonthlyReport.received_amount,
+    MonthlyReport.created_at,
+    MonthlyReport.updated_at,
+)
+
+def _to_summary(report) -> MonthlyReportSummary:
+    """一覧表示用のサマリーに変換"""
+    return MonthlyReportSummary(
+        id=report.id,
+        user_id=report.user_id,
+        report_month=report.report_month,
+        total_work_hours=report.total_work_hours or 0,
+        received_amount=report.received_amount or 0,
+        created_at=report.created_at,
+        updated_at=report.updated_at
+    )
+
+def encode_cursor(report, direction: str) -> str:
+    """(created_at, id) と移動方向を不透明なカーソル文字列にエンコード"""
+    payload = {"c": report.created_at.isoformat(), "i": report.id, "d": direction}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """カーソル文字列を (created_at, id, direction) にデコード"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = payload["d"]
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return datetime.fromisoformat(payload["c"]), int(payload["i"]), direction
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無効なカーソルです"
+        )
+
+async def get_monthly_reports_by_cursor(
+    db: AsyncSession,
+    cursor: str,
+    size: int,
+    include_total: bool
+) -> CursorPaginatedResponse:
+    """
+    キーセット方式で月報一覧を取得（created_at降順、同時刻はid降順）
+
+    OFFSETもCOUNTも使わないため、履歴が増えてもページ取得のコストは一定
+    """
+    query = select(*SUMMARY_COLUMNS).where(MonthlyReport.user_id == DEMO_USER_ID)
+    direction = "next"
+
+    if cursor:
+        created_at, report_id, direction = decode_cursor(cursor)
+        if direction == "next":
+            query = query.where(or_(
+                MonthlyReport.created_at < created_at,
+                and_(MonthlyReport.created_at == created_at, MonthlyReport.id < report_id)
+            ))
+        else:
+            query = query.where(or_(
+                MonthlyReport.created_at > created_at,
+                and_(MonthlyReport.created_at == created_at, MonthlyReport.id > report_id)
+            ))
+
+    if direction == "next":
+        query = query.order_by(MonthlyReport.created_at.desc(), MonthlyReport.id.desc())
+    else:
+        query = query.order_by(MonthlyReport.created_at.asc(), MonthlyReport.id.asc())
+
+    # 1件多く取得して次（前）のページの有無を判定
+    result = await db.execute(query.limit(size + 1))
+    reports = result.all()
+    has_more = len(reports) > size
+    reports = reports[:size]
+    if direction == "prev":
+        reports.reverse()
+
+    next_cursor = None
+    prev_cursor = None
+    if reports:
+        if direction == "next":
+            has_next, has_prev = has_more, bool(cursor)
+        else:
+            has_next, has_prev = True, has_more
+        if has_next:
+            next_cursor = encode_cursor(reports[-1], "next")
+        if has_prev:
+            prev_cursor = encode_cursor(reports[0], "prev")
+
+    total = None
+    if include_total:
+        total = await db.scalar(
+            select(func.count()).select_from(MonthlyReport).where(
+                MonthlyReport.user_id == DEMO_USER_ID
+            )
+        )
+
+    return CursorPaginatedResponse(
+        items=[_to_summary(report) for report in reports],
+        size=size,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        total=total
+    )
+
 @router.get("/")
+@query_budget(2)
 async def get_monthly_reports(
     page: int = 1,
     size: int = 10,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     月報一覧を取得（認証無効版）
+
+    - page/size: 従来のページ番号方式
+    - cursor: キーセット方式（空文字で先頭ページ、以降はレスポンスの next_cursor / prev_cursor を指定）
+    - include_total: キーセット方式で総件数も返す場合に true
     """
+    if cursor is not None:
+        return await get_monthly_reports_by_cursor(db, cursor, size, include_total)
+
     skip = (page - 1) * size
     
     # 総数を取得
-    total_count = db.query(MonthlyReport).filter(
-        MonthlyReport.user_id == DEMO_USER_ID
-    ).count()
+    total_count = await db.scalar(
+        select(func.count()).select_from(MonthlyReport).where(
+            MonthlyReport.user_id == DEMO_USER_ID
+        )
+    )
     
     # ページネーション適用
-    reports = db.query(MonthlyReport).filter(
-        MonthlyReport.user_id == DEMO_USER_ID
-    ).order_by(MonthlyReport.created_at.desc()).offset(skip).limit(size).all()
+    result = await db.execute(
+        select(*SUMMARY_COLUMNS).where(
+            MonthlyReport.user_id == DEMO_USER_ID
+        ).order_by(MonthlyReport.created_at.desc()).offset(skip).limit(size)
+    )
+    reports = result.all()
     
     # ページ数計算
     import math
@@ -47,22 +186,10 @@ async def get_monthly_reports(
     # ページネーション対応のレスポンス形式
     if page == 1 and size >= total_count:
         # 最初のページで全件取得の場合は配列で返す（後方互換性）
-        return [
-            MonthlyReportSummary(
-                id=report.id,
-                user_id=report.user_id,
-                report_month=report.report_month,
-                total_work_hours=report.total_work_hours or 0,
-                received_amount=report.received_amount or 0,
-                created_at=report.created_at,
-                updated_at=report.updated_at
-            )
-            for report in reports
-        ]
+        return [_to_summary(report) for report in reports]
     else:
         # ページネーション情報を含むレスポンス
         from pydantic import BaseModel
-        from typing import List
         
         class PaginatedReports(BaseModel):
             items: List[MonthlyReportSummary]
@@ -72,18 +199,7 @@ async def get_monthly_reports(
             pages: int
         
         return PaginatedReports(
-            items=[
-                MonthlyReportSummary(
-                    id=report.id,
-                    user_id=report.user_id,
-                    report_month=report.report_month,
-                    total_work_hours=report.total_work_hours or 0,
-                    received_amount=report.received_amount or 0,
-                    created_at=report.created_at,
-                    updated_at=report.updated_at
-                )
-                for report in reports
-            ],
+            items=[_to_summary(report) for report in reports],
             total=total_count,
             page=page,
             size=size,
@@ -91,17 +207,20 @@ async def get_monthly_reports(
         )
 
 @router.get("/{report_id}", response_model=MonthlyReportResponse)
+@query_budget(1)
 async def get_monthly_report(
     report_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     特定の月報を取得（認証無効版）
     """
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == DEMO_USER_ID
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == DEMO_USER_ID
+        ).options(undefer_group(REPORT_TEXT_GROUP))
+    )
     
     if not report:
         raise HTTPException(
@@ -112,9 +231,10 @@ async def get_monthly_report(
     return MonthlyReportResponse.model_validate(report)
 
 @router.post("/", response_model=MonthlyReportResponse, status_code=status.HTTP_201_CREATED)
+@query_budget(3)
 async def create_monthly_report(
     report_data: MonthlyReportCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     新しい月報を作成（認証無効版）
@@ -128,8 +248,8 @@ async def create_monthly_report(
     )
 
     db.add(new_report)
-    db.commit()
-    db.refresh(new_report)
+    await db.commit()
+    await db.refresh(new_report)
 
     # 作業時間詳細の追加
     if hasattr(report_data, 'work_time_details') and report_data.work_time_details:
@@ -149,24 +269,27 @@ async def create_monthly_report(
             )
             db.add(project)
 
-    db.commit()
-    db.refresh(new_report)
+    await db.commit()
+    await refresh_report(db, new_report)
 
     return MonthlyReportResponse.model_validate(new_report)
 
 @router.put("/{report_id}", response_model=MonthlyReportResponse)
+@query_budget(3)
 async def update_monthly_report(
     report_id: int,
     report_data: MonthlyReportUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     月報を更新（認証無効版）
     """
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == DEMO_USER_ID
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == DEMO_USER_ID
+        ).options(undefer_group(REPORT_TEXT_GROUP))
+    )
 
     if not report:
         raise HTTPException(
@@ -181,56 +304,61 @@ async def update_monthly_report(
         if field not in ["work_time_details", "projects"]:
             setattr(report, field, value)
 
-    db.commit()
-    db.refresh(report)
+    await db.commit()
+    await refresh_report(db, report)
 
     return MonthlyReportResponse.model_validate(report)
 
 @router.delete("/{report_id}")
+@query_budget(5)
 async def delete_monthly_report(
     report_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     月報を削除（認証無効版）
     """
     try:
-        print(f"削除リクエスト受信: report_id={report_id}")
+        logger.debug("削除リクエスト受信", extra={"report_id": report_id})
         
         # まず対象月報の存在確認（ユーザーIDに関係なく）
-        report = db.query(MonthlyReport).filter(
-            MonthlyReport.id == report_id
-        ).first()
+        report = await db.scalar(
+            select(MonthlyReport).where(
+                MonthlyReport.id == report_id
+            )
+        )
 
         if not report:
-            print(f"月報が見つかりません: report_id={report_id}")
+            logger.info("削除対象の月報が見つかりません", extra={"report_id": report_id})
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="月報が見つかりません"
             )
         
-        print(f"月報を発見: report_id={report_id}, month={report.report_month}")
+        logger.debug("削除対象の月報を発見", extra={"report_id": report_id, "report_month": report.report_month})
 
         try:
             # 関連する作業時間詳細を削除（Projectは月報と直接関連していない）
-            work_time_count = db.query(WorkTimeDetail).filter(WorkTimeDetail.report_id == report_id).count()
+            work_time_count = await db.scalar(
+                select(func.count()).select_from(WorkTimeDetail).where(WorkTimeDetail.report_id == report_id)
+            )
             
-            print(f"関連データ: work_time_details={work_time_count}")
+            logger.debug("削除する関連データ", extra={"report_id": report_id, "work_time_details": work_time_count})
             
-            db.query(WorkTimeDetail).filter(WorkTimeDetail.report_id == report_id).delete()
+            await db.execute(delete(WorkTimeDetail).where(WorkTimeDetail.report_id == report_id))
             # Projectテーブルは月報と直接関連していないため、削除しない
             
-            db.delete(report)
-            db.commit()
+            await db.delete(report)
+            await db.commit()
             
-            print(f"月報削除成功: report_id={report_id}")
+            logger.info("月報削除成功", extra={"report_id": report_id})
             
             # 204 No Contentではなく、200 OKでレスポンスを返す
             return {"message": "月報を削除しました", "report_id": report_id}
             
         except Exception as e:
-            print(f"データベース操作エラー: {type(e).__name__}: {e}")
-            db.rollback()
+            logger.exception(f"データベース操作エラー: {type(e).__name__}: {e}", extra={"report_id": report_id})
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"削除処理中にエラーが発生しました: {str(e)}"
@@ -240,26 +368,27 @@ async def delete_monthly_report(
         # HTTPExceptionはそのまま再発生
         raise
     except Exception as e:
-        print(f"予期しないエラー: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"予期しないエラー: {type(e).__name__}: {e}", extra={"report_id": report_id})
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"予期しないエラーが発生しました: {str(e)}"
         )
 
 @router.get("/{report_id}/pdf")
+@query_budget(2)
 async def download_report_pdf(
     report_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     月報をPDF形式でダウンロード（認証無効版）
     """
-    report = db.query(MonthlyReport).filter(
-        MonthlyReport.id == report_id,
-        MonthlyReport.user_id == DEMO_USER_ID
-    ).first()
+    report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.id == report_id,
+            MonthlyReport.user_id == DEMO_USER_ID
+        ).options(undefer_group(REPORT_TEXT_GROUP))
+    )
 
     if not report:
         raise HTTPException(
@@ -269,11 +398,12 @@ async def download_report_pdf(
 
     # PDF生成
     # 認証なし版ではユーザー情報を取得
-    user = db.query(User).filter(User.id == report.user_id).first()
+    user = await db.scalar(select(User).where(User.id == report.user_id))
     if not user:
         # ユーザーが見つからない場合はダミーユーザーを作成
         user = User(id=report.user_id, name="Unknown User", email="unknown@example.com")
-    pdf_buffer = generate_report_pdf(report, user)
+    with tracer.span("report.pdf_render"):
+        pdf_buffer = generate_report_pdf(report, user)
     
     # レスポンスとして返す
     headers = {
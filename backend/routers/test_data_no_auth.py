@@ -2,10 +2,11 @@
 テストデータ生成API - 認証無効版
 """
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from database import get_db, MonthlyReport
+from database import get_async_db, MonthlyReport
 from schemas import MonthlyReportCreate
 
 router = APIRouter()
@@ -15,7 +16,7 @@ DEMO_USER_ID = 3
 
 @router.post("/generate-test-report")
 async def generate_test_report(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     テストデータで月報を即座に作成（認証無効版）
@@ -23,10 +24,12 @@ async def generate_test_report(
     current_month = datetime.now().strftime("%Y-%m")
     
     # 既存の月報チェック
-    existing_report = db.query(MonthlyReport).filter(
-        MonthlyReport.user_id == DEMO_USER_ID,
-        MonthlyReport.report_month == current_month
-    ).first()
+    existing_report = await db.scalar(
+        select(MonthlyReport).where(
+            MonthlyReport.user_id == DEMO_USER_ID,
+            MonthlyReport.report_month == current_month
+        )
+    )
     
     if existing_report:
         # 既存の月報を更新
@@ -40,8 +43,8 @@ async def generate_test_report(
         existing_report.challenges = "時間管理に苦労した。新しいフレームワークの学習に時間がかかった。"
         existing_report.next_month_goals = "より効率的なコーディングを心がける。営業活動を強化する。"
         
-        db.commit()
-        db.refresh(existing_report)
+        await db.commit()
+        await db.refresh(existing_report)
         
         return {
             "message": "テストデータで月報が更新されました",
@@ -69,8 +72,8 @@ async def generate_test_report(
         )
         
         db.add(new_report)
-        db.commit()
-        db.refresh(new_report)
+        await db.commit()
+        await db.refresh(new_report)
         
         return {
             "message": "テストデータで月報が作成されました",
@@ -3,25 +3,35 @@
 新フォーマットの月報を生成
 """
 from fastapi import APIRouter, Depends, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import os
+import re
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.date_utils import get_report_month
+from utils.openai_client import resolve_api_key, chat_completion
+from utils.metrics import record_ai_generation
+from utils.query_counter import query_budget
+from utils.logger import get_logger
 
-from database import get_db, MonthlyReport
+from database import get_async_db, MonthlyReport
 from schemas import MonthlyReportCreate
 from typing import Optional
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # 固定ユーザーID（認証無効化のため）
 DEMO_USER_ID = 3
 
+# テスト月報プロンプトの版（プロンプトを変更したら上げる。LLM応答キャッシュのキーに含まれる）
+TEST_REPORT_PROMPT_VERSION = "test-report-v1"
+
 @router.post("/generate-test-report")
+@query_budget(2)
 async def generate_test_report(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     x_openai_api_key: Optional[str] = Header(None)
 ):
     """
@@ -35,12 +45,10 @@ async def generate_test_report(
     year_month = f"{year}年{int(month)}月"
     
     # AIキーがある場合は詳細版、ない場合は標準版
-    if x_openai_api_key or os.getenv("OPENAI_API_KEY"):
+    api_key = resolve_api_key(x_openai_api_key)
+    if api_key:
         # OpenAI APIを使用して月報を生成
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=x_openai_api_key or os.getenv("OPENAI_API_KEY"))
-            
             prompt = f"""
 あなたは優秀な月報作成アシスタントです。以下の質問と回答から、{year_month}の月報を生成してください。
 
@@ -153,17 +161,19 @@ async def generate_test_report(
 以上となります。来月もどうぞよろしくお願いいたします。
 """
             
-            response = client.chat.completions.create(
+            # 同じ対象月のテストデータはLLM応答キャッシュから返す
+            ai_generated_report = await chat_completion(
+                api_key,
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": "あなたは優秀な月報作成アシスタントです。"},
                     {"role": "user", "content": prompt}
                 ],
+                template_version=TEST_REPORT_PROMPT_VERSION,
                 max_tokens=4000,
                 temperature=0.7
             )
-            
-            ai_generated_report = response.choices[0].message.content
+            record_ai_generation("test_report", succeeded=True)
             
             # タイトル形式の後処理修正
             if not ai_generated_report.startswith(f"# 月報：{year_month}"):
@@ -171,7 +181,8 @@ async def generate_test_report(
                 ai_generated_report = re.sub(r'^#.*?\n', f'# 月報：{year_month}\n', ai_generated_report, count=1)
             
         except Exception as e:
-            print(f"OpenAI API エラー: {e}")
+            logger.warning(f"OpenAI API エラー: {e}", exc_info=e)
+            record_ai_generation("test_report", succeeded=False, reason="error")
             # エラーの場合はテンプレート版を使用
             ai_generated_report = f"""# 月報：{year_month}
 
@@ -327,6 +338,7 @@ async def generate_test_report(
             ai_generated_report = re.sub(r'^#.*?\n', f'# 月報：{year_month}\n', ai_generated_report, count=1)
     else:
         # 標準版（APIキーなし）
+        record_ai_generation("test_report", succeeded=False, reason="no_api_key")
         ai_generated_report = f"""# 月報：{year_month}
 
 お疲れ様です。{year_month}分の月報を提出します。以下に今月の状況、実績、取り組み、気づき、来月の目標をまとめましたので、ご確認ください。
@@ -475,8 +487,8 @@ async def generate_test_report(
     )
     
     db.add(new_report)
-    db.commit()
-    db.refresh(new_report)
+    await db.commit()
+    await db.refresh(new_report)
     
     return {
         "message": "テストデータで月報が作成されました",
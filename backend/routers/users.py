@@ -3,11 +3,11 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
-from database import get_db, User, MonthlyReport
+from database import get_async_db, User, MonthlyReport
 from schemas import UserResponse, UserStats, MonthlyStats
 from auth import get_current_active_user
 
@@ -24,50 +24,55 @@ async def get_user_profile(current_user: User = Depends(get_current_active_user)
 async def update_user_profile(
     name: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     ユーザープロフィールを更新
     """
     current_user.name = name
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
 
 @router.delete("/account")
 async def delete_user_account(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     ユーザーアカウントを削除
     """
     # ソフトデリート（非アクティブ化）
     current_user.is_active = False
-    db.commit()
+    await db.commit()
 
     return {"message": "アカウントが削除されました"}
 
 @router.get("/stats", response_model=UserStats)
 async def get_user_stats(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     ユーザーの統計情報を取得
     """
     # 総月報数
-    total_reports = db.query(MonthlyReport).filter(
-        MonthlyReport.user_id == current_user.id
-    ).count()
+    total_reports = await db.scalar(
+        select(func.count()).select_from(MonthlyReport).where(
+            MonthlyReport.user_id == current_user.id
+        )
+    )
     
     # 総稼働時間と総収入
-    stats = db.query(
-        func.sum(MonthlyReport.total_work_hours).label('total_hours'),
-        func.sum(MonthlyReport.received_amount).label('total_income')
-    ).filter(
-        MonthlyReport.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(
+            func.sum(MonthlyReport.total_work_hours).label('total_hours'),
+            func.sum(MonthlyReport.received_amount).label('total_income')
+        ).where(
+            MonthlyReport.user_id == current_user.id
+        )
+    )
+    stats = result.first()
     
     total_hours = float(stats.total_hours) if stats.total_hours else 0.0
     total_income = float(stats.total_income) if stats.total_income else 0.0
@@ -77,10 +82,13 @@ async def get_user_stats(
     
     # 最近6ヶ月の統計
     six_months_ago = datetime.now() - timedelta(days=180)
-    recent_reports = db.query(MonthlyReport).filter(
-        MonthlyReport.user_id == current_user.id,
-        MonthlyReport.created_at >= six_months_ago
-    ).order_by(MonthlyReport.report_month.desc()).limit(6).all()
+    result = await db.scalars(
+        select(MonthlyReport).where(
+            MonthlyReport.user_id == current_user.id,
+            MonthlyReport.created_at >= six_months_ago
+        ).order_by(MonthlyReport.report_month.desc()).limit(6)
+    )
+    recent_reports = result.all()
     
     recent_months = []
     for report in recent_reports:
@@ -218,6 +218,46 @@ class PaginatedResponse(BaseModel):
     items: List[Any]
     total: int
 
+class CursorPaginatedResponse(BaseModel):
+    """キーセット（カーソル）方式のページネーション結果"""
+    items: List[Any]
+    size: int
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: Optional[int] = None  # include_total=true の場合のみ
+
+# バックグラウンドジョブ関連スキーマ
+class JobAcceptedResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # queued, running, succeeded, failed
+    attempts: int
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queue_seconds: Optional[float] = None  # 登録から実行開始まで
+    run_seconds: Optional[float] = None    # 実行開始から完了まで
+    report_id: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class ProfileInfo(BaseModel):
+    profile_id: str
+    format: str  # pstats, collapsed
+    method: str
+    path: str
+    route: str
+    status_code: int
+    duration_ms: float
+    size_bytes: int
+    created_at: datetime
+    download_url: str
+
 # 対話型月報関連スキーマ
 class ConversationSession(BaseModel):
     user_id: int
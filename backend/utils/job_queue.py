@@ -0,0 +1,369 @@
+"""
+バックグラウンドジョブキュー
+
+月報生成などの時間のかかる処理を generation_jobs テーブルに積み、
+上限付きのワーカー（asyncioタスク）で順に処理する。ジョブの状態はDBにあるため、
+プロセスを再起動しても queued のジョブは残る。
+
+実行中のジョブには所有者（ワーカープロセス）とリースがある。所有者は実行中に
+heartbeat_at を定期的に更新し、JOB_LEASE_SECONDS 秒更新のないジョブだけを
+所有者が停止したものとみなして queued に戻す（複数のuvicornワーカーで動かしても、
+他のプロセスが実行中のジョブを二重に実行しない）。JOB_MAX_ATTEMPTS 回実行しても
+完了しないジョブは failed にする。
+
+APIキーなどの秘密情報はDBに保存せず、登録したプロセス内でのみ保持する。
+秘密情報付きのジョブは登録したプロセスが所有者として queued のままリースを更新し続け、
+他のプロセスはリースが切れる（登録したプロセスが停止したとみなせる）まで取らない。秘密情報を持たないプロセスが
+実行することになった場合は、別のキーで生成せずに failed にする。
+
+使い方:
+    async def handler(job_id, payload, secrets) -> dict: ...
+    job_queue.register("kind", handler)
+    job_id = await job_queue.enqueue("kind", {...}, secrets={"api_key": ...})
+
+環境変数:
+    JOB_WORKERS                同時に処理するジョブ数（既定: 2）
+    JOB_POLL_INTERVAL_SECONDS  新しいジョブを確認する間隔（既定: 1.0）
+    JOB_RETENTION_SECONDS      完了・失敗したジョブを残す期間（既定: 86400 = 1日）
+    JOB_LEASE_SECONDS          実行中のジョブのリースの長さ（既定: 60。この間隔の1/3ごとに更新する）
+    JOB_MAX_ATTEMPTS           ジョブを実行する最大回数（既定: 3）
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update, delete, func, and_, or_
+
+from database import AsyncSessionLocal, GenerationJob
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# 秘密情報を持たないプロセスが秘密情報付きのジョブを実行することになった場合のエラー
+SECRETS_UNAVAILABLE_ERROR = "APIキーを取得できません（ジョブを登録したプロセスが停止したため、再度生成してください）"
+
+# ハンドラー: (job_id, payload, secrets) -> 結果（JSONに変換できるdict）
+JobHandler = Callable[[str, Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobQueue:
+    """SQLiteのテーブルを使うジョブキューとワーカープール"""
+
+    def __init__(self, workers: int, poll_interval: float, retention_seconds: int, lease_seconds: float, max_attempts: int):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # このプロセスのワーカーの所有者ID（ホスト名・PIDと、同じPIDの再起動を区別する乱数）
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, JobHandler] = {}
+        # job_id -> 秘密情報（DBには保存しない）
+        self._secrets: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._maintenance_task: Optional[asyncio.Task] = None
+        # このプロセスでの統計
+        self.succeeded = 0
+        self.failed = 0
+        self.recovered = 0
+        self.exhausted = 0
+        self.lost_leases = 0
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """ジョブの種類ごとのハンドラーを登録"""
+        self._handlers[kind] = handler
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], secrets: Optional[Dict[str, Any]] = None) -> str:
+        """ジョブを登録し、ジョブIDを返す"""
+        if kind not in self._handlers:
+            raise ValueError(f"未登録のジョブ種類です: {kind}")
+        job_id = uuid.uuid4().hex
+        # 秘密情報付きのジョブは、実行されるまでこのプロセスが所有者としてリースを更新する
+        owned = bool(secrets)
+        async with AsyncSessionLocal() as db:
+            db.add(GenerationJob(
+                id=job_id,
+                kind=kind,
+                status=JOB_QUEUED,
+                payload=json.dumps(payload, ensure_ascii=False, default=str),
+                attempts=0,
+                has_secrets=owned,
+                owner=self.owner_id if owned else None,
+                heartbeat_at=_now() if owned else None
+            ))
+            await db.commit()
+        if secrets:
+            self._secrets[job_id] = secrets
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[GenerationJob]:
+        """ジョブを取得"""
+        async with AsyncSessionLocal() as db:
+            return await db.get(GenerationJob, job_id)
+
+    def _lease_cutoff(self) -> datetime:
+        return _now() - timedelta(seconds=self.lease_seconds)
+
+    async def _claim(self) -> Optional[str]:
+        """実行できる最も古い queued のジョブを running にして（所有者はこのプロセス）、そのIDを返す"""
+        # 秘密情報付きのジョブは、所有者（登録したプロセス）か、所有者のリースが切れた場合のみ取る
+        claimable = or_(
+            GenerationJob.has_secrets.is_not(True),
+            GenerationJob.owner == self.owner_id,
+            GenerationJob.heartbeat_at.is_(None),
+            GenerationJob.heartbeat_at < self._lease_cutoff()
+        )
+        async with AsyncSessionLocal() as db:
+            while True:
+                job_id = await db.scalar(
+                    select(GenerationJob.id)
+                    .where(GenerationJob.status == JOB_QUEUED, claimable)
+                    .order_by(GenerationJob.created_at.asc())
+                    .limit(1)
+                )
+                if job_id is None:
+                    return None
+                # 他のワーカーが先に取った場合は更新件数が0になる
+                now = _now()
+                result = await db.execute(
+                    update(GenerationJob)
+                    .where(GenerationJob.id == job_id, GenerationJob.status == JOB_QUEUED)
+                    .values(
+                        status=JOB_RUNNING,
+                        started_at=now,
+                        heartbeat_at=now,
+                        owner=self.owner_id,
+                        attempts=GenerationJob.attempts + 1
+                    )
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return job_id
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """実行中のジョブのリースを定期的に更新する（ジョブの完了時にキャンセルされる）"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    update(GenerationJob)
+                    .where(GenerationJob.id == job_id, GenerationJob.owner == self.owner_id, GenerationJob.status == JOB_RUNNING)
+                    .values(heartbeat_at=_now())
+                )
+                await db.commit()
+            if result.rowcount == 0:
+                logger.warning("ジョブのリースを失いました", extra={"job_id": job_id})
+                return
+
+    async def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
+        """ジョブを完了・失敗にする（リースを失って他のプロセスが実行中の場合は更新せず False を返す）"""
+        async with AsyncSessionLocal() as db:
+            updated = await db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id, GenerationJob.owner == self.owner_id, GenerationJob.status == JOB_RUNNING)
+                .values(
+                    status=status,
+                    result=json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                    error=error,
+                    finished_at=_now()
+                )
+            )
+            await db.commit()
+        if updated.rowcount == 0:
+            self.lost_leases += 1
+            logger.warning("リースを失ったため、ジョブの結果を記録しません", extra={"job_id": job_id, "job_status": status})
+            return False
+        return True
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.get(job_id)
+        secrets = self._secrets.pop(job_id, None)
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            await self._finish(job_id, JOB_FAILED, error=f"未登録のジョブ種類です: {job.kind}")
+            self.failed += 1
+            return
+        if job.has_secrets and secrets is None:
+            # 別のキー（環境変数のキーやフォールバック）で黙って生成しない
+            await self._finish(job_id, JOB_FAILED, error=SECRETS_UNAVAILABLE_ERROR)
+            self.failed += 1
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await handler(job_id, json.loads(job.payload), secrets or {})
+        except Exception as e:
+            logger.exception(f"ジョブ実行エラー ({job.kind} {job_id}): {e}", extra={"job_id": job_id, "job_kind": job.kind})
+            if await self._finish(job_id, JOB_FAILED, error=str(e)):
+                self.failed += 1
+            return
+        finally:
+            heartbeat.cancel()
+        if await self._finish(job_id, JOB_SUCCEEDED, result=result):
+            self.succeeded += 1
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job_id = await self._claim()
+                if job_id is not None:
+                    await self._run(job_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"ジョブワーカーエラー: {e}")
+            # 新しいジョブの登録か、ポーリング間隔の経過まで待つ
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def recover(self) -> int:
+        """
+        リースの切れた（所有者が停止した）実行中のジョブを queued に戻す
+
+        実行回数が JOB_MAX_ATTEMPTS に達したジョブは、ワーカーを停止させ続けないよう failed にする
+        """
+        expired = and_(
+            GenerationJob.status == JOB_RUNNING,
+            or_(GenerationJob.heartbeat_at < self._lease_cutoff(), GenerationJob.heartbeat_at.is_(None))
+        )
+        async with AsyncSessionLocal() as db:
+            exhausted = await db.execute(
+                update(GenerationJob)
+                .where(expired, GenerationJob.attempts >= self.max_attempts)
+                .values(
+                    status=JOB_FAILED,
+                    error=f"最大実行回数（{self.max_attempts}回）に達しました",
+                    finished_at=_now()
+                )
+            )
+            result = await db.execute(
+                update(GenerationJob)
+                .where(expired)
+                .values(status=JOB_QUEUED, started_at=None, heartbeat_at=None, owner=None)
+            )
+            await db.commit()
+        self.exhausted += exhausted.rowcount
+        self.recovered += result.rowcount
+        if exhausted.rowcount:
+            logger.warning(f"最大実行回数に達したジョブを失敗にしました: {exhausted.rowcount}件")
+        return result.rowcount
+
+    async def prune(self) -> int:
+        """保持期間を過ぎた完了・失敗ジョブを削除"""
+        cutoff = _now() - timedelta(seconds=self.retention_seconds)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(GenerationJob).where(
+                    GenerationJob.status.in_([JOB_SUCCEEDED, JOB_FAILED]),
+                    GenerationJob.finished_at < cutoff
+                )
+            )
+            await db.commit()
+        return result.rowcount
+
+    async def _renew_queued_leases(self) -> None:
+        """このプロセスが秘密情報を持つ queued のジョブのリースを更新する"""
+        if not self._secrets:
+            return
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.status == JOB_QUEUED, GenerationJob.owner == self.owner_id)
+                .values(heartbeat_at=_now())
+            )
+            await db.commit()
+
+    async def _maintenance(self) -> None:
+        """
+        リースの更新・リースの切れたジョブの再登録・古いジョブの削除
+
+        ワーカーがジョブの実行で埋まっていても止まらないよう、ワーカーとは別のタスクで行う
+        """
+        last_prune = 0.0
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._renew_queued_leases()
+                # 実行中に停止した他のプロセスのジョブも、リースが切れたら再実行する
+                recovered = await self.recover()
+                if recovered:
+                    logger.info(f"リースの切れたジョブを再登録しました: {recovered}件")
+                    self._wakeup.set()
+                if time.monotonic() - last_prune >= 300:
+                    last_prune = time.monotonic()
+                    await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"ジョブキューの保守エラー: {e}")
+
+    async def start(self) -> None:
+        """リースの切れたジョブを戻してワーカーを起動（lifespanから呼ぶ）"""
+        recovered = await self.recover()
+        if recovered:
+            logger.info(f"中断されていたジョブを再登録しました: {recovered}件")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._maintenance_task = asyncio.create_task(self._maintenance())
+
+    async def stop(self) -> None:
+        """ワーカーを停止（実行中のジョブはリースが切れた後に再実行される）"""
+        tasks = self._tasks + ([self._maintenance_task] if self._maintenance_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._maintenance_task = None
+
+    async def count_by_status(self) -> Dict[str, int]:
+        """状態ごとのジョブ数（全プロセス分。/metrics の取得時に呼ぶ）"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(GenerationJob.status, func.count()).group_by(GenerationJob.status)
+            )).all()
+        return {status: count for status, count in rows}
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報（このプロセスの値のみ。DBには問い合わせない）"""
+        return {
+            "workers": self.workers,
+            "running_workers": sum(1 for task in self._tasks if not task.done()),
+            "secret_jobs": len(self._secrets),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "recovered": self.recovered,
+            "exhausted": self.exhausted,
+            "lost_leases": self.lost_leases
+        }
+
+
+def create_job_queue() -> JobQueue:
+    """環境変数の設定からジョブキューを作成"""
+    return JobQueue(
+        workers=int(os.getenv("JOB_WORKERS", "2")),
+        poll_interval=float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0")),
+        retention_seconds=int(os.getenv("JOB_RETENTION_SECONDS", "86400")),
+        lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    )
+
+# アプリ全体で共有するジョブキュー
+job_queue = create_job_queue()
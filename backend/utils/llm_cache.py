@@ -0,0 +1,229 @@
+"""
+LLM応答のコンテンツアドレス型キャッシュ
+
+キーは「正規化したメッセージ・モデル・生成パラメータ・プロンプトテンプレートの版」のSHA-256。
+同じ回答からの再生成（リトライ・二重クリック・テストデータの再実行）でGPT-4を呼び直さないようにする。
+
+- メモリ層: プロセス内のLRU（件数上限 + 有効期限）
+- ディスク層: llm_response_cache テーブル（件数上限 + 有効期限。再起動・複数ワーカーで共有）
+
+プロンプトテンプレートを変更したら、呼び出し側のテンプレート版を上げて古い応答を使わないようにする。
+
+環境変数:
+    LLM_CACHE_ENABLED         true | false（既定: true）
+    LLM_CACHE_MEMORY_ENTRIES  メモリ層の件数上限（既定: 256）
+    LLM_CACHE_DISK_ENTRIES    ディスク層の件数上限（既定: 5000）
+    LLM_CACHE_TTL_SECONDS     作成からの有効期限（既定: 604800 = 7日）
+"""
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, delete, func
+
+from database import AsyncSessionLocal, LLMCacheEntry
+
+
+def normalize_prompt(text: str) -> str:
+    """キー計算用にプロンプトを正規化（Unicode正規化・改行統一・行末空白と連続空行の除去）"""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    lines = [line.rstrip() for line in text.strip().split("\n")]
+    normalized = []
+    for line in lines:
+        if not line and normalized and not normalized[-1]:
+            continue
+        normalized.append(line)
+    return "\n".join(normalized)
+
+
+def make_cache_key(messages: List[Dict[str, str]], model: str, template_version: str, **params: Any) -> str:
+    """メッセージ・モデル・テンプレート版・生成パラメータからキャッシュキーを計算"""
+    payload = {
+        "template_version": template_version,
+        "model": model,
+        "messages": [
+            {"role": message["role"], "content": normalize_prompt(message["content"])}
+            for message in messages
+        ],
+        "params": params,
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """メモリLRU + SQLiteの2層キャッシュ"""
+
+    def __init__(self, enabled: bool, memory_entries: int, disk_entries: int, ttl_seconds: int):
+        self.enabled = enabled
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+        # cache_key -> (created_at, response)。先頭ほど最近使われていない
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # このプロセスでの統計
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.coalesced = 0    # 実行中の同一呼び出しに相乗りした件数
+        self.evictions = 0    # 上限超過による削除
+        self.expirations = 0  # 有効期限切れによる削除
+        # ディスク層の件数とサイズ（保存時の整理と /metrics の取得時に数え直す。未計測ならNone）
+        self.disk_entries_count: Optional[int] = None
+        self.disk_bytes: Optional[int] = None
+
+    def _remember(self, key: str, created_at: float, response: str) -> None:
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        """キャッシュ済みの応答を取得（なければNone）"""
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, response = entry
+            if created_at + self.ttl_seconds > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return response
+            del self._memory[key]
+            self.expirations += 1
+
+        async with AsyncSessionLocal() as db:
+            record = await db.get(LLMCacheEntry, key)
+            if record is None:
+                self.misses += 1
+                return None
+            if record.created_at + self.ttl_seconds <= now:
+                await db.delete(record)
+                await db.commit()
+                self.expirations += 1
+                self._forget_disk_entry(record.size_bytes)
+                self.misses += 1
+                return None
+            record.last_accessed = now
+            record.hits = (record.hits or 0) + 1
+            response = record.response
+            created_at = record.created_at
+            await db.commit()
+
+        self._remember(key, created_at, response)
+        self.disk_hits += 1
+        return response
+
+    async def set(self, key: str, response: str, model: str, template_version: str) -> None:
+        """応答を両方の層に保存"""
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        self._remember(key, now, response)
+
+        async with AsyncSessionLocal() as db:
+            record = await db.get(LLMCacheEntry, key)
+            if record is None:
+                db.add(LLMCacheEntry(
+                    cache_key=key,
+                    model=model,
+                    template_version=template_version,
+                    response=response,
+                    size_bytes=len(response.encode("utf-8")),
+                    created_at=now,
+                    last_accessed=now,
+                    hits=0
+                ))
+            else:
+                record.response = response
+                record.size_bytes = len(response.encode("utf-8"))
+                record.created_at = now
+                record.last_accessed = now
+            await db.commit()
+            await self._prune(db, now)
+        self.stores += 1
+
+    def _forget_disk_entry(self, size_bytes: Optional[int]) -> None:
+        if self.disk_entries_count is not None:
+            self.disk_entries_count = max(0, self.disk_entries_count - 1)
+        if self.disk_bytes is not None:
+            self.disk_bytes = max(0, self.disk_bytes - (size_bytes or 0))
+
+    async def _measure_disk(self, db) -> int:
+        """ディスク層の件数とサイズを数え直す（件数を返す）"""
+        total, size = (await db.execute(
+            select(func.count(), func.coalesce(func.sum(LLMCacheEntry.size_bytes), 0))
+        )).one()
+        self.disk_entries_count, self.disk_bytes = total, size
+        return total
+
+    async def _prune(self, db, now: float) -> None:
+        """ディスク層の期限切れを削除し、上限を超えた分を最終利用の古い順に削除"""
+        result = await db.execute(
+            delete(LLMCacheEntry).where(LLMCacheEntry.created_at <= now - self.ttl_seconds)
+        )
+        self.expirations += result.rowcount
+
+        total = await self._measure_disk(db)
+        overflow = total - self.disk_entries
+        if overflow > 0:
+            oldest = select(LLMCacheEntry.cache_key).order_by(
+                LLMCacheEntry.last_accessed.asc()
+            ).limit(overflow)
+            await db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.cache_key.in_(oldest)))
+            self.evictions += overflow
+            await self._measure_disk(db)
+        await db.commit()
+
+    async def measure_disk_entries(self) -> int:
+        """ディスク層の件数（/metrics の取得時に呼ぶ。/health ではDBに問い合わせない）"""
+        async with AsyncSessionLocal() as db:
+            return await self._measure_disk(db)
+
+    async def clear(self) -> None:
+        """両方の層を空にする"""
+        self._memory.clear()
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(LLMCacheEntry))
+            await db.commit()
+        self.disk_entries_count = 0
+        self.disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報（ディスク層の件数とサイズは最後に数えたときの値）"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "disk_entries": self.disk_entries_count,
+            "disk_bytes": self.disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+def create_llm_cache() -> LLMResponseCache:
+    """環境変数の設定からキャッシュを作成"""
+    return LLMResponseCache(
+        enabled=os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true",
+        memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256")),
+        disk_entries=int(os.getenv("LLM_CACHE_DISK_ENTRIES", "5000")),
+        ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", "604800"))
+    )
+
+# アプリ全体で共有するキャッシュ
+llm_cache = create_llm_cache()
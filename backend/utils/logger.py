@@ -0,0 +1,214 @@
+"""
+構造化ログ（JSON）とバックグラウンドでの書き出し
+
+print() はリクエストの処理中に標準出力へ同期的に書き込むため、出力先のパイプが詰まると
+イベントループごと止まる。ここではログを標準ライブラリの logging の QueueHandler で
+キューに積むだけにし、書き出しは QueueListener のスレッドで行う。
+
+- 各行は1件のJSON（time, level, logger, message と、あれば request_id, route, 追加の項目, exception）
+- request_id と route はログを出したリクエストのもの（utils.tracing のコンテキストから取得）
+- レベルに満たないログはキューに積む前に捨てる
+- キューがあふれた場合は待たずに捨てる（dropped に数える）
+
+環境変数:
+    LOG_LEVEL       出力するレベル DEBUG / INFO / WARNING / ERROR（既定: INFO）
+    LOG_LEVELS      モジュールごとのレベル（例: utils.slow_query_log=WARNING,routers.conversation=DEBUG）
+    LOG_FORMAT      json / text（既定: json。text は開発時に読みやすい1行形式）
+    LOG_FILE        出力先のファイル（未設定なら標準出力）
+    LOG_QUEUE_SIZE  書き出し待ちのログ数の上限（既定: 10000）
+
+使い方:
+    logger = get_logger(__name__)
+    logger.info("月報削除成功", extra={"report_id": report_id})
+    logger.exception("予期しないエラー")
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# アプリのロガーはすべてこの名前の下に作る（httpx などのライブラリのログとは分ける）
+ROOT_LOGGER_NAME = "app"
+
+# LogRecord の標準の属性（これ以外の属性は extra で渡された項目として出力する）
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_CONTEXT_ATTRIBUTES = ("request_id", "route")
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in _STANDARD_ATTRIBUTES and key not in _CONTEXT_ATTRIBUTES
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """1件のログを1行のJSONにする"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key in _CONTEXT_ATTRIBUTES:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        entry.update(_extra_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """開発用の1行形式（時刻 レベル [リクエストID] ロガー: メッセージ (ルート) 追加の項目）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        time_text = datetime.fromtimestamp(record.created).strftime("%H:%M:%S.%f")[:-3]
+        request_id = getattr(record, "request_id", None)
+        route = getattr(record, "route", None)
+        line = f"{time_text} {record.levelname:<7} [{request_id or '-'}] {record.name}: {record.getMessage()}"
+        if route:
+            line += f" ({route})"
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    ログをキューに積むだけのハンドラー（呼び出し元のスレッドで動く）
+
+    リクエストのコンテキスト（request_id, route）と例外のトレースバックはここで確定させる。
+    JSONへの変換と書き込みはリスナーのスレッドで行う。
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.emitted = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 循環インポートを避けるため、ここで読み込む（utils.tracing もこのモジュールを使う）
+        from utils.tracing import current_request_id, current_route
+
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if getattr(record, "request_id", None) is None:
+            record.request_id = current_request_id()
+        if getattr(record, "route", None) is None:
+            record.route = current_route()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            self.emitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """アプリのロガーの設定と、バックグラウンドの書き出しスレッド"""
+
+    def __init__(self, level: str, levels: Dict[str, str], log_format: str, path: Optional[str], queue_size: int):
+        self.level = level
+        self.log_format = log_format
+        self.path = path
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+        self.handler = NonBlockingQueueHandler(self._queue)
+
+        output = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+        self._listener: Optional[logging.handlers.QueueListener] = logging.handlers.QueueListener(self._queue, output)
+        self._listener.start()
+
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.handlers = [self.handler]
+        root.setLevel(level)
+        root.propagate = False
+        for name, module_level in levels.items():
+            logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}").setLevel(module_level)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """キューに積まれたログが書き出されるまで待つ（最大 timeout 秒）"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def shutdown(self) -> None:
+        """残りのログを書き出してスレッドを止める"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        return {
+            "level": self.level,
+            "format": self.log_format,
+            "emitted": self.handler.emitted,
+            "dropped": self.handler.dropped,
+            "queued": self._queue.qsize()
+        }
+
+
+def _parse_levels(value: str) -> Dict[str, str]:
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def create_log_writer() -> LogWriter:
+    """環境変数の設定からログの書き出しを作成"""
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    if not isinstance(logging.getLevelName(level), int):
+        sys.stderr.write(f"LOG_LEVEL の値が不正です: {level}（INFO を使います）\n")
+        level = "INFO"
+    log_format = os.getenv("LOG_FORMAT", "json").lower()
+    if log_format not in ("json", "text"):
+        sys.stderr.write(f"LOG_FORMAT の値が不正です: {log_format}（json を使います）\n")
+        log_format = "json"
+    levels = {
+        name: module_level for name, module_level in _parse_levels(os.getenv("LOG_LEVELS", "")).items()
+        if isinstance(logging.getLevelName(module_level), int)
+    }
+    return LogWriter(
+        level=level,
+        levels=levels,
+        log_format=log_format,
+        path=os.getenv("LOG_FILE") or None,
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    )
+
+# アプリ全体で共有するログの書き出し（終了時に残りを書き出す）
+log_writer = create_log_writer()
+atexit.register(log_writer.shutdown)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """モジュール用のロガー（get_logger(__name__) で作る）"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
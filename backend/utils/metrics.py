@@ -0,0 +1,413 @@
+"""
+Prometheus形式のメトリクス
+
+外部ライブラリを使わない最小限のメトリクス（Counter / Gauge / Histogram）と、
+HTTPリクエストを計測するASGIミドルウェア、DBクエリ時間を計測するSQLAlchemyのイベントフック。
+/metrics でテキスト形式（text/plain; version=0.0.4）を返す。
+
+記録するメトリクス:
+    http_requests_total                 リクエスト数（method, route, status）
+    http_requests_in_progress           処理中のリクエスト数（method）
+    http_request_duration_seconds       レイテンシのヒストグラム（method, route, status）
+    ai_generations_total                AI生成の結果（kind, outcome=success|fallback, reason）
+    db_query_duration_seconds           DBクエリ時間のヒストグラム（operation）
+    db_query_errors_total               実行に失敗したDBクエリ数（operation）
+    session_store_sessions              セッションストアのセッション数（取得時に計算）
+    llm_cache_disk_entries              LLMキャッシュのディスク層の件数（取得時に計算）
+    generation_jobs                     ジョブキューの状態ごとのジョブ数（status。取得時に計算）
+
+route はパスそのものではなくルートのテンプレート（例: /api/reports/{report_id}）。
+どのルートにも一致しないリクエストは "unmatched" にまとめる（ラベルの種類が増え続けないように）。
+
+使い方:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(async_engine)
+    record_ai_generation("report", succeeded=False, reason="no_api_key")
+"""
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from starlette.routing import Match
+
+from utils.logger import get_logger
+from utils.query_events import QueryObserver, query_events
+
+logger = get_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTPリクエスト用のバケット（AI生成の数十秒まで）
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# DBクエリ用のバケット
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+_SQL_OPERATION_PATTERN = re.compile(r"^\s*(\w+)")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """ラベルの組ごとに値を持つメトリクスの共通部分"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[str, ...]:
+        if kwargs:
+            args = tuple(kwargs[name] for name in self.labelnames)
+        if len(args) != len(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です")
+        return tuple(str(value) for value in args)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _CounterChild:
+    __slots__ = ("_metric", "value")
+
+    def __init__(self, metric: "Counter"):
+        self._metric = metric
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._metric._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def labels(self, *args: Any, **kwargs: Any) -> _CounterChild:
+        key = self._key(args, kwargs)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _CounterChild(self))
+        return child
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class _GaugeChild:
+    __slots__ = ("_metric", "value")
+
+    def __init__(self, metric: "Gauge"):
+        self._metric = metric
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._metric._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._metric._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class Gauge(_Metric):
+    """
+    現在値。collect を渡した場合は出力時にその関数で値を取得する
+    （ラベルが1つのゲージでは collect が {ラベルの値: 値} を返してもよい）
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Callable[[], Awaitable[Union[float, Dict[str, float]]]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def labels(self, *args: Any, **kwargs: Any) -> _GaugeChild:
+        key = self._key(args, kwargs)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _GaugeChild(self))
+        return child
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    async def refresh(self) -> None:
+        if self.collect is None:
+            return
+        value = await self.collect()
+        if isinstance(value, dict):
+            # 今回の取得になかったラベルの値は0にする
+            for child in self._children.values():
+                child.set(0)
+            for label, label_value in value.items():
+                self.labels(label).set(label_value)
+        else:
+            self.set(value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("_metric", "counts", "sum", "count")
+
+    def __init__(self, metric: "Histogram"):
+        self._metric = metric
+        self.counts = [0] * len(metric.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        buckets = self._metric.buckets
+        with self._metric._lock:
+            self.sum += value
+            self.count += 1
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def labels(self, *args: Any, **kwargs: Any) -> _HistogramChild:
+        key = self._key(args, kwargs)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _HistogramChild(self))
+        return child
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録とテキスト形式での出力"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"メトリクス {metric.name} は登録済みです")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = HTTP_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    async def render(self) -> str:
+        """Prometheusのテキスト形式（取得時に計算するゲージはここで更新する）"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            if isinstance(metric, Gauge):
+                try:
+                    await metric.refresh()
+                except Exception as e:
+                    logger.warning(f"メトリクスの取得エラー ({metric.name}): {e}", exc_info=e)
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+async def _session_store_size() -> float:
+    # session_store は utils.session_store がこのモジュールより後に読み込まれることもあるため遅延インポート
+    from utils.session_store import session_store
+    return await session_store.count()
+
+
+async def _llm_cache_disk_entries() -> float:
+    from utils.llm_cache import llm_cache
+    return await llm_cache.measure_disk_entries()
+
+
+async def _generation_jobs_by_status() -> Dict[str, float]:
+    from utils.job_queue import job_queue
+    return await job_queue.count_by_status()
+
+
+# アプリ全体で共有するレジストリとメトリクス
+metrics_registry = MetricsRegistry()
+
+http_requests_total = metrics_registry.counter(
+    "http_requests_total", "HTTPリクエスト数", ("method", "route", "status")
+)
+http_requests_in_progress = metrics_registry.gauge(
+    "http_requests_in_progress", "処理中のHTTPリクエスト数", ("method",)
+)
+http_request_duration_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTPリクエストのレイテンシ（秒）", ("method", "route", "status")
+)
+ai_generations = metrics_registry.counter(
+    "ai_generations_total", "AI生成の結果（success: AIの応答を使用, fallback: テンプレート等で代替）",
+    ("kind", "outcome", "reason")
+)
+db_query_duration_seconds = metrics_registry.histogram(
+    "db_query_duration_seconds", "DBクエリの実行時間（秒）", ("operation",), buckets=DB_BUCKETS
+)
+db_query_errors_total = metrics_registry.counter(
+    "db_query_errors_total", "実行に失敗したDBクエリ数", ("operation",)
+)
+session_store_sessions = metrics_registry.gauge(
+    "session_store_sessions", "セッションストアのセッション数", collect=_session_store_size
+)
+llm_cache_disk_entries = metrics_registry.gauge(
+    "llm_cache_disk_entries", "LLMキャッシュのディスク層の件数", collect=_llm_cache_disk_entries
+)
+generation_jobs = metrics_registry.gauge(
+    "generation_jobs", "ジョブキューの状態ごとのジョブ数", ("status",), collect=_generation_jobs_by_status
+)
+
+
+def record_ai_generation(kind: str, succeeded: bool, reason: str = "none") -> None:
+    """AI生成の結果を記録する（reason: フォールバックの理由。no_api_key / error など）"""
+    ai_generations.labels(kind=kind, outcome="success" if succeeded else "fallback", reason=reason).inc()
+
+
+# エンドポイント -> ルートのテンプレート（同じエンドポイントが複数のパスにある場合は None）
+_endpoint_paths: Dict[Any, Optional[str]] = {}
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """リクエストに一致したルートのテンプレート（一致しなければ "unmatched"）"""
+    endpoint = scope.get("endpoint")
+    if endpoint is not None and _endpoint_paths.get(endpoint):
+        return _endpoint_paths[endpoint]
+    router = getattr(scope.get("app"), "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            path = getattr(route, "path", "unmatched")
+            if endpoint is not None:
+                # 同じエンドポイントが別のパスで登録されていればキャッシュしない
+                paths = {getattr(r, "path", None) for r in router.routes if getattr(r, "endpoint", None) is endpoint}
+                _endpoint_paths[endpoint] = path if len(paths) == 1 else None
+            return path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """HTTPリクエストの件数・処理中の数・レイテンシを記録するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        in_progress = http_requests_in_progress.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_progress.dec()
+            route = route_template(scope)
+            status = str(status_holder["status"])
+            http_requests_total.labels(method, route, status).inc()
+            http_request_duration_seconds.labels(method, route, status).observe(elapsed)
+
+
+def _sql_operation(statement: str) -> str:
+    match = _SQL_OPERATION_PATTERN.match(statement)
+    operation = match.group(1).upper() if match else "OTHER"
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA") else "OTHER"
+
+
+class _DBMetricsObserver(QueryObserver):
+    """DBクエリ時間と失敗したクエリ数を記録する"""
+
+    def on_end(self, conn, statement, parameters, executemany, elapsed, state):
+        db_query_duration_seconds.labels(_sql_operation(statement)).observe(elapsed)
+
+    def on_error(self, conn, statement, elapsed, state, error):
+        db_query_errors_total.labels(_sql_operation(statement or "")).inc()
+
+
+_db_metrics_observer = _DBMetricsObserver()
+
+
+def instrument_engine(engine) -> None:
+    """SQLAlchemyのエンジン（AsyncEngine の場合は sync_engine）にクエリ時間の計測を追加する"""
+    query_events.subscribe(_db_metrics_observer)
+    query_events.instrument(engine)
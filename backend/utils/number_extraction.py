@@ -0,0 +1,134 @@
+"""
+日本語テキストからの数値抽出
+
+正規表現と全角→半角の変換テーブルはインポート時に一度だけ構築する。
+"""
+import re
+from typing import Any, Dict, Union
+
+# 全角数字・全角カンマ・全角小数点を半角に変換するテーブル
+_FULLWIDTH_TABLE = str.maketrans('０１２３４５６７８９，．', '0123456789,.')
+
+# 数値（カンマ区切り・小数点付き、全角対応）
+_NUMBER = r'[0-9０-９]+(?:[,，][0-9０-９]+)*(?:[.．][0-9０-９]+)?'
+
+# 数値と、直後の「万」「千」「百」を一度に捉える
+NUMBER_WITH_UNIT_PATTERN = re.compile(rf'(?P<number>{_NUMBER})\s*(?P<unit>[万千百])?')
+
+# 収入の「◯万円」（直前の「合計」も一度に捉える）
+MAN_YEN_PATTERN = re.compile(rf'(?P<total>合計\s*)?(?P<number>{_NUMBER})\s*万円')
+
+# 単位ごとの倍率（数値が小さいほど優先度が高い）
+_UNIT_MULTIPLIERS = {"万": 10000, "千": 1000, "百": 100}
+_UNIT_PRIORITY = {"万": 0, "千": 1, "百": 2}
+
+# 営業件数の抽出用
+INTEGER_PATTERN = re.compile(r'\d+')
+
+
+def _normalize_number(number_str: str) -> str:
+    """全角を含む数値文字列を半角・カンマなしにする（半角のみの場合は変換しない）"""
+    if not number_str.isascii():
+        number_str = number_str.translate(_FULLWIDTH_TABLE)
+    if ',' in number_str:
+        number_str = number_str.replace(',', '')
+    return number_str
+
+
+def _to_number(number_str: str) -> Union[int, float]:
+    """全角を含む数値文字列を int / float に変換"""
+    number_str = _normalize_number(number_str)
+    if '.' in number_str:
+        return float(number_str)
+    return int(number_str)
+
+
+def extract_number_from_text(text: str, default: Union[int, float] = 0) -> Union[int, float]:
+    """
+    日本語テキストから数値を抽出する
+    例: "160時間ぐらいすね" -> 160
+    例: "およそ200万円です" -> 2000000
+
+    単位付きの数値（万 > 千 > 百 の順に優先）があればそれを、
+    なければ最初に出てくる数値を返す。テキストは一度だけ走査する。
+    """
+    if not text or not isinstance(text, str):
+        return default
+
+    first_plain = None
+    best_unit = None
+    best_priority = len(_UNIT_PRIORITY)
+
+    for match in NUMBER_WITH_UNIT_PATTERN.finditer(text):
+        unit = match.group('unit')
+        if unit is None:
+            if first_plain is None:
+                first_plain = match.group('number')
+            continue
+        priority = _UNIT_PRIORITY[unit]
+        if priority < best_priority:
+            best_unit = match
+            best_priority = priority
+            if priority == 0:
+                break
+
+    if best_unit is not None:
+        result = float(_to_number(best_unit.group('number'))) * _UNIT_MULTIPLIERS[best_unit.group('unit')]
+        return int(result) if result == int(result) else result
+
+    if first_plain is not None:
+        return _to_number(first_plain)
+
+    return default
+
+
+def extract_income_amount(text: str) -> float:
+    """
+    収入の回答から金額（円）を抽出
+
+    「合計◯万円」があればその金額、なければ最初の「◯万円」。見つからない場合は0円。
+    例: "合計３０万円（A社１，２００万円の一部）" -> 300000.0
+    """
+    if not text:
+        return 0.0
+    start = text.find("合計")
+    if start < 0:
+        match = MAN_YEN_PATTERN.search(text)
+    else:
+        # 「合計」の位置から照合する（直後に「◯万円」が続く最初の「合計」を探す）
+        while True:
+            match = MAN_YEN_PATTERN.match(text, start)
+            start = -1 if match is not None else text.find("合計", start + 2)
+            if start < 0:
+                break
+    if match is None:
+        return 0.0
+    return float(_normalize_number(match.group('number'))) * 10000
+
+
+def sum_man_yen_amounts(text: str) -> float:
+    """テキスト中のすべての「◯万円」の合計金額（円）"""
+    if not text:
+        return 0.0
+    return sum(float(_normalize_number(match.group('number'))) for match in MAN_YEN_PATTERN.finditer(text)) * 10000
+
+
+def extract_answer_numbers(answers: Dict[str, Any]) -> Dict[str, Union[int, float]]:
+    """
+    対話の回答から月報の数値項目をまとめて抽出
+
+    Returns:
+        total_work_hours, received_amount, sales_emails_sent, sales_replies, sales_meetings
+    """
+    def answer_text(question_id: str) -> str:
+        return answers.get(question_id, {}).get("answer", "") or ""
+
+    sales_nums = INTEGER_PATTERN.findall(answer_text("sales_activities"))
+
+    return {
+        "total_work_hours": extract_number_from_text(answer_text("work_hours"), default=160.0),
+        "received_amount": extract_income_amount(answer_text("monthly_income")),
+        "sales_emails_sent": int(sales_nums[0]) if len(sales_nums) > 0 else 40,
+        "sales_replies": int(sales_nums[1]) if len(sales_nums) > 1 else 0,
+        "sales_meetings": int(sales_nums[2]) if len(sales_nums) > 2 else 0,
+    }
@@ -0,0 +1,287 @@
+"""
+OpenAIクライアントの共有プール
+
+APIキーごとに AsyncOpenAI クライアント（と内部のHTTPコネクションプール）を再利用する。
+キーそのものは保持せず、SHA-256ハッシュをプールのキーにする。
+
+使い方:
+    # キャッシュ付きで応答本文だけが必要な場合
+    content = await chat_completion(api_key, model="gpt-4", messages=[...], template_version="...")
+
+    # クライアントを直接使う場合（ストリーミングなど）。レート制限の実行枠も確保する
+    async with acquire_client(api_key, messages, max_tokens) as (client, permit):
+        response = await client.chat.completions.create(...)
+
+環境変数:
+    OPENAI_CLIENT_MAX_CLIENTS    保持するクライアント数の上限（既定: 32）
+    OPENAI_CLIENT_IDLE_SECONDS   未使用のクライアントを閉じるまでの秒数（既定: 600）
+    OPENAI_MAX_CONNECTIONS       クライアントごとの最大同時接続数（既定: 20）
+    OPENAI_MAX_KEEPALIVE         クライアントごとに保持するKeep-Alive接続数（既定: 10）
+    OPENAI_BASE_URL              APIの向け先（既定: OpenAI。負荷試験ではスタブサーバーのURL）
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from utils.llm_cache import llm_cache, make_cache_key
+from utils.rate_limiter import rate_limiter, estimate_request_tokens
+from utils.resilience import openai_breaker, openai_retry_policy, call_with_resilience
+from utils.token_budget import estimate_messages_tokens, token_usage
+from utils.tracing import tracer, request_id_headers
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def resolve_api_key(header_key: Optional[str] = None) -> Optional[str]:
+    """リクエストヘッダーのキーを優先し、なければ環境変数のキーを返す"""
+    return header_key or os.getenv("OPENAI_API_KEY") or None
+
+
+def hash_api_key(api_key: str) -> str:
+    """プールのキーに使うAPIキーのハッシュ"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class _PooledClient:
+    """プール内のクライアントと利用状況"""
+
+    __slots__ = ("client", "last_used", "in_use", "retired")
+
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.retired = False  # プールから外された（利用中のため閉じるのを保留している）
+
+
+class OpenAIClientPool:
+    """APIキーのハッシュごとに AsyncOpenAI を再利用するLRU + アイドル期限付きプール"""
+
+    def __init__(self, max_clients: int, idle_seconds: float, max_connections: int, max_keepalive: int):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive
+        )
+        # key_hash -> _PooledClient。先頭ほど最近使われていない
+        self._clients: "OrderedDict[str, _PooledClient]" = OrderedDict()
+        # このプロセスでの統計
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    def _create_client(self, api_key: str):
+        import openai
+        # 再試行は utils.resilience のポリシーで行うため、SDK側の再試行は無効にする。
+        # タイムアウトはストリーミングのチャンク待ちにも効くようにクライアントにも設定する
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            # 負荷試験ではスタブサーバー（benchmarks/openai_stub.py）に向ける
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_retries=0,
+            timeout=httpx.Timeout(openai_retry_policy.timeout_seconds, connect=10.0),
+            http_client=openai.DefaultAsyncHttpxClient(limits=self.limits)
+        )
+
+    async def _close(self, entry: _PooledClient) -> None:
+        try:
+            await entry.client.close()
+        except Exception as e:
+            logger.warning(f"OpenAIクライアントのクローズエラー: {e}")
+        self.closed += 1
+
+    async def _retire(self, entry: _PooledClient) -> None:
+        """プールから外したクライアントを閉じる（利用中なら返却時に閉じる）"""
+        entry.retired = True
+        if entry.in_use == 0:
+            await self._close(entry)
+
+    async def sweep(self) -> int:
+        """アイドル期限を過ぎたクライアントを閉じ、閉じた件数を返す"""
+        now = time.monotonic()
+        expired: List[str] = [
+            key for key, entry in self._clients.items()
+            if entry.in_use == 0 and now - entry.last_used >= self.idle_seconds
+        ]
+        for key in expired:
+            await self._retire(self._clients.pop(key))
+        return len(expired)
+
+    async def _acquire(self, api_key: str) -> _PooledClient:
+        await self.sweep()
+        key = hash_api_key(api_key)
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = _PooledClient(self._create_client(api_key))
+            self._clients[key] = entry
+            self.created += 1
+            while len(self._clients) > self.max_clients:
+                _, oldest = self._clients.popitem(last=False)
+                await self._retire(oldest)
+        else:
+            self.reused += 1
+        self._clients.move_to_end(key)
+        entry.in_use += 1
+        entry.last_used = time.monotonic()
+        return entry
+
+    async def _release(self, entry: _PooledClient) -> None:
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+        if entry.retired and entry.in_use == 0:
+            await self._close(entry)
+
+    @asynccontextmanager
+    async def client(self, api_key: str) -> AsyncIterator[Any]:
+        """APIキーに対応する AsyncOpenAI を貸し出す"""
+        entry = await self._acquire(api_key)
+        try:
+            yield entry.client
+        finally:
+            await self._release(entry)
+
+    async def close_all(self) -> None:
+        """全クライアントを閉じる（アプリ終了時）"""
+        while self._clients:
+            _, entry = self._clients.popitem(last=False)
+            await self._retire(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        return {
+            "live_clients": len(self._clients),
+            "in_use": sum(entry.in_use for entry in self._clients.values()),
+            "max_clients": self.max_clients,
+            "idle_seconds": self.idle_seconds,
+            "created": self.created,
+            "reused": self.reused,
+            "closed": self.closed
+        }
+
+
+def create_openai_client_pool() -> OpenAIClientPool:
+    """環境変数の設定からクライアントプールを作成"""
+    return OpenAIClientPool(
+        max_clients=int(os.getenv("OPENAI_CLIENT_MAX_CLIENTS", "32")),
+        idle_seconds=float(os.getenv("OPENAI_CLIENT_IDLE_SECONDS", "600")),
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+        max_keepalive=int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+    )
+
+# アプリ全体で共有するクライアントプール
+openai_clients = create_openai_client_pool()
+
+@asynccontextmanager
+async def acquire_client(api_key: str, messages: List[Dict[str, str]], max_tokens: int = 0):
+    """
+    レート制限の実行枠を確保してからクライアントを貸し出す
+
+    全てのOpenAI呼び出しはこれを通す。(client, permit) を返すので、
+    使用トークン数が分かれば permit.record_usage() でバケットに反映する
+    """
+    estimated_tokens = estimate_request_tokens(messages, max_tokens)
+    async with rate_limiter.acquire(api_key, estimated_tokens) as permit:
+        async with openai_clients.client(api_key) as client:
+            yield client, permit
+
+# 同じAPIキー・同じキャッシュキーで実行中の呼び出し（同時に来た同一リクエストは1回のAPI呼び出しを共有する）
+# APIキーごとに分けるのは、別のキーの認証エラーやレート制限を共有しないため
+_inflight: Dict[str, "asyncio.Future"] = {}
+
+
+def _current_task_cancelling() -> bool:
+    """実行中のタスク自身にキャンセルが要求されているか（Python 3.11 未満では判定できないため False）"""
+    task = asyncio.current_task()
+    cancelling = getattr(task, "cancelling", None)
+    return bool(cancelling and cancelling())
+
+async def chat_completion(
+    api_key: str,
+    *,
+    model: str,
+    messages: List[Dict[str, str]],
+    template_version: str,
+    **params: Any
+) -> str:
+    """
+    LLM応答キャッシュを通してChat Completionsを呼び出し、応答本文を返す
+
+    呼び出しには期限・再試行・サーキットブレーカーを適用する。
+    ブレーカーが開いている場合は CircuitOpenError を送出する（呼び出し側でフォールバック）
+
+    template_version: プロンプトテンプレートの版。テンプレートを変えたら上げる
+    params: max_tokens, temperature などの生成パラメータ（キャッシュキーにも含める）
+    """
+    with tracer.span("openai.chat_completion", model=model, template_version=template_version) as span:
+        key = make_cache_key(messages, model, template_version, **params)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            span.set_attribute("cache", "hit")
+            return cached
+
+        inflight_key = f"{hash_api_key(api_key)}:{key}"
+        pending = _inflight.get(inflight_key)
+        while pending is not None:
+            span.set_attribute("cache", "coalesced")
+            llm_cache.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled() or _current_task_cancelling():
+                    raise
+            # 先に呼び出したリクエストがキャンセルされた。実行中の呼び出しを確認し直し、なければ自分で呼び出す
+            pending = _inflight.get(inflight_key)
+
+        span.set_attribute("cache", "miss")
+        return await _call_and_cache(api_key, key, inflight_key, model, messages, template_version, params)
+
+async def _call_and_cache(
+    api_key: str,
+    key: str,
+    inflight_key: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    template_version: str,
+    params: Dict[str, Any]
+) -> str:
+    """APIを呼び出して応答をキャッシュする（実行中の呼び出しとして登録し、同じキーの呼び出しと共有する）"""
+    # レート制限の実行枠は期限の外で確保し、期限はAPIの呼び出しだけに適用する
+    def acquire():
+        return acquire_client(api_key, messages, params.get("max_tokens", 0))
+
+    async def call(acquired) -> str:
+        client, permit = acquired
+        with tracer.span("openai.request", model=model):
+            response = await client.chat.completions.create(
+                model=model, messages=messages, extra_headers=request_id_headers(), **params
+            )
+        permit.record_usage(response.usage.total_tokens if response.usage else None)
+        token_usage.record(template_version, estimate_messages_tokens(messages), response.usage)
+        return response.choices[0].message.content
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[inflight_key] = future
+    try:
+        content = await call_with_resilience(call, openai_retry_policy, openai_breaker, acquire)
+        await llm_cache.set(key, content, model, template_version)
+        future.set_result(content)
+        return content
+    except Exception as e:
+        future.set_exception(e)
+        # 待っている呼び出しがなくても「取得されなかった例外」の警告を出さない
+        future.exception()
+        raise
+    except BaseException:
+        # キャンセルなどは待っている呼び出しに伝えない（future をキャンセルし、それぞれが自分で呼び出し直す）
+        future.cancel()
+        raise
+    finally:
+        del _inflight[inflight_key]
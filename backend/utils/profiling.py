@@ -0,0 +1,316 @@
+"""
+リクエスト単位のプロファイリング（再デプロイせずに本番の1リクエストだけを計測する）
+
+X-Profile: 1 と X-Profile-Token: <PROFILE_TOKEN> を付けたリクエストをプロファイラーの下で実行し、
+結果を PROFILE_DIR に保存する。レスポンスの X-Profile-Id で保存先を示し、
+GET /api/profiles/ で一覧、GET /api/profiles/{profile_id} でダウンロードする。
+
+形式（PROFILE_FORMAT、またはリクエストの X-Profile-Format ヘッダーで指定）:
+    pstats     cProfile の結果（python -m pstats、snakeviz などで表示）
+    collapsed  イベントループのスレッドのスタックを一定間隔でサンプリングした折りたたみ形式
+               （flamegraph.pl、speedscope などでフレームグラフにできる）
+
+async の処理は1つのスレッドで交互に実行されるため、計測中に同時に処理された
+他のリクエストの処理も結果に含まれる。
+
+悪用してサーバーを遅くできないよう、同時に計測するのは1リクエストまでとし、
+PROFILE_WINDOW_SECONDS 秒あたり PROFILE_MAX_PER_WINDOW 件までに制限する。
+制限を超えた場合は計測せずに通常どおり処理する（X-Profile-Status: busy / rate_limited）。
+トークンが一致しないリクエストは X-Profile ヘッダーがないものとして扱う。
+
+環境変数:
+    PROFILE_TOKEN               計測を許可するトークン（未設定ならプロファイリング無効）
+    PROFILE_DIR                 保存先（既定: profiles）
+    PROFILE_FORMAT              既定の形式 pstats / collapsed（既定: pstats）
+    PROFILE_SAMPLE_INTERVAL_MS  collapsed のサンプリング間隔（既定: 5）
+    PROFILE_MAX_PER_WINDOW      期間内に計測できる件数（既定: 5）
+    PROFILE_WINDOW_SECONDS      期間の長さ（既定: 60）
+    PROFILE_MAX_FILES           保存しておくプロファイル数（古いものから削除。既定: 50）
+"""
+import asyncio
+import cProfile
+import hmac
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from utils.metrics import route_template
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_FORMATS = {"pstats": ".pstats", "collapsed": ".collapsed"}
+
+_PROFILE_ID_PATTERN = re.compile(r"^\d{8}-\d{6}-[0-9a-f]{8}$")
+
+
+def _frame_label(code) -> str:
+    """折りたたみ形式の1フレーム分（関数名とファイルの末尾2階層）"""
+    filename = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """別スレッドから対象スレッドのスタックを一定間隔で記録する"""
+
+    def __init__(self, thread_id: int, interval_seconds: float):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class CProfileProfiler:
+    """cProfile による決定的プロファイリング（有効にしたスレッドの全ての関数呼び出しを記録）"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def write(self, path: str) -> None:
+        self.profile.dump_stats(path)
+
+
+class RequestProfiler:
+    """計測の許可・回数制限と、プロファイルの保存・一覧"""
+
+    def __init__(
+        self,
+        token: Optional[str],
+        directory: str,
+        default_format: str,
+        sample_interval_seconds: float,
+        max_per_window: int,
+        window_seconds: float,
+        max_files: int
+    ):
+        self.token = token
+        self.directory = directory
+        self.default_format = default_format
+        self.sample_interval_seconds = sample_interval_seconds
+        self.max_per_window = max_per_window
+        self.window_seconds = window_seconds
+        self.max_files = max_files
+        self._active = False
+        self._started_at: deque = deque()
+        self.profiled = 0
+        self.rejected_busy = 0
+        self.rejected_rate_limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def authorized(self, token: Optional[str]) -> bool:
+        if not self.enabled or not token:
+            return False
+        return hmac.compare_digest(token.encode(), self.token.encode())
+
+    def try_start(self) -> Optional[str]:
+        """計測を始めてよければ None、だめなら理由（busy / rate_limited）を返す"""
+        if self._active:
+            self.rejected_busy += 1
+            return "busy"
+        now = time.monotonic()
+        while self._started_at and now - self._started_at[0] > self.window_seconds:
+            self._started_at.popleft()
+        if len(self._started_at) >= self.max_per_window:
+            self.rejected_rate_limited += 1
+            return "rate_limited"
+        self._started_at.append(now)
+        self._active = True
+        return None
+
+    def finish(self) -> None:
+        self._active = False
+
+    def create_profiler(self, profile_format: str):
+        if profile_format == "collapsed":
+            return SamplingProfiler(threading.get_ident(), self.sample_interval_seconds)
+        return CProfileProfiler()
+
+    def new_profile_id(self) -> str:
+        return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(4)}"
+
+    def save(self, profile_id: str, profile_format: str, profiler, metadata: Dict[str, Any]) -> None:
+        """プロファイルとメタデータ（.json）を保存し、古いプロファイルを削除する"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile_id + PROFILE_FORMATS[profile_format])
+        profiler.write(path)
+        metadata = {
+            **metadata,
+            "profile_id": profile_id,
+            "format": profile_format,
+            "size_bytes": os.path.getsize(path)
+        }
+        with open(os.path.join(self.directory, profile_id + ".json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        self.profiled += 1
+        self._prune()
+
+    def _prune(self) -> None:
+        for metadata in self.list_profiles()[self.max_files:]:
+            for suffix in (PROFILE_FORMATS[metadata["format"]], ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, metadata["profile_id"] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """保存済みのプロファイルのメタデータ（新しい順）"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or not _PROFILE_ID_PATTERN.match(name[:-5]):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda metadata: (metadata["created_at"], metadata["profile_id"]), reverse=True)
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        """プロファイルのファイルのパス（IDが不正・存在しない場合は None）"""
+        if not _PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        for suffix in PROFILE_FORMATS.values():
+            path = os.path.join(self.directory, profile_id + suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        return {
+            "enabled": self.enabled,
+            "active": self._active,
+            "profiled": self.profiled,
+            "rejected_busy": self.rejected_busy,
+            "rejected_rate_limited": self.rejected_rate_limited
+        }
+
+
+def create_request_profiler() -> RequestProfiler:
+    """環境変数の設定からプロファイラーの管理オブジェクトを作成"""
+    default_format = os.getenv("PROFILE_FORMAT", "pstats").lower()
+    if default_format not in PROFILE_FORMATS:
+        logger.warning(f"PROFILE_FORMAT の値が不正です: {default_format}（pstats を使います）")
+        default_format = "pstats"
+    return RequestProfiler(
+        token=os.getenv("PROFILE_TOKEN") or None,
+        directory=os.getenv("PROFILE_DIR", "profiles"),
+        default_format=default_format,
+        sample_interval_seconds=float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000,
+        max_per_window=int(os.getenv("PROFILE_MAX_PER_WINDOW", "5")),
+        window_seconds=float(os.getenv("PROFILE_WINDOW_SECONDS", "60")),
+        max_files=int(os.getenv("PROFILE_MAX_FILES", "50"))
+    )
+
+# アプリ全体で共有するプロファイラーの管理オブジェクト
+request_profiler = create_request_profiler()
+
+
+class ProfilingMiddleware:
+    """X-Profile: 1 を付けた許可済みのリクエストをプロファイラーの下で実行するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not request_profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name: value.decode("latin-1") for name, value in scope.get("headers", ())
+                   if name in (b"x-profile", b"x-profile-token", b"x-profile-format")}
+        if headers.get(b"x-profile") != "1" or not request_profiler.authorized(headers.get(b"x-profile-token")):
+            await self.app(scope, receive, send)
+            return
+
+        rejected = request_profiler.try_start()
+        if rejected:
+            await self.app(scope, receive, _with_headers(send, [(b"x-profile-status", rejected.encode())]))
+            return
+
+        profile_format = headers.get(b"x-profile-format", request_profiler.default_format)
+        if profile_format not in PROFILE_FORMATS:
+            profile_format = request_profiler.default_format
+        profile_id = request_profiler.new_profile_id()
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [
+                    (b"x-profile-status", b"profiled"), (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        profiler = request_profiler.create_profiler(profile_format)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            try:
+                # ファイルの書き出しはイベントループを止めないよう別スレッドで行う
+                await asyncio.to_thread(request_profiler.save, profile_id, profile_format, profiler, {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route_template(scope),
+                    "status_code": status_holder["status"],
+                    "duration_ms": duration_ms,
+                    "created_at": datetime.now().isoformat(timespec="milliseconds")
+                })
+            except Exception as e:
+                logger.exception(f"プロファイルの保存エラー ({profile_id}): {e}")
+            finally:
+                request_profiler.finish()
+
+
+def _with_headers(send, extra_headers):
+    async def send_wrapper(message):
+        if message["type"] == "http.response.start":
+            message["headers"] = list(message.get("headers", ())) + extra_headers
+        await send(message)
+    return send_wrapper
@@ -0,0 +1,199 @@
+"""
+リクエストごとのSQLクエリ数の計測とN+1の検出（開発・テスト用）
+
+SQLAlchemyのイベントでリクエスト中に実行されたSQL文を数え、
+- 同じSQL文の繰り返し（N+1や、同じ行の再読み込み）を警告する
+- エンドポイントに宣言したクエリ数の上限（@query_budget）を超えたら警告する。
+  strict モードでは上限を超えたクエリの実行時に QueryBudgetExceeded を送出して
+  リクエストを失敗させる（テストや benchmarks/check_query_budgets.py で検出するため）
+
+有効な場合はレスポンスに X-Query-Count ヘッダーを付ける。
+
+環境変数:
+    QUERY_COUNTER_MODE              off / warn / strict（既定: off）
+    QUERY_COUNTER_REPEAT_THRESHOLD  同じSQL文がこの回数以上実行されたら警告する（既定: 2。ルートとSQL文の組ごとに最初の1回のみ表示）
+
+使い方:
+    @router.get("/{report_id}")
+    @query_budget(1)
+    async def get_monthly_report(...):
+        ...
+"""
+import os
+import re
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.metrics import route_template
+from utils.logger import get_logger
+from utils.query_events import QueryObserver, query_events
+
+logger = get_logger(__name__)
+
+QUERY_COUNT_HEADER = b"x-query-count"
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+_current_log: ContextVar[Optional["QueryLog"]] = ContextVar("query_log", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """エンドポイントのクエリ数が宣言した上限を超えた（strict モード）"""
+
+
+def query_budget(max_queries: int) -> Callable:
+    """エンドポイントで実行してよいSQL文の数を宣言するデコレーター（ルーターのデコレーターの内側に付ける）"""
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+class QueryLog:
+    """1リクエスト分の実行されたSQL文"""
+
+    def __init__(self, scope: Dict[str, Any]):
+        self.scope = scope
+        self.statements: List[Tuple[str, str]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def budget(self) -> Optional[int]:
+        # ルートの照合後に scope に設定されるエンドポイントから取得する
+        return getattr(self.scope.get("endpoint"), "query_budget", None)
+
+    def record(self, statement: str, parameters: Any) -> None:
+        self.statements.append((_WHITESPACE_PATTERN.sub(" ", statement).strip(), repr(parameters)))
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int, int]]:
+        """threshold 回以上実行されたSQL文の (SQL文, 回数, パラメーターの種類数)"""
+        counts = Counter(statement for statement, _ in self.statements)
+        result = []
+        for statement, count in counts.most_common():
+            if count < threshold:
+                break
+            distinct = len({params for s, params in self.statements if s == statement})
+            result.append((statement, count, distinct))
+        return result
+
+
+class QueryCounter:
+    """リクエストごとのクエリ数の集計と警告"""
+
+    def __init__(self, mode: str, repeat_threshold: int):
+        self.mode = mode
+        self.repeat_threshold = repeat_threshold
+        self.requests = 0
+        self.queries = 0
+        self.repeated_warnings = 0
+        self.budget_violations = 0
+        # ルートごとの最大クエリ数
+        self.max_by_route: Dict[str, int] = {}
+        # 警告済みの (ルート, SQL文)。同じ繰り返しの警告は最初の1回だけ表示する
+        self._warned: Set[Tuple[str, str]] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("warn", "strict")
+
+    def on_query(self, statement: str, parameters: Any) -> None:
+        log = _current_log.get()
+        if log is None:
+            return
+        log.record(statement, parameters)
+        budget = log.budget
+        if self.mode == "strict" and budget is not None and log.count > budget:
+            self.budget_violations += 1
+            raise QueryBudgetExceeded(
+                f"{route_template(log.scope)} のクエリ数が上限 {budget} を超えました: {statement.strip()[:200]}"
+            )
+
+    def finish(self, log: QueryLog) -> None:
+        """リクエストの終了時に集計し、繰り返しや上限超過を警告する"""
+        route = route_template(log.scope)
+        method = log.scope["method"]
+        self.requests += 1
+        self.queries += log.count
+        self.max_by_route[f"{method} {route}"] = max(self.max_by_route.get(f"{method} {route}", 0), log.count)
+
+        budget = log.budget
+        if budget is not None and log.count > budget and self.mode != "strict":
+            self.budget_violations += 1
+            logger.warning(f"クエリ数の上限超過: {method} {route} {log.count}件（上限 {budget}件）")
+        for statement, count, distinct in log.repeated(self.repeat_threshold):
+            self.repeated_warnings += 1
+            if (route, statement) in self._warned:
+                continue
+            self._warned.add((route, statement))
+            kind = "同一パラメーター" if distinct == 1 else f"パラメーター{distinct}種類"
+            logger.warning(f"同じSQL文の繰り返し: {method} {route} {count}回（{kind}）", extra={"statement": statement[:200]})
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        return {
+            "mode": self.mode,
+            "requests": self.requests,
+            "queries": self.queries,
+            "repeated_warnings": self.repeated_warnings,
+            "budget_violations": self.budget_violations,
+            "max_by_route": dict(sorted(self.max_by_route.items()))
+        }
+
+
+def create_query_counter() -> QueryCounter:
+    """環境変数の設定からクエリカウンターを作成"""
+    mode = os.getenv("QUERY_COUNTER_MODE", "off").lower()
+    if mode not in ("off", "warn", "strict"):
+        logger.warning(f"QUERY_COUNTER_MODE の値が不正です: {mode}（無効にします）")
+        mode = "off"
+    return QueryCounter(mode, int(os.getenv("QUERY_COUNTER_REPEAT_THRESHOLD", "2")))
+
+# アプリ全体で共有するクエリカウンター
+query_counter = create_query_counter()
+
+
+class QueryCounterMiddleware:
+    """リクエストごとにSQL文を数えるASGIミドルウェア（X-Query-Count ヘッダーを付ける）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog(scope)
+        token = _current_log.set(log)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # ストリーミングの場合はヘッダー送信時点までの件数
+                message["headers"] = list(message.get("headers", ())) + [(QUERY_COUNT_HEADER, str(log.count).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_log.reset(token)
+            query_counter.finish(log)
+
+
+class _QueryCountObserver(QueryObserver):
+    """実行前のSQL文をリクエストのクエリ数に数える（strict モードでは上限超過で実行を中止する）"""
+
+    def on_start(self, conn, statement, parameters, executemany):
+        query_counter.on_query(statement, parameters)
+
+
+_query_count_observer = _QueryCountObserver()
+
+
+def count_queries(engine) -> None:
+    """SQLAlchemyのエンジン（AsyncEngine の場合は sync_engine）で実行されたSQL文を数える"""
+    query_events.subscribe(_query_count_observer)
+    query_events.instrument(engine)
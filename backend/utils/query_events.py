@@ -0,0 +1,129 @@
+"""
+SQL文の実行時間の計測フック
+
+SQLAlchemyのイベント（before_cursor_execute / after_cursor_execute / handle_error）は
+エンジンごとにこのモジュールの1組だけを登録し、1回の計測結果を購読しているオブザーバー
+（メトリクス・トレース・クエリ数の計測・スロークエリログ）に配る。
+開始時刻は接続ごとの1つのスタックで管理し、失敗したSQL文も handle_error で必ず取り出す。
+
+オブザーバーの on_start が例外を送出するとSQL文は実行されない（クエリ数の上限超過など）。
+この場合は handle_error が呼ばれないため、開始済みのオブザーバーにはここで on_error を送る。
+
+使い方:
+    class SlowQueryObserver(QueryObserver):
+        def on_end(self, conn, statement, parameters, executemany, elapsed, state): ...
+
+    query_events.subscribe(SlowQueryObserver())
+    query_events.instrument(async_engine)
+"""
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy import event
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 接続（conn.info）ごとの実行中のSQL文のスタック
+_STACK_KEY = "query_events"
+
+
+class QueryObserver:
+    """SQL文の実行を受け取るオブザーバー（必要なメソッドだけ上書きする）"""
+
+    def on_start(self, conn, statement: str, parameters: Any, executemany: bool) -> Any:
+        """実行前に呼ばれる。戻り値は on_end / on_error に state として渡される"""
+        return None
+
+    def on_end(self, conn, statement: str, parameters: Any, executemany: bool, elapsed: float, state: Any) -> None:
+        """実行後に呼ばれる（elapsed は秒）"""
+
+    def on_error(self, conn, statement: str, elapsed: float, state: Any, error: BaseException) -> None:
+        """実行に失敗した（または on_start で中止された）ときに呼ばれる"""
+
+
+class _Execution:
+    """実行中の1件のSQL文（開始時刻と、開始済みのオブザーバーごとの state）"""
+
+    __slots__ = ("started", "states")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.states: List[Any] = []
+
+
+class QueryEvents:
+    """エンジンごとに1組のイベントフックを登録し、オブザーバーに配る"""
+
+    def __init__(self):
+        self._observers: List[QueryObserver] = []
+        # このプロセスでの統計
+        self.errors = 0
+        self.observer_errors = 0
+
+    def subscribe(self, observer: QueryObserver) -> None:
+        """オブザーバーを登録する（登録済みなら何もしない。登録順に呼ばれる）"""
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    def instrument(self, engine) -> None:
+        """エンジン（AsyncEngine の場合は sync_engine）にフックを登録する（登録済みなら何もしない）"""
+        sync_engine = getattr(engine, "sync_engine", engine)
+        if event.contains(sync_engine, "before_cursor_execute", self._before_cursor_execute):
+            return
+        event.listen(sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(sync_engine, "handle_error", self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        execution = _Execution()
+        try:
+            for observer in self._observers:
+                execution.states.append(observer.on_start(conn, statement, parameters, executemany))
+        except BaseException as e:
+            self._notify_error(conn, statement, execution, e)
+            raise
+        conn.info.setdefault(_STACK_KEY, []).append(execution)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get(_STACK_KEY)
+        if not stack:
+            return
+        execution = stack.pop()
+        elapsed = time.perf_counter() - execution.started
+        for observer, state in zip(self._observers, execution.states):
+            try:
+                observer.on_end(conn, statement, parameters, executemany, elapsed, state)
+            except Exception as e:
+                # 1つのオブザーバーの失敗で他の計測やクエリの結果を壊さない
+                self.observer_errors += 1
+                logger.warning(f"SQL計測の処理エラー ({type(observer).__name__}): {e}", exc_info=e)
+
+    def _handle_error(self, exception_context):
+        conn = exception_context.connection
+        stack = conn.info.get(_STACK_KEY) if conn is not None else None
+        if not stack:
+            return
+        self._notify_error(conn, exception_context.statement, stack.pop(), exception_context.original_exception)
+
+    def _notify_error(self, conn, statement: str, execution: _Execution, error: BaseException) -> None:
+        self.errors += 1
+        elapsed = time.perf_counter() - execution.started
+        for observer, state in zip(self._observers, execution.states):
+            try:
+                observer.on_error(conn, statement, elapsed, state, error)
+            except Exception as e:
+                self.observer_errors += 1
+                logger.warning(f"SQL計測の処理エラー ({type(observer).__name__}): {e}", exc_info=e)
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        return {
+            "observers": [type(observer).__name__ for observer in self._observers],
+            "errors": self.errors,
+            "observer_errors": self.observer_errors
+        }
+
+# アプリ全体で共有する計測フック
+query_events = QueryEvents()
@@ -0,0 +1,222 @@
+"""
+OpenAI呼び出しの同時実行数・レート制限
+
+月末（15日締め）に月報生成が集中しても、プロバイダーのレート制限に当たって
+フォールバックが連鎖しないよう、全てのOpenAI呼び出しの手前で待たせる。
+
+- 全体の同時実行数の上限
+- APIキーごとの requests/分・tokens/分 のトークンバケット
+- 待ち時間の上限（超えたら OpenAIRateLimitTimeout。呼び出し側はAIエラーと同様にフォールバックする）
+
+使い方:
+    async with rate_limiter.acquire(api_key, estimated_tokens) as permit:
+        response = await client.chat.completions.create(...)
+        permit.record_usage(response.usage.total_tokens)
+
+環境変数:
+    OPENAI_MAX_CONCURRENCY         全体の同時実行数（既定: 8）
+    OPENAI_RPM_PER_KEY             APIキーごとの requests/分（既定: 60）
+    OPENAI_TPM_PER_KEY             APIキーごとの tokens/分（既定: 40000）
+    OPENAI_LIMIT_MAX_WAIT_SECONDS  待ち時間の上限（既定: 30）
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from utils.token_budget import estimate_messages_tokens
+
+# 保持するAPIキーごとのバケット数の上限（古いものから捨てる。捨てられたキーは満タンから再開）
+MAX_TRACKED_KEYS = 1024
+
+# 待ち時間の統計に使う直近の件数
+WAIT_SAMPLE_SIZE = 1000
+
+
+class OpenAIRateLimitTimeout(Exception):
+    """待ち時間の上限までに実行枠を確保できなかった"""
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: int = 0) -> int:
+    """リクエストのトークン数の概算（プロンプト + 最大生成トークン数）"""
+    return estimate_messages_tokens(messages) + max_tokens
+
+
+class TokenBucket:
+    """1分あたりの量で補充されるトークンバケット"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を取り出せるまでの秒数（0なら即時）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _KeyBuckets:
+    __slots__ = ("requests", "tokens")
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+
+class Permit:
+    """確保した実行枠。実際の使用トークン数が分かれば差分をバケットに反映する"""
+
+    def __init__(self, buckets: _KeyBuckets, reserved_tokens: int, waited_seconds: float):
+        self._buckets = buckets
+        self.reserved_tokens = reserved_tokens
+        self.waited_seconds = waited_seconds
+
+    def record_usage(self, actual_tokens: Optional[int]) -> None:
+        if actual_tokens is None:
+            return
+        difference = self.reserved_tokens - actual_tokens
+        if difference > 0:
+            self._buckets.tokens.give_back(difference)
+        else:
+            self._buckets.tokens.take(-difference)
+        self.reserved_tokens = actual_tokens
+
+
+class OpenAIRateLimiter:
+    """全体の同時実行数とAPIキーごとのRPM/TPMで呼び出しを待たせるリミッター"""
+
+    def __init__(self, max_concurrency: int, rpm_per_key: int, tpm_per_key: int, max_wait_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.rpm_per_key = rpm_per_key
+        self.tpm_per_key = tpm_per_key
+        self.max_wait_seconds = max_wait_seconds
+        # key_hash -> _KeyBuckets。先頭ほど最近使われていない
+        self._buckets: "OrderedDict[str, _KeyBuckets]" = OrderedDict()
+        self._released = asyncio.Condition()
+        self.in_flight = 0
+        self.queue_depth = 0
+        # このプロセスでの統計
+        self.max_queue_depth = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_observed = 0.0
+        self._recent_waits: deque = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+    def _key_buckets(self, api_key: str) -> _KeyBuckets:
+        key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            buckets = _KeyBuckets(self.rpm_per_key, self.tpm_per_key)
+            self._buckets[key] = buckets
+            while len(self._buckets) > MAX_TRACKED_KEYS:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return buckets
+
+    def _wait_needed(self, buckets: _KeyBuckets, tokens: int) -> Optional[float]:
+        """すぐ実行できれば None、できなければ次に確認するまでの秒数"""
+        now = time.monotonic()
+        bucket_wait = max(buckets.requests.wait_time(1, now), buckets.tokens.wait_time(tokens, now))
+        if bucket_wait == 0 and self.in_flight < self.max_concurrency:
+            return None
+        # 同時実行枠待ちのみの場合は解放通知で起きる（念のため定期的にも確認する）
+        return bucket_wait if bucket_wait > 0 else 1.0
+
+    @asynccontextmanager
+    async def acquire(self, api_key: str, estimated_tokens: int = 0) -> AsyncIterator[Permit]:
+        """実行枠を確保する（max_wait_seconds を超えたら OpenAIRateLimitTimeout）"""
+        buckets = self._key_buckets(api_key)
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            async with self._released:
+                while True:
+                    delay = self._wait_needed(buckets, estimated_tokens)
+                    if delay is None:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise OpenAIRateLimitTimeout(
+                            f"OpenAI呼び出しの実行枠を{self.max_wait_seconds:.0f}秒以内に確保できませんでした"
+                        )
+                    try:
+                        await asyncio.wait_for(self._released.wait(), timeout=min(delay, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                buckets.requests.take(1)
+                buckets.tokens.take(estimated_tokens)
+                self.in_flight += 1
+        finally:
+            self.queue_depth -= 1
+
+        waited = time.monotonic() - started
+        self._record_wait(waited)
+        try:
+            yield Permit(buckets, estimated_tokens, waited)
+        finally:
+            self.in_flight -= 1
+            async with self._released:
+                self._released.notify_all()
+
+    def _record_wait(self, waited: float) -> None:
+        self.acquired += 1
+        self.total_wait_seconds += waited
+        self.max_wait_observed = max(self.max_wait_observed, waited)
+        self._recent_waits.append(waited)
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        recent = sorted(self._recent_waits)
+        p95 = recent[max(0, int(len(recent) * 0.95) - 1)] if recent else 0.0
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rpm_per_key": self.rpm_per_key,
+            "tpm_per_key": self.tpm_per_key,
+            "max_wait_seconds": self.max_wait_seconds,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "wait_seconds_avg": round(self.total_wait_seconds / self.acquired, 4) if self.acquired else 0.0,
+            "wait_seconds_p95": round(p95, 4),
+            "wait_seconds_max": round(self.max_wait_observed, 4),
+            "tracked_keys": len(self._buckets)
+        }
+
+
+def create_rate_limiter() -> OpenAIRateLimiter:
+    """環境変数の設定からリミッターを作成"""
+    return OpenAIRateLimiter(
+        max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+        rpm_per_key=int(os.getenv("OPENAI_RPM_PER_KEY", "60")),
+        tpm_per_key=int(os.getenv("OPENAI_TPM_PER_KEY", "40000")),
+        max_wait_seconds=float(os.getenv("OPENAI_LIMIT_MAX_WAIT_SECONDS", "30"))
+    )
+
+# アプリ全体で共有するリミッター
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,120 @@
+"""
+月報・プロンプトのテンプレート描画
+
+レイアウトは backend/templates/ のJinja2テンプレートに置き、起動時（インポート時）に一度だけコンパイルして保持する。
+フォールバック月報（認証無効版・従来版）とAI生成プロンプトで共有する。
+
+使い方:
+    content = report_renderer.render(FALLBACK_REPORT_TEMPLATE, year_month=..., answer=answer_texts(answers), ...)
+
+環境変数:
+    REPORT_TEMPLATES_AUTO_RELOAD  テンプレートの変更を検知して再読み込みする（開発用。既定: false）
+"""
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates"
+
+FALLBACK_REPORT_TEMPLATE = "fallback_report.md.j2"
+TRADITIONAL_REPORT_TEMPLATE = "traditional_report.md.j2"
+REPORT_PROMPT_TEMPLATE = "report_prompt.md.j2"
+
+# 回答がない項目に入れる文言
+DEFAULT_ANSWERS = {
+    "life_changes": "家庭と仕事のバランスを大切に過ごしています",
+    "life_balance": "適切なワークライフバランスを心がけています",
+    "roles_responsibilities": "家庭や仕事での責任を果たしています",
+    "ideal_lifestyle": "理想の生活を目指して日々努力しています",
+    "core_values": "大切にしている価値観を意識しています",
+    "ideal_daily_life": "理想の未来に向けて着実に進んでいます",
+    "monthly_goals": "目標設定なし",
+    "goal_achievement": "詳細な振り返りを実施中",
+    "monthly_activities": "継続的な業務改善に取り組んでいます",
+    "project_details": "各案件で着実な成果を上げています",
+    "sales_activities": "営業活動を継続的に実施",
+    "learning_highlights": "新しい技術や手法の学習を継続",
+    "challenges": "今月の課題を整理中",
+    "discoveries": "新たな発見と改善策を模索中",
+    "growth_points": "継続的な成長を実感",
+    "happy_moments": "充実した時間を過ごすことができました",
+    "next_month_goals": "来月の目標を具体的に設定予定",
+    "things_to_stop": "効率化のための見直しを継続",
+}
+
+
+def answer_texts(answers: Dict[str, Any]) -> Dict[str, str]:
+    """
+    セッションの回答（question_id -> {"answer": ...}）をテンプレート用の question_id -> 回答テキストにする
+
+    回答のない項目は DEFAULT_ANSWERS の文言になる
+    """
+    texts = dict(DEFAULT_ANSWERS)
+    for question_id, entry in answers.items():
+        if isinstance(entry, dict) and "answer" in entry:
+            texts[question_id] = entry["answer"]
+    return texts
+
+
+class ReportRenderer:
+    """コンパイル済みテンプレートを保持して描画する"""
+
+    def __init__(self, template_dir: Path, auto_reload: bool = False):
+        self.template_dir = template_dir
+        self.auto_reload = auto_reload
+        self.environment = Environment(
+            loader=FileSystemLoader(str(template_dir)),
+            # Markdown・プロンプトを出力するためHTMLエスケープはしない
+            autoescape=False,
+            # 変数名の誤りを空文字で見逃さない
+            undefined=StrictUndefined,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=auto_reload
+        )
+        self._templates: Dict[str, Template] = {}
+        # このプロセスでの統計
+        self.renders = 0
+
+    def preload(self) -> int:
+        """テンプレートディレクトリ内の全テンプレートをコンパイルし、件数を返す"""
+        for name in self.environment.list_templates(extensions=["j2"]):
+            self._templates[name] = self.environment.get_template(name)
+        return len(self._templates)
+
+    def template(self, name: str) -> Template:
+        if self.auto_reload:
+            # 変更の確認は Environment のキャッシュに任せる
+            return self.environment.get_template(name)
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = self.environment.get_template(name)
+        return template
+
+    def render(self, name: str, **context: Any) -> str:
+        """テンプレートを描画する"""
+        self.renders += 1
+        return self.template(name).render(**context)
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        return {
+            "templates": sorted(self._templates),
+            "auto_reload": self.auto_reload,
+            "renders": self.renders
+        }
+
+
+def create_report_renderer() -> ReportRenderer:
+    """環境変数の設定からレンダラーを作成し、テンプレートをコンパイルしておく"""
+    renderer = ReportRenderer(
+        TEMPLATE_DIR,
+        auto_reload=os.getenv("REPORT_TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
+    )
+    renderer.preload()
+    return renderer
+
+# アプリ全体で共有するレンダラー
+report_renderer = create_report_renderer()
@@ -0,0 +1,267 @@
+"""
+AI呼び出しのタイムアウト・リトライ・サーキットブレーカー
+
+- 1回の呼び出しごとの期限（超えたら asyncio.TimeoutError）
+- 再試行できるエラー（タイムアウト・接続エラー・429・5xx）はジッター付き指数バックオフで再試行
+- 上流の障害が続いたらブレーカーを開き、回復時間が過ぎるまで即座に CircuitOpenError を返す
+  （呼び出し側はAIエラーと同様にテンプレートのフォールバックへ切り替える）
+
+認証エラーや不正なリクエストはAPIキー・入力の問題なので、再試行もブレーカーの失敗数にも数えない。
+
+環境変数:
+    OPENAI_TIMEOUT_SECONDS           1回の呼び出しの期限（既定: 90）
+    OPENAI_MAX_RETRIES               再試行の回数（既定: 2）
+    OPENAI_RETRY_BASE_DELAY          バックオフの基準秒数（既定: 1.0）
+    OPENAI_RETRY_MAX_DELAY           バックオフの上限秒数（既定: 10.0）
+    OPENAI_BREAKER_FAILURE_THRESHOLD ブレーカーを開く連続失敗数（既定: 5）
+    OPENAI_BREAKER_RECOVERY_SECONDS  ブレーカーを開いてから試行を再開するまでの秒数（既定: 60）
+"""
+import asyncio
+import os
+import random
+import time
+from contextlib import AsyncExitStack, contextmanager
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Optional, TypeVar
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーが開いているため呼び出しを行わなかった"""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """再試行すれば成功する可能性のあるエラーか（上流の障害・混雑）"""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code >= 500
+    return False
+
+
+def is_upstream_response(exc: BaseException) -> bool:
+    """上流がHTTPレスポンスを返したエラーか（上流自体には到達できている）"""
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(exc, openai.APIStatusError)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """429などのレスポンスに Retry-After があればその秒数"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """連続失敗で開き、回復時間の経過後に1件だけ試行（half_open）して閉じるブレーカー"""
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        # このプロセスでの統計
+        self.opens = 0
+        self.rejected = 0
+        self.failures = 0
+        self.successes = 0
+
+    def before_call(self) -> None:
+        """呼び出し前の確認（開いていれば CircuitOpenError）"""
+        if self.state == CIRCUIT_OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_seconds:
+                self.rejected += 1
+                raise CircuitOpenError("AI生成が一時的に停止しています（上流の障害が続いています）")
+            self.state = CIRCUIT_HALF_OPEN
+        if self.state == CIRCUIT_HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError("AI生成の復旧を確認中です")
+            self._probe_in_flight = True
+
+    def release_probe(self) -> None:
+        """成否が分からないまま終わった呼び出し（キャンセルなど）の後始末"""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = None
+
+    def record_failure(self, exc: BaseException) -> None:
+        """上流の障害によるエラーのみ失敗として数える"""
+        self._probe_in_flight = False
+        if not is_retryable(exc):
+            # APIキーや入力の問題は上流の健全性とは無関係。上流が応答していれば復旧とみなす
+            if is_upstream_response(exc):
+                self.consecutive_failures = 0
+                self.state = CIRCUIT_CLOSED
+                self.opened_at = None
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                self.opens += 1
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+
+    @contextmanager
+    def guard(self):
+        """with ブロック内の処理の成否をブレーカーに記録する（ストリーミング用）"""
+        self.before_call()
+        try:
+            yield
+        except CircuitOpenError:
+            raise
+        except BaseException as e:
+            if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+                # クライアントの切断などは成否を判断できないため記録しない
+                self.release_probe()
+                raise
+            self.record_failure(e)
+            raise
+        else:
+            self.record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        retry_in = None
+        if self.state == CIRCUIT_OPEN and self.opened_at is not None:
+            retry_in = round(max(0.0, self.recovery_seconds - (time.monotonic() - self.opened_at)), 1)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_seconds": self.recovery_seconds,
+            "retry_in_seconds": retry_in,
+            "opens": self.opens,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "successes": self.successes
+        }
+
+
+class RetryPolicy:
+    """呼び出しごとの期限とジッター付き指数バックオフ"""
+
+    def __init__(self, timeout_seconds: float, max_retries: int, base_delay: float, max_delay: float):
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # このプロセスでの統計
+        self.retries = 0
+        self.timeouts = 0
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        """attempt回目（0始まり）の失敗後に待つ秒数（フルジッター。Retry-Afterがあればそれ以上）"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "timeout_seconds": self.timeout_seconds,
+            "max_retries": self.max_retries,
+            "retries": self.retries,
+            "timeouts": self.timeouts
+        }
+
+
+async def call_with_resilience(
+    func: Callable[..., Awaitable[T]],
+    policy: "RetryPolicy",
+    breaker: CircuitBreaker,
+    acquire: Optional[Callable[[], AsyncContextManager[Any]]] = None
+) -> T:
+    """
+    ブレーカーを確認し、期限付きで func を呼び出す。再試行できるエラーはバックオフして再試行する
+
+    acquire を渡すと、試行ごとにその資源（レート制限の実行枠など）を確保してから func(資源) を呼ぶ。
+    確保の待ち時間は自分たちの混雑なので期限に含めず、確保できなかった場合も
+    上流の失敗としてブレーカーや再試行に数えない（そのまま送出する）
+
+    ブレーカーが開いていれば CircuitOpenError、再試行を使い切れば最後のエラーを送出する
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        error: Optional[Exception] = None
+        # 資源は試行ごとに確保し、バックオフの前に返す
+        async with AsyncExitStack() as stack:
+            try:
+                resource = await stack.enter_async_context(acquire()) if acquire is not None else None
+            except BaseException:
+                breaker.release_probe()
+                raise
+            try:
+                call = func(resource) if acquire is not None else func()
+                result = await asyncio.wait_for(call, timeout=policy.timeout_seconds)
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except Exception as e:
+                error = e
+        if error is None:
+            breaker.record_success()
+            return result
+        if isinstance(error, asyncio.TimeoutError):
+            policy.timeouts += 1
+        breaker.record_failure(error)
+        if not is_retryable(error) or attempt >= policy.max_retries:
+            raise error
+        delay = policy.backoff(attempt, error)
+        logger.warning(f"AI呼び出しを再試行します（{attempt + 1}回目, {delay:.1f}秒後）: {error!r}")
+        policy.retries += 1
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def create_circuit_breaker() -> CircuitBreaker:
+    """環境変数の設定からブレーカーを作成"""
+    return CircuitBreaker(
+        failure_threshold=int(os.getenv("OPENAI_BREAKER_FAILURE_THRESHOLD", "5")),
+        recovery_seconds=float(os.getenv("OPENAI_BREAKER_RECOVERY_SECONDS", "60"))
+    )
+
+def create_retry_policy() -> RetryPolicy:
+    """環境変数の設定から再試行ポリシーを作成"""
+    return RetryPolicy(
+        timeout_seconds=float(os.getenv("OPENAI_TIMEOUT_SECONDS", "90")),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+        base_delay=float(os.getenv("OPENAI_RETRY_BASE_DELAY", "1.0")),
+        max_delay=float(os.getenv("OPENAI_RETRY_MAX_DELAY", "10.0"))
+    )
+
+# OpenAI呼び出しで共有するブレーカーと再試行ポリシー
+openai_breaker = create_circuit_breaker()
+openai_retry_policy = create_retry_policy()
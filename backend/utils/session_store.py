@@ -0,0 +1,238 @@
+"""
+対話セッションの保存先
+
+- MemorySessionStore: プロセス内のLRU + TTL（既定）
+- SQLiteSessionStore: conversation_sessions テーブルに保存（再起動・複数ワーカー対応）
+
+環境変数:
+    SESSION_STORE_BACKEND           memory | sqlite（既定: memory）
+    SESSION_TTL_SECONDS             最終更新からの有効期限（既定: 21600 = 6時間）
+    SESSION_MAX_SESSIONS            保持するセッション数の上限（既定: 1000）
+    SESSION_SWEEP_INTERVAL_SECONDS  期限切れセッションの掃除間隔（既定: 300）
+"""
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, delete, func
+
+from database import AsyncSessionLocal, ConversationSessionRecord
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SessionStore(ABC):
+    """セッションストアの共通インターフェース"""
+
+    backend_name = "base"
+
+    def __init__(self, ttl_seconds: int, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        # このプロセスで発生した削除件数
+        self.evictions = 0    # 上限超過による削除
+        self.expirations = 0  # 有効期限切れによる削除
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """セッションを取得（存在しない・期限切れの場合はNone）"""
+
+    @abstractmethod
+    async def set(self, session_id: str, data: Dict[str, Any]) -> None:
+        """セッションを保存し、有効期限を延長"""
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        """セッションを削除"""
+
+    @abstractmethod
+    async def sweep(self) -> int:
+        """期限切れのセッションを削除し、削除件数を返す"""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """保持しているセッション数"""
+
+    @abstractmethod
+    def known_count(self) -> Optional[int]:
+        """最後に確認したセッション数（ストアに問い合わせない。未確認ならNone）"""
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報（/health から呼ぶためストアには問い合わせない）"""
+        return {
+            "backend": self.backend_name,
+            "live_sessions": self.known_count(),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """プロセス内のLRU + TTLストア"""
+
+    backend_name = "memory"
+
+    def __init__(self, ttl_seconds: int, max_sessions: int):
+        super().__init__(ttl_seconds, max_sessions)
+        # session_id -> (expires_at, data)。先頭ほど最近使われていない
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at <= time.time():
+            del self._sessions[session_id]
+            self.expirations += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        return data
+
+    async def set(self, session_id: str, data: Dict[str, Any]) -> None:
+        self._sessions[session_id] = (time.time() + self.ttl_seconds, data)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    async def sweep(self) -> int:
+        now = time.time()
+        expired = [key for key, (expires_at, _) in self._sessions.items() if expires_at <= now]
+        for key in expired:
+            del self._sessions[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def count(self) -> int:
+        return len(self._sessions)
+
+    def known_count(self) -> Optional[int]:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """conversation_sessions テーブルに保存するストア"""
+
+    backend_name = "sqlite"
+
+    def __init__(self, ttl_seconds: int, max_sessions: int):
+        super().__init__(ttl_seconds, max_sessions)
+        # 最後に数えたセッション数（新規作成時の上限確認・掃除・/metrics の取得時に更新）
+        self._last_count: Optional[int] = None
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        async with AsyncSessionLocal() as db:
+            record = await db.get(ConversationSessionRecord, session_id)
+            if record is None:
+                return None
+            if record.expires_at <= time.time():
+                await db.delete(record)
+                await db.commit()
+                self.expirations += 1
+                return None
+            return json.loads(record.data)
+
+    async def set(self, session_id: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        async with AsyncSessionLocal() as db:
+            record = await db.get(ConversationSessionRecord, session_id)
+            is_new = record is None
+            if is_new:
+                db.add(ConversationSessionRecord(
+                    session_id=session_id,
+                    data=payload,
+                    expires_at=now + self.ttl_seconds,
+                    updated_at=now
+                ))
+            else:
+                record.data = payload
+                record.expires_at = now + self.ttl_seconds
+                record.updated_at = now
+            await db.commit()
+            if is_new:
+                await self._enforce_limit(db)
+
+    async def _enforce_limit(self, db) -> None:
+        """上限を超えた分を最終更新の古い順に削除"""
+        total = await db.scalar(select(func.count()).select_from(ConversationSessionRecord))
+        self._last_count = total
+        overflow = total - self.max_sessions
+        if overflow <= 0:
+            return
+        oldest = select(ConversationSessionRecord.session_id).order_by(
+            ConversationSessionRecord.updated_at.asc()
+        ).limit(overflow)
+        await db.execute(
+            delete(ConversationSessionRecord).where(ConversationSessionRecord.session_id.in_(oldest))
+        )
+        await db.commit()
+        self.evictions += overflow
+        self._last_count = total - overflow
+
+    async def delete(self, session_id: str) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(ConversationSessionRecord).where(ConversationSessionRecord.session_id == session_id)
+            )
+            await db.commit()
+
+    async def sweep(self) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(ConversationSessionRecord).where(ConversationSessionRecord.expires_at <= time.time())
+            )
+            await db.commit()
+        self.expirations += result.rowcount
+        if self._last_count is not None:
+            self._last_count = max(0, self._last_count - result.rowcount)
+        return result.rowcount
+
+    async def count(self) -> int:
+        async with AsyncSessionLocal() as db:
+            self._last_count = await db.scalar(select(func.count()).select_from(ConversationSessionRecord))
+        return self._last_count
+
+    def known_count(self) -> Optional[int]:
+        return self._last_count
+
+
+SESSION_STORE_BACKENDS = {
+    "memory": MemorySessionStore,
+    "sqlite": SQLiteSessionStore,
+}
+
+def create_session_store() -> SessionStore:
+    """環境変数の設定からセッションストアを作成"""
+    backend = os.getenv("SESSION_STORE_BACKEND", "memory").lower()
+    if backend not in SESSION_STORE_BACKENDS:
+        raise ValueError(f"未対応のSESSION_STORE_BACKENDです: {backend}")
+    return SESSION_STORE_BACKENDS[backend](
+        ttl_seconds=int(os.getenv("SESSION_TTL_SECONDS", "21600")),
+        max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    )
+
+async def run_session_sweeper(store: SessionStore, interval_seconds: Optional[int] = None):
+    """期限切れセッションを定期的に掃除（lifespanでバックグラウンドタスクとして起動）"""
+    if interval_seconds is None:
+        interval_seconds = int(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await store.sweep()
+        except Exception as e:
+            logger.exception(f"セッション掃除エラー: {e}")
+
+# アプリ全体で共有するセッションストア
+session_store = create_session_store()
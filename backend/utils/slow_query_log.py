@@ -0,0 +1,237 @@
+"""
+スロークエリログ
+
+実行時間がしきい値を超えたSQL文を記録し、正規化したSQL文ごとに集計する。
+記録には伏せ字にしたパラメーター・呼び出し元のルート・SQLiteの EXPLAIN QUERY PLAN を含め、
+データが増えたときにどの月報のクエリがテーブル全体を走査しているかを確認できるようにする。
+計測は utils.query_events の共通フックで行い（database.py で登録）、集計結果は /health/slow-queries で参照する
+（SQL文やクエリプランを含むため、/api/profiles と同じく X-Profile-Token が必要）。
+
+環境変数:
+    SLOW_QUERY_THRESHOLD_MS      記録するしきい値（ミリ秒。既定: 100、負の値で無効）
+    SLOW_QUERY_EXPLAIN           SQLiteで EXPLAIN QUERY PLAN を取得するか（既定: true）
+    SLOW_QUERY_MAX_STATEMENTS    集計する正規化SQL文の種類の上限（既定: 200）
+"""
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from utils.logger import get_logger
+from utils.query_events import QueryObserver, query_events
+from utils.tracing import current_route
+
+logger = get_logger(__name__)
+
+# 数値・文字列リテラルは ? に置き換え、IN (?, ?, ...) は1つにまとめる
+_STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL_PATTERN = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_PATTERN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# EXPLAIN QUERY PLAN を取る文の種類（INSERT などは計画が単純なため対象外）
+_EXPLAINABLE_PATTERN = re.compile(r"^\s*(SELECT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+# ルートごとの記録は正規化SQL文ごとにこの件数まで
+_MAX_ROUTES_PER_STATEMENT = 10
+
+
+def normalize_statement(statement: str) -> str:
+    """集計用にSQL文を正規化する（リテラルを ? に、空白を1つに）"""
+    normalized = _STRING_LITERAL_PATTERN.sub("?", statement)
+    normalized = _NUMBER_LITERAL_PATTERN.sub("?", normalized)
+    normalized = _WHITESPACE_PATTERN.sub(" ", normalized).strip()
+    return _IN_LIST_PATTERN.sub("(?...)", normalized)
+
+
+def _redact_value(value: Any) -> Any:
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    if isinstance(value, (bytes, bytearray)):
+        return f"<bytes:{len(value)}>"
+    # 数値・日時なども値は残さず型名だけにする
+    return f"<{type(value).__name__}>"
+
+
+def redact_parameters(parameters: Any, executemany: bool = False) -> Any:
+    """パラメーターの値を型と長さだけにする（個人情報や月報の本文をログに残さない）"""
+    if executemany:
+        rows = list(parameters or [])
+        return {"rows": len(rows), "first": redact_parameters(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: _redact_value(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact_value(value) for value in parameters]
+    return _redact_value(parameters)
+
+
+def is_explainable(statement: str) -> bool:
+    return bool(_EXPLAINABLE_PATTERN.match(statement))
+
+
+def plan_scans_table(plan: List[str]) -> bool:
+    """クエリプランにインデックスを使わないテーブル全体の走査（SCAN テーブル）が含まれるか"""
+    return any(line.startswith("SCAN ") and " USING " not in line for line in plan)
+
+
+class SlowQueryLog:
+    """しきい値を超えたSQL文の正規化SQL文ごとの集計"""
+
+    def __init__(self, threshold_ms: float, explain: bool, max_statements: int):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.slow_queries = 0
+        self.untracked = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms >= 0
+
+    def is_slow(self, elapsed_ms: float) -> bool:
+        return self.enabled and elapsed_ms >= self.threshold_ms
+
+    def needs_plan(self, normalized: str) -> bool:
+        """この正規化SQL文のクエリプランをまだ取得していないか"""
+        entry = self._entries.get(normalized)
+        return entry is None or entry["plan"] is None
+
+    def record(
+        self,
+        statement: str,
+        normalized: str,
+        elapsed_ms: float,
+        parameters: Any,
+        route: Optional[str],
+        plan: Optional[List[str]]
+    ) -> None:
+        """スロークエリを1件記録してログに出力する"""
+        with self._lock:
+            self.slow_queries += 1
+            entry = self._entries.get(normalized)
+            if entry is None:
+                if len(self._entries) >= self.max_statements:
+                    self.untracked += 1
+                else:
+                    entry = self._entries[normalized] = {
+                        "statement": normalized,
+                        "count": 0,
+                        "total_ms": 0.0,
+                        "max_ms": 0.0,
+                        "routes": {},
+                        "plan": None,
+                        "full_table_scan": None,
+                        "first_seen": datetime.now().isoformat(timespec="seconds")
+                    }
+            if entry is not None:
+                entry["count"] += 1
+                entry["total_ms"] += elapsed_ms
+                entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+                entry["last_seen"] = datetime.now().isoformat(timespec="seconds")
+                entry["last_parameters"] = parameters
+                route_key = route or "(リクエスト外)"
+                if route_key in entry["routes"] or len(entry["routes"]) < _MAX_ROUTES_PER_STATEMENT:
+                    entry["routes"][route_key] = entry["routes"].get(route_key, 0) + 1
+                if plan is not None:
+                    entry["plan"] = plan
+                    entry["full_table_scan"] = plan_scans_table(plan)
+                plan = entry["plan"]
+
+        logger.warning(f"スロークエリ {elapsed_ms:.1f}ms", extra={
+            "duration_ms": round(elapsed_ms, 3),
+            "route": route,
+            "statement": _WHITESPACE_PATTERN.sub(" ", statement).strip()[:300],
+            "params": parameters,
+            "plan": plan
+        })
+
+    def entries(self, limit: int = 50, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        """集計結果（既定では合計時間の長い順）"""
+        with self._lock:
+            entries = [
+                {**entry, "total_ms": round(entry["total_ms"], 3), "max_ms": round(entry["max_ms"], 3),
+                 "avg_ms": round(entry["total_ms"] / entry["count"], 3), "routes": dict(entry["routes"])}
+                for entry in self._entries.values()
+            ]
+        return sorted(entries, key=lambda entry: entry.get(order_by) or 0, reverse=True)[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.slow_queries = 0
+            self.untracked = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        with self._lock:
+            full_scans = sum(1 for entry in self._entries.values() if entry["full_table_scan"])
+            return {
+                "enabled": self.enabled,
+                "threshold_ms": self.threshold_ms,
+                "slow_queries": self.slow_queries,
+                "tracked_statements": len(self._entries),
+                "full_table_scan_statements": full_scans,
+                "untracked": self.untracked
+            }
+
+
+def _explain_query_plan(conn, statement: str, parameters: Any) -> List[str]:
+    """SQLiteの EXPLAIN QUERY PLAN を取得（実行中のカーソルの結果を壊さないよう別のカーソルで実行）"""
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f"(取得エラー: {e})"]
+    finally:
+        cursor.close()
+
+
+class _SlowQueryObserver(QueryObserver):
+    """しきい値を超えたSQL文をパラメーター・ルート・クエリプランとともに記録する"""
+
+    def on_end(self, conn, statement, parameters, executemany, elapsed, state):
+        elapsed_ms = elapsed * 1000
+        if not slow_query_log.is_slow(elapsed_ms):
+            return
+        normalized = normalize_statement(statement)
+        plan = None
+        if (slow_query_log.explain and conn.dialect.name == "sqlite" and not executemany
+                and is_explainable(statement) and slow_query_log.needs_plan(normalized)):
+            plan = _explain_query_plan(conn, statement, parameters)
+        slow_query_log.record(
+            statement,
+            normalized,
+            elapsed_ms,
+            redact_parameters(parameters, executemany),
+            current_route(),
+            plan
+        )
+
+
+_slow_query_observer = _SlowQueryObserver()
+
+
+def log_slow_queries(engine) -> None:
+    """SQLAlchemyのエンジン（AsyncEngine の場合は sync_engine）のスロークエリを記録する"""
+    if not slow_query_log.enabled:
+        return
+    query_events.subscribe(_slow_query_observer)
+    query_events.instrument(engine)
+
+
+def create_slow_query_log() -> SlowQueryLog:
+    """環境変数の設定からスロークエリログを作成"""
+    return SlowQueryLog(
+        threshold_ms=float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100")),
+        explain=os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true",
+        max_statements=int(os.getenv("SLOW_QUERY_MAX_STATEMENTS", "200"))
+    )
+
+# アプリ全体で共有するスロークエリログ
+slow_query_log = create_slow_query_log()
@@ -0,0 +1,279 @@
+"""
+プロンプトのトークン数見積もりと予算管理
+
+- estimate_tokens: 外部ライブラリ・ネットワーク不要のトークン数概算（GPT-4系のトークナイザーの傾向に合わせた文字種ごとの重み）
+- budget_answers: 空の回答を除き、長すぎる回答を前後を残して中略し、回答全体を予算内に収める
+- token_usage: 呼び出しごとの推定トークン数と実際のトークン数（usage）の記録
+
+環境変数:
+    PROMPT_CONTEXT_WINDOW      モデルのコンテキスト長（既定: 8192）
+    PROMPT_ANSWER_MAX_TOKENS   回答1件あたりの上限（既定: 600）
+    PROMPT_ANSWERS_MAX_TOKENS  回答全体の上限（既定: 3000）
+    PROMPT_SAFETY_MARGIN       見積もり誤差のための余裕（既定: 256）
+"""
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 文字種ごとのまとまり（インポート時に一度だけコンパイル）
+_TOKEN_PIECE_PATTERN = re.compile(
+    r"(?P<kana>[\u3040-\u30ff\uff66-\uff9f])"
+    r"|(?P<kanji>[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])"
+    r"|(?P<word>[A-Za-z]+)"
+    r"|(?P<digits>[0-9]{1,3})"
+    r"|(?P<newlines>\n+)"
+    r"|(?P<spaces>[ \t　]+)"
+    r"|(?P<other>.)",
+    re.DOTALL
+)
+
+# まとまりごとのトークン数の重み
+_KANA_WEIGHT = 1.0
+_KANJI_WEIGHT = 1.3          # 常用漢字は1トークン、それ以外は2〜3トークンになることが多い
+_ASCII_CHARS_PER_TOKEN = 4.0
+_WIDE_SYMBOL_WEIGHT = 2.0    # 絵文字などBMP外・記号類
+
+# チャット形式のメッセージごとのオーバーヘッド
+_MESSAGE_OVERHEAD = 4
+_REPLY_PRIMING = 3
+
+# 中略時の区切り
+ELISION_MARKER = "\n（中略）\n"
+
+# 文の区切り（句点・感嘆符・疑問符・改行の直後）
+_SENTENCE_END_PATTERN = re.compile(r"(?<=[。．！？!?\n])")
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数の概算"""
+    if not text:
+        return 0
+    total = 0.0
+    for match in _TOKEN_PIECE_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == "kana":
+            total += _KANA_WEIGHT
+        elif kind == "kanji":
+            total += _KANJI_WEIGHT
+        elif kind == "word":
+            total += max(1.0, len(match.group()) / _ASCII_CHARS_PER_TOKEN)
+        elif kind == "digits" or kind == "newlines":
+            total += 1.0
+        elif kind == "spaces":
+            # 単独の半角スペースは次の単語と1トークンになる
+            if match.group() != " ":
+                total += 1.0
+        else:
+            total += _WIDE_SYMBOL_WEIGHT if ord(match.group()) > 0xFFFF else 1.0
+    return math.ceil(total)
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """Chat Completions のメッセージ全体（プロンプト側）のトークン数の概算"""
+    return sum(
+        estimate_tokens(message.get("content") or "") + _MESSAGE_OVERHEAD
+        for message in messages
+    ) + _REPLY_PRIMING
+
+
+def _prefix_within(text: str, max_tokens: int) -> int:
+    """先頭から max_tokens 以内に収まる最長の文字数（二分探索）"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _suffix_within(text: str, max_tokens: int) -> int:
+    """末尾から max_tokens 以内に収まる最長の文字数（二分探索）"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[len(text) - middle:]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _snap_to_sentence(text: str, length: int, from_end: bool) -> int:
+    """切り取り位置を文の区切りに寄せる（寄せると半分以上失われる場合はそのまま）"""
+    boundaries = [match.start() for match in _SENTENCE_END_PATTERN.finditer(text)]
+    if from_end:
+        start = len(text) - length
+        candidates = [b for b in boundaries if start <= b < len(text)]
+        if candidates and len(text) - candidates[0] >= length // 2:
+            return len(text) - candidates[0]
+    else:
+        candidates = [b for b in boundaries if 0 < b <= length]
+        if candidates and candidates[-1] >= length // 2:
+            return candidates[-1]
+    return length
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    max_tokens に収まるように、前半（約7割）と末尾（約3割）を残して中略する
+
+    できるだけ文の区切りで切る。収まっている場合はそのまま返す
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    available = max(0, max_tokens - estimate_tokens(ELISION_MARKER))
+    head_budget = int(available * 0.7)
+    tail_budget = available - head_budget
+
+    head_length = _snap_to_sentence(text, _prefix_within(text, head_budget), from_end=False)
+    rest = text[head_length:]
+    tail_length = _snap_to_sentence(rest, _suffix_within(rest, tail_budget), from_end=True)
+
+    head = text[:head_length].rstrip()
+    tail = rest[len(rest) - tail_length:].lstrip() if tail_length else ""
+    return head + ELISION_MARKER + tail if tail else head + ELISION_MARKER.rstrip()
+
+
+def budget_answers(
+    answers: Dict[str, str],
+    per_answer_max: int,
+    total_max: int
+) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    回答（question_id -> 回答テキスト）をプロンプト用に予算内へ収める
+
+    1. 空の回答を除く
+    2. 1件あたりの上限を超えた回答を中略する
+    3. 全体が上限を超える場合は、短い回答から順に均等割りした枠を割り当て、超えた回答を中略する
+
+    Returns:
+        (予算内の回答, 集計 {tokens_before, tokens_after, budget, dropped, trimmed})
+    """
+    sizes = {}
+    kept = {}
+    dropped = []
+    tokens_before = 0
+    for question_id, text in answers.items():
+        text = (text or "").strip()
+        if not text:
+            dropped.append(question_id)
+            continue
+        kept[question_id] = text
+        sizes[question_id] = estimate_tokens(text)
+        tokens_before += sizes[question_id]
+
+    # 1件あたりの上限
+    limits = {question_id: min(size, per_answer_max) for question_id, size in sizes.items()}
+
+    # 全体の上限（短い回答はそのまま、残りを長い回答で均等に分ける）
+    if sum(limits.values()) > total_max:
+        remaining = max(0, total_max)
+        ordered = sorted(limits, key=limits.get)
+        for index, question_id in enumerate(ordered):
+            share = remaining // (len(ordered) - index)
+            limits[question_id] = min(limits[question_id], share)
+            remaining -= limits[question_id]
+
+    trimmed = []
+    budgeted = {}
+    tokens_after = 0
+    for question_id, text in kept.items():
+        if sizes[question_id] > limits[question_id]:
+            text = trim_to_tokens(text, limits[question_id])
+            trimmed.append(question_id)
+        budgeted[question_id] = text
+        tokens_after += estimate_tokens(text)
+
+    return budgeted, {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "budget": total_max,
+        "dropped": dropped,
+        "trimmed": trimmed
+    }
+
+
+def answers_token_budget(template_tokens: int, max_completion_tokens: int) -> int:
+    """コンテキスト長から、テンプレート・生成分・余裕を引いた回答全体の予算"""
+    available = (
+        int(os.getenv("PROMPT_CONTEXT_WINDOW", "8192"))
+        - max_completion_tokens
+        - template_tokens
+        - int(os.getenv("PROMPT_SAFETY_MARGIN", "256"))
+    )
+    return max(0, min(int(os.getenv("PROMPT_ANSWERS_MAX_TOKENS", "3000")), available))
+
+
+def answer_token_limit() -> int:
+    """回答1件あたりのトークン上限"""
+    return int(os.getenv("PROMPT_ANSWER_MAX_TOKENS", "600"))
+
+
+# 記録する直近の件数
+USAGE_SAMPLE_SIZE = 200
+
+
+class TokenUsageRecorder:
+    """呼び出しごとの推定トークン数と実際のトークン数を記録する"""
+
+    def __init__(self, sample_size: int = USAGE_SAMPLE_SIZE):
+        self._recent: deque = deque(maxlen=sample_size)
+        # このプロセスでの累計
+        self.requests = 0
+        self.estimated_prompt_tokens = 0
+        self.actual_prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, label: str, estimated_prompt_tokens: int, usage: Optional[Any]) -> None:
+        """usage（openaiの CompletionUsage）と推定値を記録する。usage がなければ推定値のみ"""
+        actual_prompt = getattr(usage, "prompt_tokens", None) if usage is not None else None
+        completion = getattr(usage, "completion_tokens", None) if usage is not None else None
+        entry = {
+            "label": label,
+            "at": time.time(),
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "actual_prompt_tokens": actual_prompt,
+            "completion_tokens": completion
+        }
+        self._recent.append(entry)
+        self.requests += 1
+        self.estimated_prompt_tokens += estimated_prompt_tokens
+        if actual_prompt is not None:
+            self.actual_prompt_tokens += actual_prompt
+            error = (estimated_prompt_tokens - actual_prompt) / actual_prompt * 100 if actual_prompt else 0.0
+            logger.debug(f"トークン数 [{label}]", extra={
+                "estimated_prompt_tokens": estimated_prompt_tokens,
+                "actual_prompt_tokens": actual_prompt,
+                "estimate_error_percent": round(error, 1),
+                "completion_tokens": completion
+            })
+        if completion is not None:
+            self.completion_tokens += completion
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        measured = [e for e in self._recent if e["actual_prompt_tokens"]]
+        errors = [
+            abs(e["estimated_prompt_tokens"] - e["actual_prompt_tokens"]) / e["actual_prompt_tokens"]
+            for e in measured
+        ]
+        return {
+            "requests": self.requests,
+            "estimated_prompt_tokens": self.estimated_prompt_tokens,
+            "actual_prompt_tokens": self.actual_prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "estimate_error_pct_avg": round(sum(errors) / len(errors) * 100, 1) if errors else None,
+            "recent": list(self._recent)[-10:]
+        }
+
+# アプリ全体で共有する記録
+token_usage = TokenUsageRecorder()
@@ -0,0 +1,534 @@
+"""
+リクエスト単位のトレース（スパン）
+
+月報生成などの遅いリクエストで、時間がDBクエリ・OpenAI呼び出し・数値抽出・
+フォールバック月報の描画・レスポンスのシリアライズのどこにかかったかを記録する。
+外部ライブラリは使わず、スパンは contextvars で親子関係をたどる。
+
+- TracingMiddleware: リクエストIDを決めて（X-Request-ID ヘッダーがあればそれを使う）
+  ルートのスパンを開始し、レスポンスにも X-Request-ID を付ける
+- tracer.span(): 処理の区間をスパンとして記録する（async / 同期のどちらの処理でも使える）
+- trace_engine(): SQLAlchemyのクエリごとにスパンを記録する（スパンの中で実行されたクエリのみ）
+- TracedRoute: エンドポイントが戻ってからレスポンスができるまで（response_model での検証と
+  JSONへの変換）を response.serialize スパンとして記録する（APIRouter(route_class=TracedRoute)）
+
+スパンはバックグラウンドのスレッドでまとめて書き出すため、リクエストの処理は書き出しを待たない。
+キューがあふれた場合は古いスパンを待たずに捨てる（dropped に数える）。
+
+環境変数:
+    TRACING_EXPORTER        スパンの出力先。none / jsonl / otlp（既定: none = 記録しない）
+    TRACING_JSONL_PATH      jsonl の出力ファイル（既定: traces/spans.jsonl）
+    TRACING_OTLP_ENDPOINT   otlp の送信先（OTLP/HTTP JSON。既定: http://localhost:4318/v1/traces）
+    TRACING_SERVICE_NAME    スパンに付けるサービス名（既定: monthly-report-backend）
+    TRACING_QUEUE_SIZE      書き出し待ちのスパン数の上限（既定: 10000）
+    TRACING_BATCH_SIZE      一度に書き出すスパン数（既定: 200）
+    TRACING_FLUSH_SECONDS   書き出しの間隔（既定: 1.0）
+
+使い方:
+    with tracer.span("report.fallback_render", template="fallback_report.md.j2"):
+        ...
+"""
+import asyncio
+import functools
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from fastapi.routing import APIRoute
+
+from utils.metrics import route_template
+from utils.logger import get_logger
+from utils.query_events import QueryObserver, query_events
+
+logger = get_logger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_HEADER_KEY = REQUEST_ID_HEADER.lower().encode()
+
+# 外部から受け取るリクエストIDの形式（ログやファイルに書くため制限する）
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# DBスパンに記録するSQLの最大長
+_STATEMENT_MAX_LENGTH = 300
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_request_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_scope", default=None)
+# TracedRoute の処理中に、エンドポイントが戻った時点で開始した response.serialize スパンを入れる
+_serialize_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar("serialize_span", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    """処理中のリクエストのID（リクエストの外では None）"""
+    return _request_id.get()
+
+
+def current_route() -> Optional[str]:
+    """処理中のリクエストのメソッドとルートのテンプレート（例: "GET /api/reports/{report_id}"。リクエストの外では None）"""
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    return f"{scope['method']} {route_template(scope)}"
+
+
+def set_request_id(request_id: Optional[str]):
+    """リクエストIDを設定する（ジョブなどリクエストの外で処理を続ける場合）。戻り値は reset_request_id に渡す"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token) -> None:
+    _request_id.reset(token)
+
+
+def request_id_headers() -> Dict[str, str]:
+    """外部APIの呼び出しに付けるヘッダー（呼び出し先のログと突き合わせられるようにする）"""
+    request_id = _request_id.get()
+    return {REQUEST_ID_HEADER: request_id} if request_id else {}
+
+
+def resolve_request_id(header_value: Optional[str]) -> str:
+    """受け取ったリクエストIDが妥当ならそれを、なければ新しいIDを返す"""
+    if header_value and _REQUEST_ID_PATTERN.match(header_value):
+        return header_value
+    return uuid.uuid4().hex
+
+
+class Span:
+    """処理の1区間"""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "request_id",
+        "start_time_ns", "end_time_ns", "_started", "duration_ms", "attributes", "status", "error"
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.request_id = _request_id.get()
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.attributes = attributes
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        elapsed = time.perf_counter() - self._started
+        self.duration_ms = round(elapsed * 1000, 3)
+        self.end_time_ns = self.start_time_ns + int(elapsed * 1_000_000_000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "request_id": self.request_id,
+            "start_time_ns": self.start_time_ns,
+            "end_time_ns": self.end_time_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """トレース無効時のスパン（属性の設定などは何もしない）"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    """
+    スパンをキューに積み、バックグラウンドのスレッドでまとめて書き出す
+
+    サブクラスは write_batch() を実装する
+    """
+
+    kind = ""
+
+    def __init__(self, queue_size: int, batch_size: int, flush_seconds: float):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def export(self, span: Span) -> None:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"span-exporter-{self.kind}", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.flush_seconds
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                batch.append(span)
+            if batch:
+                try:
+                    self.write_batch(batch)
+                    self.exported += len(batch)
+                except Exception as e:
+                    self.failed_batches += 1
+                    self.dropped += len(batch)
+                    logger.warning(f"スパンの書き出しエラー ({self.kind}): {e}")
+            if stop:
+                return
+
+    def write_batch(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """キューに残ったスパンを書き出してスレッドを止める"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exporter": self.kind,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+            "queued": self._queue.qsize()
+        }
+
+
+class JsonlSpanExporter(SpanExporter):
+    """スパンを1行1件のJSONとしてファイルに追記する"""
+
+    kind = "jsonl"
+
+    def __init__(self, path: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def write_batch(self, spans: List[Span]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class OtlpSpanExporter(SpanExporter):
+    """スパンをOTLP/HTTP（JSON）形式でコレクターに送る"""
+
+    kind = "otlp"
+
+    def __init__(self, endpoint: str, service_name: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client = None
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "monthly-report.tracing"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": 2 if span.parent_id is None else 1,
+                            "startTimeUnixNano": str(span.start_time_ns),
+                            "endTimeUnixNano": str(span.end_time_ns),
+                            "attributes": _otlp_attributes({**span.attributes, "request.id": span.request_id}),
+                            "status": {"code": 2, "message": span.error} if span.status == "error" else {"code": 1}
+                        }
+                        for span in spans
+                    ]
+                }]
+            }]
+        }
+
+    def write_batch(self, spans: List[Span]) -> None:
+        # 送信は書き出し用のスレッド内で行うため同期クライアントを使う
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.Client(timeout=5.0)
+        response = self._client.post(self.endpoint, json=self.payload(spans))
+        response.raise_for_status()
+
+
+class Tracer:
+    """スパンを作成して書き出し先に渡す（書き出し先がなければ何も記録しない）"""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """処理の区間を子スパンとして記録する（例外はスパンに記録して送出し直す）"""
+        if self.exporter is None:
+            yield _NOOP_SPAN
+            return
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            self.exporter.export(span)
+
+    def start_span(self, name: str, **attributes: Any) -> Optional[Span]:
+        """
+        コンテキストを切り替えずにスパンを開始する（イベントフックなど開始と終了が別の関数の場合）
+
+        子スパンを持たない区間にのみ使い、終了時は end_span() に渡す
+        """
+        if self.exporter is None:
+            return None
+        return Span(name, _current_span.get(), attributes)
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None) -> None:
+        if span is None or self.exporter is None:
+            return
+        if error is not None:
+            span.record_error(error)
+        span.end()
+        self.exporter.export(span)
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        """メトリクス用の統計情報"""
+        if self.exporter is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.exporter.stats()}
+
+
+def create_tracer() -> Tracer:
+    """環境変数の設定からトレーサーを作成"""
+    exporter_kind = os.getenv("TRACING_EXPORTER", "none").lower()
+    options = {
+        "queue_size": int(os.getenv("TRACING_QUEUE_SIZE", "10000")),
+        "batch_size": int(os.getenv("TRACING_BATCH_SIZE", "200")),
+        "flush_seconds": float(os.getenv("TRACING_FLUSH_SECONDS", "1.0"))
+    }
+    if exporter_kind == "jsonl":
+        return Tracer(JsonlSpanExporter(os.getenv("TRACING_JSONL_PATH", "traces/spans.jsonl"), **options))
+    if exporter_kind == "otlp":
+        return Tracer(OtlpSpanExporter(
+            os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+            os.getenv("TRACING_SERVICE_NAME", "monthly-report-backend"),
+            **options
+        ))
+    if exporter_kind != "none":
+        logger.warning(f"TRACING_EXPORTER の値が不正です: {exporter_kind}（トレースを無効にします）")
+    return Tracer()
+
+# アプリ全体で共有するトレーサー
+tracer = create_tracer()
+
+
+class TracingMiddleware:
+    """
+    リクエストIDを決めてルートのスパンを記録するASGIミドルウェア
+
+    トレースが無効でもリクエストIDは設定し、レスポンスヘッダーで返す
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header_value = None
+        for name, value in scope.get("headers", ()):
+            if name == _REQUEST_ID_HEADER_KEY:
+                header_value = value.decode("latin-1")
+                break
+        request_id = resolve_request_id(header_value)
+        request_id_token = _request_id.set(request_id)
+        scope_token = _request_scope.set(scope)
+        # ミドルウェアの外側で動く例外ハンドラーからも参照できるよう request.state にも残す
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + [(_REQUEST_ID_HEADER_KEY, request_id.encode())]
+                span.set_attribute("http.status_code", message["status"])
+            await send(message)
+
+        try:
+            with tracer.span("http.request", **{"http.method": scope["method"], "http.target": scope["path"]}) as span:
+                await self.app(scope, receive, send_wrapper)
+                # ルートの照合は処理後の scope で行う（metrics と同じテンプレート名）
+                span.set_attribute("http.route", route_template(scope))
+        finally:
+            _request_id.reset(request_id_token)
+            _request_scope.reset(scope_token)
+
+
+class _DBSpanObserver(QueryObserver):
+    """クエリごとに db.query スパンを記録する"""
+
+    def on_start(self, conn, statement, parameters, executemany):
+        # リクエストやジョブの外のクエリ（ジョブキューのポーリングなど）は記録しない
+        if not tracer.enabled or _current_span.get() is None:
+            return None
+        return tracer.start_span(
+            "db.query",
+            **{"db.statement": statement[:_STATEMENT_MAX_LENGTH], "db.executemany": executemany}
+        )
+
+    def on_end(self, conn, statement, parameters, executemany, elapsed, state):
+        tracer.end_span(state)
+
+    def on_error(self, conn, statement, elapsed, state, error):
+        tracer.end_span(state, error=error)
+
+
+_db_span_observer = _DBSpanObserver()
+
+
+def trace_engine(engine) -> None:
+    """SQLAlchemyのエンジン（AsyncEngine の場合は sync_engine）のクエリごとにスパンを記録する"""
+    query_events.subscribe(_db_span_observer)
+    query_events.instrument(engine)
+
+
+def _start_serialize_span() -> None:
+    holder = _serialize_span.get()
+    if holder is not None:
+        holder["span"] = tracer.start_span("response.serialize")
+
+
+def _mark_endpoint_return(endpoint: Callable) -> Callable:
+    """エンドポイントが戻った時点で response.serialize スパンを開始するラッパー（シグネチャはそのまま）"""
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            _start_serialize_span()
+            return result
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        # 同期のエンドポイントはスレッドプールで動くが、holder は同じ辞書を参照している
+        result = endpoint(*args, **kwargs)
+        _start_serialize_span()
+        return result
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """
+    エンドポイントの戻り値を response_model で検証してJSONに変換する時間をスパンとして記録するルート
+
+    変換は FastAPI に任せたまま（response_model による検証・フィールドの絞り込みを迂回しない）、
+    エンドポイントが戻った時点からルートのハンドラーがレスポンスを返すまでを計測する。
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        super().__init__(path, _mark_endpoint_return(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            if not tracer.enabled:
+                return await handler(request)
+            holder: Dict[str, Any] = {}
+            token = _serialize_span.set(holder)
+            try:
+                response = await handler(request)
+            except BaseException as e:
+                tracer.end_span(holder.get("span"), error=e)
+                raise
+            finally:
+                _serialize_span.reset(token)
+            span = holder.get("span")
+            if span is not None:
+                body = getattr(response, "body", None)
+                if body is not None:
+                    span.set_attribute("http.response_bytes", len(body))
+                tracer.end_span(span)
+            return response
+
+        return traced_handler